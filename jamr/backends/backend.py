@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import os
+import re
+
+from abc import abstractmethod
+from contextlib import contextmanager
+
+# Storage profiles of computed maps: 'double' stores them as 64-bit floats
+# (DCELL), 'float' as 32-bit floats (FCELL) and 'compact' also stores
+# fractions as scaled 16-bit integers, where the backend supports it
+STORAGE_PROFILES = ['double', 'float', 'compact']
+
+# Backend used by this process. Like the GRASS region, it is process-wide
+# state, set once from the configuration at startup
+_BACKEND = None
+
+
+def get_backend():
+    """The processing backend of this process, by default GRASS."""
+    global _BACKEND
+    if _BACKEND is None:
+        from jamr.backends.grass_backend import GrassBackend
+        _BACKEND = GrassBackend()
+    return _BACKEND
+
+
+def set_backend(backend):
+    global _BACKEND
+    _BACKEND = backend
+    return backend
+
+
+class BackendFactory:
+    @staticmethod
+    def create_backend(config):
+        backend = BackendFactory._create_backend(config)
+        storage = config.get('storage', {})
+        backend.set_storage(storage.get('profile', 'double'), compressor=storage.get('compressor', None))
+        return backend
+
+    @staticmethod
+    def _create_backend(config):
+        # Backends are imported on demand, so that the native backend can be
+        # used without a GRASS installation
+        name = config['main'].get('backend', 'grass')
+        if name == 'grass':
+            from jamr.backends.grass_backend import GrassBackend
+            return GrassBackend()
+        elif name == 'native':
+            from jamr.backends.native_backend import NativeBackend
+            directory = config.get('native', {}).get(
+                'directory', os.path.join(config['main']['scratch_directory'], 'jamr_native')
+            )
+            return NativeBackend(directory)
+        elif name == 'dask':
+            from jamr.backends.dask_backend import (DEFAULT_CHUNK_SIZE, DaskBackend, configure_scheduler)
+            dask_config = config.get('dask', {})
+            directory = dask_config.get(
+                'directory', os.path.join(config['main']['scratch_directory'], 'jamr_dask')
+            )
+            scheduler = dask_config.get('scheduler', 'threads')
+            # Forked processes writing output files (nprocs > 1) would 
+            # inherit the connection to the cluster, which they cannot use
+            if scheduler == 'distributed' and int(config['main'].get('nprocs', 1)) > 1:
+                raise ValueError(
+                    "The 'distributed' Dask scheduler needs nprocs = 1: output files are then written "
+                    "one at a time, with their chunks computed in parallel by the cluster"
+                )
+            client = configure_scheduler(
+                scheduler=scheduler,
+                num_workers=dask_config.get('num_workers', None),
+                address=dask_config.get('address', None),
+                memory_limit=dask_config.get('memory_limit', None)
+            )
+            return DaskBackend(
+                directory, chunk_size=int(dask_config.get('chunk_size', DEFAULT_CHUNK_SIZE)), client=client
+            )
+        else:
+            raise ValueError(f'Unknown processing backend: {name}')
+
+
+def expression_names(expression):
+    """Names of the maps in an expression, written as `{name}`."""
+    return re.findall(r'\{(\w+)\}', expression)
+
+
+class Backend:
+    """Operations on raster maps used by the ancillary data sets.
+
+    Maps are referred to by name. Operations run in the current region,
+    which is set with `set_region` or `set_region_from_raster`, and read
+    maps through the current mask, if any, as GRASS does.
+
+    Map algebra expressions (see `calc`) are written in Python syntax, with
+    maps given as `{name}` and the functions `where`, `isnull` and `exp`.
+    Null cells of any input give null, unless the expression uses `isnull`.
+
+    Computed maps are stored according to the storage profile (see
+    `STORAGE_PROFILES`). Maps marked as fractions, with values in [0, 1],
+    may be stored quantized.
+    """
+    name = None
+    storage_profile = 'double'
+    compressor = None
+
+    def initial(self):
+        pass
+
+    def close(self):
+        """Release resources held by the backend (e.g. a Dask cluster)."""
+        pass
+
+    def set_storage(self, profile='double', compressor=None):
+        """Set the storage profile of computed maps, and optionally the 
+        compression method."""
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f'Unknown storage profile: {profile}')
+        self.storage_profile = profile
+        self.compressor = compressor
+
+    @abstractmethod
+    def set_region(self, **kwargs):
+        """Set the current region from `n`, `s`, `e`, `w`, `nsres`, `ewres`
+        or `res`, or from a `raster`, optionally aligned to the grid of the
+        raster given as `align`."""
+        pass
+
+    @abstractmethod
+    def set_region_from_raster(self, raster, n=None, s=None, e=None, w=None):
+        """Set the current region to the resolution and grid of `raster`,
+        with the bounds of the raster or the given bounds."""
+        pass
+
+    @abstractmethod
+    def region_definition(self):
+        """Dict with the `n`, `s`, `e`, `w`, `nsres` and `ewres` of the
+        current region."""
+        pass
+
+    def region_env(self):
+        """The current region, in a form that pins the region of write jobs
+        (see WriteJob), or None."""
+        return None
+
+    @contextmanager
+    def pinned_region(self, region):
+        """Context in which the region is `region`, as returned by
+        `region_env`, without changing the region outside it."""
+        yield
+
+    @abstractmethod
+    def tempfile(self):
+        pass
+
+    @abstractmethod
+    def map_exists(self, mapname, mapset=None):
+        pass
+
+    @abstractmethod
+    def import_raster(self, filename, mapname, overwrite=False, flags=None, fix_bounds=False):
+        pass
+
+    @abstractmethod
+    def aggregate_file(self, input_filename, output_filename, res, method='average'):
+        """Aggregate a raster file to resolution `res`, writing a GeoTIFF."""
+        pass
+
+    @abstractmethod
+    def calc(self, output, expression, overwrite=False, fraction=False, **maps):
+        """Evaluate a map algebra expression, e.g.
+        `calc('c', '{a} * (1 - {b})', a='map_a', b='map_b')`. Set `fraction` 
+        if the output is a fraction."""
+        pass
+
+    @abstractmethod
+    def resample(self, input_map, output_map, method, overwrite=False, weighted=True):
+        """Aggregate a map to the current region with `method` ('average',
+        'sum', 'minimum' or 'maximum')."""
+        pass
+
+    @abstractmethod
+    def reclass(self, input_map, output_map, table, overwrite=False, fraction=False):
+        """Map the categories of an integer map to values, given as a dict.
+        Categories not in `table` are mapped to zero. Set `fraction` if the 
+        values are fractions."""
+        pass
+
+    @abstractmethod
+    def fill_nulls(self, mapname, value):
+        """Replace null cells of a map with `value`."""
+        pass
+
+    @abstractmethod
+    def set_nulls(self, mapname, value):
+        """Make cells of a map equal to `value` null."""
+        pass
+
+    @abstractmethod
+    def grow(self, input_map, output_map, overwrite=False):
+        """Fill null cells with the value of the nearest non-null cell."""
+        pass
+
+    @abstractmethod
+    def set_mask(self, mapname, maskcats=1):
+        pass
+
+    @abstractmethod
+    def remove_mask(self):
+        pass
+
+    @abstractmethod
+    def remove_maps(self, pattern):
+        pass
+
+    @abstractmethod
+    def block_reader(self, mapnames):
+        """Reader of row blocks of maps in the current region, with the
+        interface of RasterBlockReader."""
+        pass
+
+    @abstractmethod
+    def block_writer(self, mapnames, overwrite=False, fraction=False):
+        """Writer of row blocks of new maps in the current region, with the
+        interface of RasterBlockWriter."""
+        pass
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+import os
+import fnmatch
+import logging
+
+import numpy as np
+import rasterio
+import dask
+import dask.array as da
+
+from dask.base import tokenize
+from rasterio.enums import Resampling
+
+from jamr.backends.backend import expression_names
+from jamr.backends.native_backend import (EPS, GROW_HALO_ROWS, RESAMPLING_METHODS, NativeBackend,
+                                          NativeRasterBlockWriter, _base_mapname, _block_reduce,
+                                          coarse_seeds, evaluate_expression, fill_from_seeds,
+                                          fill_nearest, grow_seed_factor, nested_region, read_region,
+                                          subregion)
+from jamr.utils.blocks import (block_rows, iter_row_blocks, region_shape)
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of rows and columns in each chunk of a map
+DEFAULT_CHUNK_SIZE = 1024
+
+# Prefix of the files of lazy maps written to disk
+LAZY_FILE_PREFIX = 'lazy_'
+
+
+def _read_layer_prefix(filename):
+    # Prefix of the names of the graph layers reading a file
+    return f'read-{os.path.basename(filename)}-'
+
+
+def same_grid(rgn_def, other_rgn_def):
+    """Whether two regions have the same extent and resolution."""
+    return all(
+        abs(rgn_def[key] - other_rgn_def[key]) < EPS * rgn_def[res]
+        for key, res in [('n', 'nsres'), ('s', 'nsres'), ('e', 'ewres'), ('w', 'ewres'),
+                         ('nsres', 'nsres'), ('ewres', 'ewres')]
+    )
+
+
+def _chunk_region(rgn_def, chunks, block_id):
+    row0 = sum(chunks[0][:block_id[0]])
+    col0 = sum(chunks[1][:block_id[1]])
+    return subregion(rgn_def, row0, row0 + chunks[0][block_id[0]], col0, col0 + chunks[1][block_id[1]])
+
+
+def _read_chunk(filename, rgn_def, map_chunks, resampling, block_id=None):
+    with rasterio.open(filename) as src:
+        return read_region(src, _chunk_region(rgn_def, map_chunks, block_id), resampling)
+
+
+def _evaluate_chunk(*blocks, expression, names):
+    return evaluate_expression(expression, names, np.stack(blocks))
+
+
+def _reduce_chunk(block, fy, fx, method):
+    return _block_reduce(block, fy, fx, method)
+
+
+def _reclass_chunk(block, table):
+    result = np.zeros_like(block)
+    for key, value in table.items():
+        result[block == key] = value
+    result[np.isnan(block)] = np.nan
+    return result
+
+
+def _mask_chunk(block, mask, cats):
+    return np.where(np.isin(mask, cats), block, np.nan)
+
+
+def _fill_nulls_chunk(block, value):
+    return np.where(np.isnan(block), value, block)
+
+
+def _set_nulls_chunk(block, value):
+    return np.where(block == value, np.nan, block)
+
+
+def _fill_from_seeds_chunk(block, seeds, factor, block_info=None):
+    (row0, _), (col0, _) = block_info[0]['array-location']
+    return fill_from_seeds(block, seeds, factor, row0=row0, col0=col0)
+
+
+def _use_synchronous_scheduler():
+    dask.config.set({'scheduler': 'synchronous'})
+
+
+# Output files are written by forked worker processes, which cannot use the
+# thread pool of the parent process: each computes its own chunks in turn
+# instead
+os.register_at_fork(after_in_child=_use_synchronous_scheduler)
+
+
+def configure_scheduler(scheduler='threads', num_workers=None, address=None, memory_limit=None):
+    """Set the scheduler computing the maps of a DaskBackend.
+
+    The local schedulers ('threads', 'processes' or 'synchronous') hold
+    about `num_workers` chunks of each map in memory at once, so memory use
+    is set by the chunk size. The 'distributed' scheduler connects to the
+    cluster at `address`, or starts a local cluster whose workers are each
+    limited to `memory_limit` (e.g. '4GB'). Returns the distributed Client,
+    which closes a local cluster when it is closed, or None.
+    """
+    if scheduler == 'distributed':
+        from distributed import Client
+        if address is not None:
+            return Client(address)
+        return Client(n_workers=num_workers, memory_limit=memory_limit or 'auto')
+
+    dask.config.set({'scheduler': scheduler, 'num_workers': num_workers})
+    return None
+
+
+class DaskRasterBlockReader:
+    """Read row blocks from one or more maps of a DaskBackend.
+
+    Lazy maps are computed a band of chunks at a time, as their blocks are
+    read. Blocks are returned as arrays with shape (nmaps, nrows, ncols).
+    """
+    def __init__(self, backend, mapnames):
+        self.backend = backend
+        self.mapnames = list(mapnames)
+        self.rgn_def = backend.region_definition()
+        self.arrays = None
+        self.band = None
+
+    def __enter__(self):
+        arrays = [self.backend.lazy_map(mapname, self.rgn_def) for mapname in self.mapnames]
+        nrows, ncols = self.shape
+        self.arrays = da.stack(arrays) if len(arrays) > 0 else da.zeros((0, nrows, ncols), chunks=(1, nrows, ncols))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.arrays = None
+        self.band = None
+
+    @property
+    def shape(self):
+        return region_shape(self.rgn_def)
+
+    def read(self, start, stop):
+        if self.band is None or start < self.band[0] or stop > self.band[1]:
+            bounds = np.cumsum((0,) + self.arrays.chunks[1])
+            band_start, band_stop = int(bounds[bounds <= start].max()), int(bounds[bounds >= stop].min())
+            data = np.asarray(self.arrays[:, band_start:band_stop, :].compute(), dtype=np.float64)
+            self.band = (band_start, band_stop, data)
+        band_start, _, data = self.band
+        return data[:, (start - band_start):(stop - band_start), :]
+
+
+class DaskBackend(NativeBackend):
+    """Backend building maps as lazy, chunked Dask arrays.
+
+    Files imported with `import_raster` are opened as lazy arrays, and map
+    algebra, resampling, reclassification and null handling build a graph
+    of array operations rather than writing maps. The graph is computed
+    chunk by chunk, in parallel, as the maps are read (e.g. when output
+    files are written). Maps written with `block_writer` are GeoTIFFs, as
+    with the native backend, and lazy maps read in a region other than the
+    one they were defined in are written out first.
+
+    Parameters
+    ----------
+    directory : str
+        The directory holding maps written to disk.
+    chunk_size : int
+        Number of rows and columns in each chunk.
+    client : distributed.Client, optional
+        Client of the cluster computing the maps, closed with the backend.
+    """
+    name = 'dask'
+
+    def __init__(self, directory, chunk_size=DEFAULT_CHUNK_SIZE, client=None):
+        super().__init__(directory)
+        self.chunk_size = chunk_size
+        self.client = client
+        self.arrays = {}
+        self.fractions = set()
+        # Files of lazy maps which have been removed, but which are still 
+        # read by other lazy maps
+        self.orphaned_files = set()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def _chunks(self, rgn_def):
+        nrows, ncols = region_shape(rgn_def)
+        return da.core.normalize_chunks((self.chunk_size, self.chunk_size), (nrows, ncols))
+
+    def _open(self, filename, rgn_def, resampling=Resampling.nearest):
+        chunks = self._chunks(rgn_def)
+        name = _read_layer_prefix(filename) + tokenize(filename, rgn_def, chunks, resampling)
+        return da.map_blocks(
+            _read_chunk, filename=filename, rgn_def=rgn_def, map_chunks=chunks, chunks=chunks,
+            resampling=resampling, dtype=np.float64, meta=np.array((), dtype=np.float64), name=name
+        )
+
+    def _raster_region(self, raster):
+        name = _base_mapname(raster)
+        if name in self.arrays:
+            return dict(self.arrays[name][1])
+        return super()._raster_region(raster)
+
+    def _materialise(self, mapname):
+        """Compute a lazy map and write it to disk.
+
+        The file is named after the array rather than the map, so that lazy
+        maps computed from it can still be read once the map is removed. It 
+        is deleted once the map is removed and no lazy map reads it.
+        """
+        name = _base_mapname(mapname)
+        arr, rgn_def = self.arrays[name]
+        LOGGER.info(f'Writing {name} to disk')
+        filename_map = f'{LAZY_FILE_PREFIX}{arr.name}'
+        with self.pinned_region(rgn_def):
+            writer = NativeRasterBlockWriter(self, [filename_map], overwrite=True, fraction=name in self.fractions)
+        with writer:
+            for start, stop in iter_row_blocks(arr.shape[0], arr.chunks[0][0]):
+                writer.write(arr[start:stop].compute()[None])
+        self.arrays.pop(name)
+        replaced = self._lazy_files([name])
+        self.register(name, self.map_filename(filename_map))
+        self._remove_lazy_files(replaced)
+
+    def _lazy_files(self, mapnames):
+        """Files of lazy maps written to disk registered under `mapnames`."""
+        registry = self._registry()
+        filenames = [registry.get(_base_mapname(mapname)) for mapname in mapnames]
+        return [
+            filename for filename in filenames 
+            if filename is not None and os.path.basename(filename).startswith(LAZY_FILE_PREFIX)
+        ]
+
+    def _file_in_use(self, filename):
+        if filename in self._registry().values():
+            return True
+        prefix = _read_layer_prefix(filename)
+        return any(
+            layer.startswith(prefix) 
+            for arr, _ in self.arrays.values() for layer in arr.__dask_graph__().layers
+        )
+
+    def _remove_lazy_files(self, filenames):
+        """Delete files of lazy maps which are no longer registered, once no
+        lazy map reads them."""
+        self.orphaned_files.update(filenames)
+        for filename in list(self.orphaned_files):
+            if not self._file_in_use(filename):
+                if os.path.exists(filename):
+                    os.remove(filename)
+                self.orphaned_files.discard(filename)
+
+    def lazy_map(self, mapname, rgn_def, masked=True):
+        """A map in a region as a lazy array, read through the mask."""
+        name = _base_mapname(mapname)
+        if name in self.arrays and not same_grid(self.arrays[name][1], rgn_def):
+            self._materialise(name)
+        if name in self.arrays:
+            arr = self.arrays[name][0]
+        else:
+            arr = self._open(self.map_path(name), rgn_def)
+        if masked and self.mask is not None:
+            mask = self.lazy_map(self.mask[0], rgn_def, masked=False)
+            arr = da.map_blocks(_mask_chunk, arr, mask, cats=self.mask[1], dtype=np.float64)
+        return arr
+
+    def _store(self, mapname, arr, rgn_def, fraction=False):
+        # Chunks of lazy maps are held as 32-bit floats unless the storage
+        # profile is 'double'
+        if self.storage_profile != 'double':
+            arr = arr.astype(np.float32)
+        name = _base_mapname(mapname)
+        self.arrays[name] = (arr, dict(rgn_def))
+        if fraction:
+            self.fractions.add(name)
+        else:
+            self.fractions.discard(name)
+        return 0
+
+    def import_raster(self, filename, mapname, overwrite=False, flags=None, fix_bounds=False):
+        if not overwrite:
+            return super().import_raster(filename, mapname, flags=flags, fix_bounds=fix_bounds)
+        self.arrays.pop(_base_mapname(mapname), None)
+        replaced = self._lazy_files([mapname])
+        super().import_raster(filename, mapname, overwrite=overwrite, flags=flags, fix_bounds=fix_bounds)
+        self._remove_lazy_files(replaced)
+        return 0
+
+    def unregister(self, mapname):
+        self.arrays.pop(_base_mapname(mapname), None)
+        removed = self._lazy_files([mapname])
+        super().unregister(mapname)
+        self._remove_lazy_files(removed)
+
+    def map_exists(self, mapname, mapset=None):
+        return _base_mapname(mapname) in self.arrays or super().map_exists(mapname)
+
+    # Map algebra
+
+    def calc(self, output, expression, overwrite=False, fraction=False, **maps):
+        if self._skip(output, overwrite):
+            return 0
+        rgn_def = self.region_definition()
+        names = list(dict.fromkeys(expression_names(expression)))
+        arrays = [self.lazy_map(maps[name], rgn_def) for name in names]
+        if len(arrays) == 0:
+            arrays = [da.zeros(region_shape(rgn_def), chunks=self._chunks(rgn_def))]
+        arr = da.map_blocks(_evaluate_chunk, *arrays, expression=expression, names=names, dtype=np.float64)
+        return self._store(output, arr, rgn_def, fraction=fraction)
+
+    def resample(self, input_map, output_map, method, overwrite=False, weighted=True):
+        if self._skip(output_map, overwrite):
+            return 0
+        target_rgn = self.region_definition()
+        native_rgn, factor = nested_region(self._raster_region(input_map), target_rgn)
+        if factor is not None:
+            # Input cells nest within target cells: aggregate chunks of
+            # native cells, read through the mask
+            fy, fx = factor
+            chunks = self._chunks(target_rgn)
+            arr = self.lazy_map(input_map, native_rgn).rechunk(
+                (tuple(c * fy for c in chunks[0]), tuple(c * fx for c in chunks[1]))
+            )
+            arr = da.map_blocks(_reduce_chunk, arr, fy=fy, fx=fx, method=method, chunks=chunks, dtype=np.float64)
+        else:
+            LOGGER.warning(f'{input_map} is not aligned with the region; resampling without the mask')
+            if _base_mapname(input_map) in self.arrays:
+                self._materialise(input_map)
+            arr = self._open(self.map_path(input_map), target_rgn, RESAMPLING_METHODS[method])
+        return self._store(output_map, arr, target_rgn)
+
+    def reclass(self, input_map, output_map, table, overwrite=False, fraction=False):
+        if self._skip(output_map, overwrite):
+            return 0
+        rgn_def = self.region_definition()
+        arr = da.map_blocks(_reclass_chunk, self.lazy_map(input_map, rgn_def), table=table, dtype=np.float64)
+        return self._store(output_map, arr, rgn_def, fraction=fraction)
+
+    # Nulls and masks
+
+    def _update(self, mapname, function, **kwargs):
+        # Maps are updated over their own grid, like the native backend
+        rgn_def = self._raster_region(mapname)
+        arr = self.lazy_map(mapname, rgn_def, masked=False)
+        arr = da.map_blocks(function, arr, dtype=np.float64, **kwargs)
+        return self._store(mapname, arr, rgn_def, fraction=_base_mapname(mapname) in self.fractions)
+
+    def fill_nulls(self, mapname, value):
+        return self._update(mapname, _fill_nulls_chunk, value=value)
+
+    def set_nulls(self, mapname, value):
+        return self._update(mapname, _set_nulls_chunk, value=value)
+
+    def grow(self, input_map, output_map, overwrite=False):
+        if self._skip(output_map, overwrite):
+            return 0
+        rgn_def = self.region_definition()
+        arr = self.lazy_map(input_map, rgn_def)
+        nrows, ncols = arr.shape
+        # The seed grid of cells further than GROW_HALO_ROWS rows from data
+        # (see NativeBackend.grow) is computed now, in bands of whole seed
+        # cells, and held in the graph
+        factor = grow_seed_factor(nrows, ncols)
+        nrows_per_band = max(factor, block_rows(ncols, factor=3) // factor * factor)
+        seeds = fill_nearest(np.concatenate([
+            coarse_seeds(np.asarray(arr[start:stop].compute(), dtype=np.float64), factor)
+            for start, stop in iter_row_blocks(nrows, nrows_per_band)
+        ]))
+        # Chunks span all columns, and are filled from the nearest non-null
+        # cell within the halo, or else from the seed grid
+        arr = arr.rechunk((max(self.chunk_size, GROW_HALO_ROWS), -1))
+        arr = arr.map_overlap(
+            fill_nearest, depth={0: min(GROW_HALO_ROWS, nrows), 1: 0}, boundary='none', dtype=np.float64
+        )
+        arr = arr.map_blocks(_fill_from_seeds_chunk, seeds=seeds, factor=factor, dtype=np.float64)
+        return self._store(output_map, arr, rgn_def)
+
+    def remove_maps(self, pattern):
+        for mapname in list(self.arrays.keys()):
+            if fnmatch.fnmatchcase(mapname, pattern):
+                self.arrays.pop(mapname)
+        removed = self._lazy_files([mapname for mapname in self._registry() if fnmatch.fnmatchcase(mapname, pattern)])
+        super().remove_maps(pattern)
+        self._remove_lazy_files(removed)
+        return 0
+
+    # Block I/O
+
+    def block_reader(self, mapnames):
+        return DaskRasterBlockReader(self, mapnames)
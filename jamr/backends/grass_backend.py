@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import os
+import re
+
+from contextlib import contextmanager
+from subprocess import PIPE
+
+import numpy as np
+import grass.script as gscript
+
+from grass.lib import raster as libraster
+from grass.pygrass.raster import RasterRow
+from grass.pygrass.raster.buffer import Buffer
+
+from jamr.backends.backend import Backend
+from jamr.utils.grass_utils import (grass_find_map,
+                                    grass_map_exists,
+                                    grass_region_definition,
+                                    grass_remove_mask,
+                                    grass_set_region,
+                                    grass_set_region_from_raster,
+                                    grass_sync_raster_window)
+
+CELL_NULL = np.iinfo(np.int32).min
+
+
+def grass_expression(expression):
+    """Translate a backend map algebra expression to r.mapcalc syntax."""
+    expression = expression.replace('**', '^')
+    expression = re.sub(r'\bwhere\(', 'if(', expression)
+    expression = re.sub(r'(?<![&])&(?![&])', '&&', expression)
+    expression = re.sub(r'(?<![|])\|(?![|])', '||', expression)
+    return expression
+
+
+def _row_as_float(row, mtype):
+    values = np.array(row, dtype=np.float64)
+    if mtype == 'CELL':
+        values[np.asarray(row) == CELL_NULL] = np.nan
+    return values
+
+
+class RasterBlockReader:
+    """Read row blocks from one or more GRASS raster maps.
+
+    Maps are read in the current region, with null cells returned as NaN.
+    Blocks are returned as arrays with shape (nmaps, nrows, ncols).
+    """
+    def __init__(self, mapnames):
+        self.mapnames = list(mapnames)
+        self.maps = []
+
+    def __enter__(self):
+        grass_sync_raster_window()
+        for mapname in self.mapnames:
+            rast = RasterRow(mapname)
+            rast.open('r')
+            self.maps.append(rast)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for rast in self.maps:
+            rast.close()
+        self.maps = []
+
+    @property
+    def shape(self):
+        return libraster.Rast_window_rows(), libraster.Rast_window_cols()
+
+    def read(self, start, stop):
+        ncols = self.shape[1]
+        block = np.empty((len(self.maps), stop - start, ncols), dtype=np.float64)
+        for i, rast in enumerate(self.maps):
+            for row in range(start, stop):
+                block[i, row - start, :] = _row_as_float(rast.get_row(row), rast.mtype)
+        return block
+
+
+class RasterBlockWriter:
+    """Write row blocks to one or more new GRASS raster maps.
+
+    Blocks must be written in row order and have shape (nmaps, nrows, ncols).
+    NaN values are written as null.
+    """
+    def __init__(self, mapnames, mtype='DCELL', overwrite=False):
+        self.mapnames = list(mapnames)
+        self.mtype = mtype
+        self.overwrite = overwrite
+        self.maps = []
+
+    def __enter__(self):
+        grass_sync_raster_window()
+        for mapname in self.mapnames:
+            rast = RasterRow(mapname)
+            rast.open('w', mtype=self.mtype, overwrite=self.overwrite)
+            self.maps.append(rast)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for rast in self.maps:
+            rast.close()
+        self.maps = []
+
+    def write(self, block):
+        ncols = block.shape[-1]
+        for i, rast in enumerate(self.maps):
+            buf = Buffer((ncols,), mtype=self.mtype)
+            for row in block[i]:
+                buf[:] = row
+                rast.put_row(buf)
+
+
+class GrassBackend(Backend):
+    """Backend running GRASS GIS modules in the current GRASS session."""
+    name = 'grass'
+
+    def initial(self):
+        # Make sure we're not using external output
+        p = gscript.start_command('r.external.out', flags='r', stderr=PIPE)
+        stdout, stderr = p.communicate()
+
+    def set_storage(self, profile='double', compressor=None):
+        # GRASS has no scaled integer maps, so fractions are stored as FCELL
+        # by both the 'float' and 'compact' profiles. The compressor (e.g. 
+        # ZSTD) applies to maps written by modules started from now on
+        super().set_storage(profile, compressor=compressor)
+        if compressor is not None:
+            os.environ['GRASS_COMPRESSOR'] = compressor.upper()
+
+    @property
+    def mtype(self):
+        return 'DCELL' if self.storage_profile == 'double' else 'FCELL'
+
+    def set_region(self, **kwargs):
+        grass_set_region(**kwargs)
+
+    def set_region_from_raster(self, raster, n=None, s=None, e=None, w=None):
+        grass_set_region_from_raster(raster=raster, n=n, s=s, e=e, w=w)
+
+    def region_definition(self):
+        return grass_region_definition()
+
+    def region_env(self):
+        return gscript.region_env()
+
+    @contextmanager
+    def pinned_region(self, region):
+        # Pin the region in the environment so that the caller neither 
+        # depends on, nor races other processes to update, the region of
+        # the mapset
+        current = os.environ.get('GRASS_REGION')
+        if region is not None:
+            os.environ['GRASS_REGION'] = region
+        try:
+            yield
+        finally:
+            if current is not None:
+                os.environ['GRASS_REGION'] = current
+            else:
+                os.environ.pop('GRASS_REGION', None)
+
+    def tempfile(self):
+        return gscript.tempfile()
+
+    def map_exists(self, mapname, mapset=None):
+        if mapset is not None:
+            return grass_map_exists('raster', mapname, mapset)
+        return grass_find_map(mapname) is not None
+
+    def import_raster(self, filename, mapname, overwrite=False, flags=None, fix_bounds=False):
+        kwargs = {'flags': flags} if flags is not None else {}
+        if not fix_bounds:
+            p = gscript.start_command('r.in.gdal', input=filename, output=mapname, overwrite=overwrite, stderr=PIPE, **kwargs)
+            stdout, stderr = p.communicate()
+            return 0
+
+        # Copying the imported map with r.mapcalc fixes subtle errors in the 
+        # bounds of some inputs
+        p = gscript.start_command('r.in.gdal', input=filename, output=mapname + '_tmp', overwrite=True, stderr=PIPE, **kwargs)
+        stdout, stderr = p.communicate()
+        self.calc(mapname, '{x}', overwrite=True, x=mapname + '_tmp')
+        self.remove_maps(mapname + '_tmp')
+        return 0
+
+    def aggregate_file(self, input_filename, output_filename, res, method='average'):
+        p = gscript.start_command('r.in.gdal', input=input_filename, output='aggregate_file_tmp', flags='a', overwrite=True, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        grass_set_region(raster='aggregate_file_tmp', res=res)
+        p = gscript.start_command('r.resamp.stats', input='aggregate_file_tmp', output='aggregate_file_out_tmp', method=method, overwrite=True, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        p = gscript.start_command('r.out.gdal', input='aggregate_file_out_tmp', output=output_filename, createopt='COMPRESS=DEFLATE', overwrite=True, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def calc(self, output, expression, overwrite=False, fraction=False, **maps):
+        expression = grass_expression(expression).format(**maps)
+        if self.mtype == 'FCELL':
+            expression = f'float({expression})'
+        p = gscript.start_command('r.mapcalc', expression=f'{output} = {expression}', overwrite=overwrite, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def resample(self, input_map, output_map, method, overwrite=False, weighted=True):
+        kwargs = {'flags': 'w'} if weighted else {}
+        p = gscript.start_command('r.resamp.stats', input=input_map, output=output_map, method=method, overwrite=overwrite, stderr=PIPE, **kwargs)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def reclass(self, input_map, output_map, table, overwrite=False, fraction=False, factor=1000):
+        # r.reclass only works with integers, so we multiply by a suitably 
+        # large factor to convert the values to integers, then divide by it
+        rules = gscript.tempfile()
+        text = ""
+        for key, value in table.items():
+            text = text + str(key) + " = " + str(int(value * factor)) + os.linesep
+        text = text + "* = 0"
+        with open(rules, "w") as f:
+            f.write(text)
+
+        p = gscript.start_command('r.reclass', input=input_map, output=output_map + '_step1', rules=rules, overwrite=overwrite, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        self.calc(output_map, f'{{x}} / {factor}.0', overwrite=overwrite, fraction=fraction, x=output_map + '_step1')
+        self.remove_maps(output_map + '_step1')
+        return 0
+
+    def fill_nulls(self, mapname, value):
+        p = gscript.start_command('r.null', map=mapname, null=value, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def set_nulls(self, mapname, value):
+        p = gscript.start_command('r.null', map=mapname, setnull=value, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def grow(self, input_map, output_map, overwrite=False):
+        p = gscript.start_command('r.grow.distance', input=input_map, value=output_map, overwrite=overwrite, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def set_mask(self, mapname, maskcats=1):
+        p = gscript.start_command('r.mask', raster=mapname, maskcats=maskcats, overwrite=True, stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def remove_mask(self):
+        return grass_remove_mask()
+
+    def remove_maps(self, pattern):
+        p = gscript.start_command('g.remove', type='raster', pattern=pattern, flags='f', stderr=PIPE)
+        stdout, stderr = p.communicate()
+        return 0
+
+    def block_reader(self, mapnames):
+        return RasterBlockReader(mapnames)
+
+    def block_writer(self, mapnames, overwrite=False, fraction=False):
+        return RasterBlockWriter(mapnames, mtype=self.mtype, overwrite=overwrite)
@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+
+import os
+import ast
+import json
+import fnmatch
+import logging
+import tempfile
+import functools
+
+from contextlib import contextmanager
+
+import numpy as np
+import rasterio
+
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.windows import Window, from_bounds
+
+from jamr.backends.backend import (Backend, expression_names)
+from jamr.utils.blocks import (aggregation_factor, block_rows, iter_row_blocks, region_shape)
+
+LOGGER = logging.getLogger(__name__)
+
+# Tolerance, as a fraction of a cell, used to snap regions and windows to grids
+EPS = 1e-6
+
+# Number of rows either side of a block searched for the nearest non-null
+# cell by `grow`. Cells further from data are filled from a coarse grid of
+# at most GROW_SEED_CELLS cells covering the whole region
+GROW_HALO_ROWS = 256
+GROW_SEED_CELLS = 2 ** 22
+
+# Fractions stored as 16-bit integers by the 'compact' storage profile are
+# scaled by FRACTION_SCALE, with FRACTION_NODATA as the null value
+FRACTION_SCALE = 1e-4
+FRACTION_NODATA = 65535
+
+RESAMPLING_METHODS = {
+    'average': Resampling.average,
+    'sum': Resampling.sum,
+    'minimum': Resampling.min,
+    'maximum': Resampling.max
+}
+
+
+def _where(condition, x, y):
+    # A null condition gives null, as `if()` does in r.mapcalc
+    condition = np.asarray(condition, dtype=np.float64)
+    result = np.where(condition != 0, x, y).astype(np.float64)
+    result[np.isnan(condition)] = np.nan
+    return result
+
+
+def _logical(function):
+    # Logical operators on maps, with null operands giving null
+    def operator(x, y):
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        result = function(x != 0, y != 0).astype(np.float64)
+        result[np.isnan(x) | np.isnan(y)] = np.nan
+        return result
+    return operator
+
+
+EXPRESSION_FUNCTIONS = {
+    'where': _where, 'isnull': np.isnan, 'exp': np.exp,
+    '_and': _logical(np.logical_and), '_or': _logical(np.logical_or)
+}
+
+
+class _LogicalOperators(ast.NodeTransformer):
+    """Evaluate `&` and `|` as logical rather than bitwise operators, as
+    they are applied to floating point maps."""
+    def visit_BinOp(self, node):
+        node = self.generic_visit(node)
+        functions = {ast.BitAnd: '_and', ast.BitOr: '_or'}
+        if type(node.op) in functions:
+            return ast.Call(func=ast.Name(id=functions[type(node.op)], ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return node
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_expression(expression):
+    tree = ast.parse(expression, mode='eval')
+    tree = ast.fix_missing_locations(_LogicalOperators().visit(tree))
+    return compile(tree, '<expression>', 'eval')
+
+
+def evaluate_expression(expression, names, block):
+    """Evaluate an expression with maps given as `{name}` on a block with 
+    shape (nmaps, nrows, ncols) holding the maps in `names`. Returns an
+    array with shape (nrows, ncols)."""
+    # Null inputs give null, as in r.mapcalc, unless the expression
+    # handles them with `isnull`
+    code = _compile_expression(expression.format(**{name: name for name in names}))
+    namespace = dict(EXPRESSION_FUNCTIONS)
+    namespace.update({name: block[i] for i, name in enumerate(names)})
+    with np.errstate(all='ignore'):
+        result = eval(code, {'__builtins__': {}}, namespace)
+    result = np.array(np.broadcast_to(result, block.shape[1:]), dtype=np.float64)
+    if 'isnull' not in expression:
+        result[np.isnan(block).any(axis=0)] = np.nan
+    return result
+
+
+def fill_nearest(arr):
+    """Fill null cells with the value of the nearest non-null cell."""
+    from scipy.ndimage import distance_transform_edt
+    isnull = np.isnan(arr)
+    if isnull.all() or not isnull.any():
+        return arr
+    indices = distance_transform_edt(isnull, return_distances=False, return_indices=True)
+    return arr[indices[0], indices[1]]
+
+
+def grow_seed_factor(nrows, ncols):
+    """Factor by which the seed grid of `grow` is coarser than the map."""
+    return max(1, int(np.ceil(np.sqrt(nrows * ncols / GROW_SEED_CELLS))))
+
+
+def coarse_seeds(arr, factor):
+    """Coarse grid holding the first non-null cell of each `factor` x
+    `factor` block of `arr`, or null."""
+    nrows, ncols = arr.shape
+    rows, cols = -(-nrows // factor), -(-ncols // factor)
+    padded = np.full((rows * factor, cols * factor), np.nan)
+    padded[:nrows, :ncols] = arr
+    blocks = padded.reshape(rows, factor, cols, factor).transpose(0, 2, 1, 3).reshape(rows, cols, -1)
+    first = np.argmax(~np.isnan(blocks), axis=-1)
+    return np.take_along_axis(blocks, first[..., None], axis=-1)[..., 0]
+
+
+def fill_from_seeds(arr, seeds, factor, row0=0, col0=0):
+    """Fill null cells of `arr`, whose first cell is at (`row0`, `col0`)
+    in the map, from the filled seed grid of the map."""
+    rows, cols = np.nonzero(np.isnan(arr))
+    if len(rows) == 0:
+        return arr
+    arr = np.array(arr)
+    arr[rows, cols] = seeds[(rows + row0) // factor, (cols + col0) // factor]
+    return arr
+
+
+def _base_mapname(mapname):
+    # Map names may be qualified with a GRASS mapset, which has no meaning here
+    return mapname.split('@')[0]
+
+
+def _snap(value, origin, res, outward):
+    # Snap a bound to the nearest grid line in the direction `outward` (-1 or 1)
+    n = (value - origin) / res
+    n = np.floor(n + EPS) if outward < 0 else np.ceil(n - EPS)
+    return float(origin + n * res)
+
+
+def _block_reduce(arr, fy, fx, method):
+    """Reduce non-overlapping `fy` x `fx` blocks over the last two axes,
+    ignoring NaN. Blocks which are all NaN give NaN."""
+    shape = arr.shape[:-2] + (arr.shape[-2] // fy, fy, arr.shape[-1] // fx, fx)
+    arr = arr.reshape(shape)
+    valid = np.isfinite(arr)
+    count = valid.sum(axis=(-3, -1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if method in ['average', 'sum']:
+            result = np.where(valid, arr, 0.).sum(axis=(-3, -1))
+            if method == 'average':
+                result = result / count
+        elif method == 'minimum':
+            result = np.where(valid, arr, np.inf).min(axis=(-3, -1))
+        elif method == 'maximum':
+            result = np.where(valid, arr, -np.inf).max(axis=(-3, -1))
+        else:
+            raise ValueError(f'Unknown resampling method: {method}')
+    result[count == 0] = np.nan
+    return result
+
+
+def subregion(rgn_def, row0, row1, col0=0, col1=None):
+    """Region covering rows `row0` to `row1` and columns `col0` to `col1`
+    of a region."""
+    col1 = region_shape(rgn_def)[1] if col1 is None else col1
+    return dict(
+        rgn_def, 
+        n=rgn_def['n'] - row0 * rgn_def['nsres'], s=rgn_def['n'] - row1 * rgn_def['nsres'],
+        w=rgn_def['w'] + col0 * rgn_def['ewres'], e=rgn_def['w'] + col1 * rgn_def['ewres']
+    )
+
+
+def nested_region(input_rgn, target_rgn):
+    """The region of the target extent on the grid of an input, and the
+    integer aggregation factor from that region to the target region, or
+    None if input cells do not nest within target cells."""
+    native_rgn = dict(target_rgn, nsres=input_rgn['nsres'], ewres=input_rgn['ewres'])
+    for key, origin, res in [('n', 'n', 'nsres'), ('s', 'n', 'nsres'), ('e', 'w', 'ewres'), ('w', 'w', 'ewres')]:
+        offset = (native_rgn[key] - input_rgn[origin]) / native_rgn[res]
+        if abs(offset - round(offset)) > EPS:
+            return native_rgn, None
+    return native_rgn, aggregation_factor(native_rgn, target_rgn)
+
+
+def read_region(dataset, rgn_def, resampling=Resampling.nearest):
+    """Read an open raster in a region. Cells are sampled at the cell 
+    centres of the region, or resampled with `resampling`, and null cells
+    and cells outside the raster are returned as NaN."""
+    shape = region_shape(rgn_def)
+    window = from_bounds(rgn_def['w'], rgn_def['s'], rgn_def['e'], rgn_def['n'], transform=dataset.transform)
+    values = [window.col_off, window.row_off, window.width, window.height]
+    # Windows aligned with the raster grid are read directly
+    if all(abs(v - round(v)) < EPS for v in values):
+        window = Window(*[int(round(v)) for v in values])
+        inside = (
+            window.col_off >= 0 and window.row_off >= 0
+            and window.col_off + window.width <= dataset.width
+            and window.row_off + window.height <= dataset.height
+        )
+        if inside and (window.height, window.width) == shape:
+            arr = dataset.read(1, window=window, masked=True)
+            return _unscale(dataset, arr.astype(np.float64).filled(np.nan))
+    arr = dataset.read(1, window=window, out_shape=shape, resampling=resampling, boundless=True, masked=True)
+    return _unscale(dataset, arr.astype(np.float64).filled(np.nan))
+
+
+def _unscale(dataset, arr):
+    # Values of quantized maps are stored with a scale and offset
+    scale, offset = dataset.scales[0], dataset.offsets[0]
+    if scale != 1 or offset != 0:
+        arr = arr * scale + offset
+    return arr
+
+
+def storage_options(profile, compressor=None, fraction=False):
+    """GeoTIFF creation options of a map stored with a storage profile."""
+    compress = (compressor or 'deflate').lower()
+    if profile == 'compact' and fraction:
+        return {'dtype': 'uint16', 'nodata': FRACTION_NODATA, 'compress': compress, 'predictor': 2}
+    if profile == 'double':
+        return {'dtype': 'float64', 'nodata': np.nan, 'compress': compress}
+    return {'dtype': 'float32', 'nodata': np.nan, 'compress': compress, 'predictor': 3}
+
+
+def quantize_fraction(arr):
+    """Fractions as integers scaled by FRACTION_SCALE, with nulls as
+    FRACTION_NODATA."""
+    values = np.clip(np.round(np.nan_to_num(arr) / FRACTION_SCALE), 0, FRACTION_NODATA - 1)
+    return np.where(np.isnan(arr), FRACTION_NODATA, values).astype(np.uint16)
+
+
+class NativeRasterBlockReader:
+    """Read row blocks from one or more maps of a NativeBackend.
+
+    Maps are sampled at the cell centres of the region current when the
+    reader is created, with null cells, cells outside the map and cells
+    outside the mask returned as NaN. Blocks are returned as arrays with
+    shape (nmaps, nrows, ncols).
+    """
+    def __init__(self, backend, mapnames):
+        self.backend = backend
+        self.mapnames = list(mapnames)
+        self.rgn_def = backend.region_definition()
+        self.mask = backend.mask
+        self.datasets = []
+        self.mask_dataset = None
+
+    def __enter__(self):
+        for mapname in self.mapnames:
+            self.datasets.append(rasterio.open(self.backend.map_path(mapname)))
+        if self.mask is not None:
+            self.mask_dataset = rasterio.open(self.backend.map_path(self.mask[0]))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for dataset in self.datasets:
+            dataset.close()
+        self.datasets = []
+        if self.mask_dataset is not None:
+            self.mask_dataset.close()
+            self.mask_dataset = None
+
+    @property
+    def shape(self):
+        return region_shape(self.rgn_def)
+
+    def _read(self, dataset, start, stop):
+        return read_region(dataset, subregion(self.rgn_def, start, stop))
+
+    def read(self, start, stop):
+        block = np.empty((len(self.datasets), stop - start, self.shape[1]), dtype=np.float64)
+        for i, dataset in enumerate(self.datasets):
+            block[i] = self._read(dataset, start, stop)
+        if self.mask_dataset is not None:
+            mask = self._read(self.mask_dataset, start, stop)
+            block[:, ~np.isin(mask, self.mask[1])] = np.nan
+        return block
+
+
+class NativeRasterBlockWriter:
+    """Write row blocks to one or more new maps of a NativeBackend.
+
+    Maps are written as GeoTIFFs in the region current when the writer is
+    created, with the storage profile of the backend. Blocks must be 
+    written in row order and have shape (nmaps, nrows, ncols). NaN values
+    are written as null. Each map replaces any existing map of the same 
+    name once it is complete.
+    """
+    def __init__(self, backend, mapnames, overwrite=False, fraction=False):
+        self.backend = backend
+        self.mapnames = list(mapnames)
+        self.overwrite = overwrite
+        self.options = storage_options(backend.storage_profile, backend.compressor, fraction)
+        self.rgn_def = backend.region_definition()
+        self.datasets = []
+        self.row = 0
+
+    @property
+    def shape(self):
+        return region_shape(self.rgn_def)
+
+    def _tmp_filename(self, mapname):
+        return self.backend.map_filename(mapname) + '.tmp'
+
+    def __enter__(self):
+        for mapname in self.mapnames:
+            if self.backend.map_exists(mapname) and not self.overwrite:
+                raise FileExistsError(f'Map {mapname} already exists')
+        nrows, ncols = self.shape
+        profile = {
+            'driver': 'GTiff', 'height': nrows, 'width': ncols, 'count': 1, 'crs': 'EPSG:4326',
+            'transform': from_origin(self.rgn_def['w'], self.rgn_def['n'], self.rgn_def['ewres'], self.rgn_def['nsres']),
+            'BIGTIFF': 'IF_SAFER', **self.options
+        }
+        for mapname in self.mapnames:
+            dataset = rasterio.open(self._tmp_filename(mapname), 'w', **profile)
+            if self.options['dtype'] == 'uint16':
+                dataset.scales = (FRACTION_SCALE,)
+            self.datasets.append(dataset)
+        self.row = 0
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for dataset in self.datasets:
+            dataset.close()
+        self.datasets = []
+        for mapname in self.mapnames:
+            if exc_type is None:
+                os.replace(self._tmp_filename(mapname), self.backend.map_filename(mapname))
+                self.backend.unregister(mapname)
+            elif os.path.exists(self._tmp_filename(mapname)):
+                os.remove(self._tmp_filename(mapname))
+
+    def write(self, block):
+        nrows, ncols = block.shape[-2:]
+        window = Window(0, self.row, ncols, nrows)
+        for i, dataset in enumerate(self.datasets):
+            if self.options['dtype'] == 'uint16':
+                dataset.write(quantize_fraction(block[i]), 1, window=window)
+            else:
+                dataset.write(block[i].astype(self.options['dtype']), 1, window=window)
+        self.row += nrows
+
+
+class NativeBackend(Backend):
+    """Backend computing maps with NumPy and rasterio, without GRASS.
+
+    Maps are GeoTIFFs in `directory`, or files imported with
+    `import_raster`, which are used in place and recorded in `maps.json`.
+    The region and mask are held by the backend object. They are process-
+    wide, like the GRASS region of a mapset, and are inherited by forked
+    worker processes.
+
+    Parameters
+    ----------
+    directory : str
+        The directory holding the maps.
+    """
+    name = 'native'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.registry_filename = os.path.join(directory, 'maps.json')
+        self.rgn_def = None
+        self.mask = None
+
+    # Region
+
+    def _raster_region(self, raster):
+        with rasterio.open(self.map_path(raster)) as src:
+            return {
+                'n': src.bounds.top, 's': src.bounds.bottom,
+                'e': src.bounds.right, 'w': src.bounds.left,
+                'nsres': abs(src.transform.e), 'ewres': abs(src.transform.a)
+            }
+
+    def set_region(self, **kwargs):
+        rgn_def = dict(self.rgn_def) if self.rgn_def is not None else {}
+        if kwargs.get('raster') is not None:
+            rgn_def.update(self._raster_region(kwargs['raster']))
+        for key in ['n', 's', 'e', 'w', 'nsres', 'ewres']:
+            if kwargs.get(key) is not None:
+                rgn_def[key] = float(kwargs[key])
+        if kwargs.get('res') is not None:
+            rgn_def['nsres'] = rgn_def['ewres'] = float(kwargs['res'])
+
+        if kwargs.get('align') is not None:
+            # Take the resolution of the raster and grow the bounds to its grid
+            grid = self._raster_region(kwargs['align'])
+            rgn_def['nsres'], rgn_def['ewres'] = grid['nsres'], grid['ewres']
+            for key, origin, res, outward in [('n', grid['n'], grid['nsres'], 1), ('s', grid['n'], grid['nsres'], -1),
+                                              ('e', grid['w'], grid['ewres'], 1), ('w', grid['w'], grid['ewres'], -1)]:
+                rgn_def[key] = _snap(rgn_def[key], origin, res, outward)
+        else:
+            # Keep the bounds, adjusting the resolution to whole rows and
+            # columns as g.region does
+            nrows = max(1, int(round((rgn_def['n'] - rgn_def['s']) / rgn_def['nsres'])))
+            ncols = max(1, int(round((rgn_def['e'] - rgn_def['w']) / rgn_def['ewres'])))
+            rgn_def['nsres'] = (rgn_def['n'] - rgn_def['s']) / nrows
+            rgn_def['ewres'] = (rgn_def['e'] - rgn_def['w']) / ncols
+
+        self.rgn_def = rgn_def
+        return 0
+
+    def set_region_from_raster(self, raster, n=None, s=None, e=None, w=None):
+        self.set_region(raster=raster)
+        self.set_region(n=n, s=s, e=e, w=w, align=raster)
+        return 0
+
+    def region_definition(self):
+        if self.rgn_def is None:
+            raise ValueError('The region has not been set')
+        return dict(self.rgn_def)
+
+    def region_env(self):
+        return self.region_definition()
+
+    @contextmanager
+    def pinned_region(self, region):
+        rgn_def = self.rgn_def
+        if region is not None:
+            self.rgn_def = dict(region)
+        try:
+            yield
+        finally:
+            self.rgn_def = rgn_def
+
+    # Maps and files
+
+    def _registry(self):
+        if not os.path.exists(self.registry_filename):
+            return {}
+        with open(self.registry_filename) as f:
+            return json.load(f)
+
+    def _write_registry(self, registry):
+        tmp_filename = self.registry_filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(registry, f, indent=2)
+        os.replace(tmp_filename, self.registry_filename)
+
+    def register(self, mapname, filename):
+        registry = self._registry()
+        registry[_base_mapname(mapname)] = os.path.abspath(filename)
+        self._write_registry(registry)
+
+    def unregister(self, mapname):
+        registry = self._registry()
+        if registry.pop(_base_mapname(mapname), None) is not None:
+            self._write_registry(registry)
+
+    def map_filename(self, mapname):
+        """The GeoTIFF written for a map computed by this backend."""
+        return os.path.join(self.directory, _base_mapname(mapname) + '.tif')
+
+    def map_path(self, mapname):
+        """The file holding a map, which may be an imported file."""
+        return self._registry().get(_base_mapname(mapname), self.map_filename(mapname))
+
+    def tempfile(self):
+        fd, filename = tempfile.mkstemp(dir=self.directory)
+        os.close(fd)
+        return filename
+
+    def map_exists(self, mapname, mapset=None):
+        return os.path.exists(self.map_path(mapname))
+
+    def import_raster(self, filename, mapname, overwrite=False, flags=None, fix_bounds=False):
+        # Files are read in place; the bounds of each read are computed by
+        # rasterio, so `fix_bounds` is not needed
+        if self.map_exists(mapname) and not overwrite:
+            return 0
+        if os.path.exists(self.map_filename(mapname)):
+            os.remove(self.map_filename(mapname))
+        self.register(mapname, filename)
+        return 0
+
+    def aggregate_file(self, input_filename, output_filename, res, method='average'):
+        with rasterio.open(input_filename) as src:
+            nrows = max(1, int(round(src.height * abs(src.transform.e) / res)))
+            ncols = max(1, int(round(src.width * src.transform.a / res)))
+            arr = src.read(1, out_shape=(nrows, ncols), resampling=RESAMPLING_METHODS[method], masked=True)
+            profile = src.profile
+            profile.update(
+                driver='GTiff', height=nrows, width=ncols, compress='deflate', dtype='float64', nodata=np.nan,
+                transform=from_origin(src.bounds.left, src.bounds.top, res, res)
+            )
+            for key in ['blockxsize', 'blockysize', 'tiled']:
+                profile.pop(key, None)
+        with rasterio.open(output_filename, 'w', **profile) as dst:
+            dst.write(arr.astype(np.float64).filled(np.nan), 1)
+        return 0
+
+    # Map algebra
+
+    def _skip(self, output, overwrite):
+        # Like GRASS modules, which fail without overwriting an existing map
+        if self.map_exists(output) and not overwrite:
+            LOGGER.warning(f'Map {output} already exists and is not overwritten')
+            return True
+        return False
+
+    def calc(self, output, expression, overwrite=False, fraction=False, **maps):
+        if self._skip(output, overwrite):
+            return 0
+        names = list(dict.fromkeys(expression_names(expression)))
+        nrows, ncols = region_shape(self.region_definition())
+        with self.block_reader([maps[name] for name in names]) as reader, \
+             self.block_writer([output], overwrite=True, fraction=fraction) as writer:
+            for start, stop in iter_row_blocks(nrows, block_rows(ncols, nmaps=len(names) + 1)):
+                writer.write(evaluate_expression(expression, names, reader.read(start, stop))[None])
+        return 0
+
+    def resample(self, input_map, output_map, method, overwrite=False, weighted=True):
+        if self._skip(output_map, overwrite):
+            return 0
+        target_rgn = self.region_definition()
+        native_rgn, factor = nested_region(self._raster_region(input_map), target_rgn)
+        nrows, ncols = region_shape(target_rgn)
+        if factor is not None:
+            # Input cells nest within target cells: aggregate blocks of native
+            # rows, read through the mask
+            fy, fx = factor
+            with self.pinned_region(native_rgn):
+                reader = self.block_reader([input_map])
+            with reader, self.block_writer([output_map], overwrite=True) as writer:
+                for start, stop in iter_row_blocks(nrows, block_rows(ncols, factor=fy * fx)):
+                    block = reader.read(start * fy, stop * fy)
+                    writer.write(_block_reduce(block, fy, fx, method))
+        else:
+            LOGGER.warning(f'{input_map} is not aligned with the region; resampling without the mask')
+            with rasterio.open(self.map_path(input_map)) as src, \
+                 self.block_writer([output_map], overwrite=True) as writer:
+                for start, stop in iter_row_blocks(nrows, block_rows(ncols)):
+                    arr = read_region(src, subregion(target_rgn, start, stop), RESAMPLING_METHODS[method])
+                    writer.write(arr[None])
+        return 0
+
+    def reclass(self, input_map, output_map, table, overwrite=False, fraction=False):
+        if self._skip(output_map, overwrite):
+            return 0
+        nrows, ncols = region_shape(self.region_definition())
+        with self.block_reader([input_map]) as reader, \
+             self.block_writer([output_map], overwrite=True, fraction=fraction) as writer:
+            for start, stop in iter_row_blocks(nrows, block_rows(ncols, nmaps=2)):
+                block = reader.read(start, stop)
+                result = np.zeros_like(block)
+                for key, value in table.items():
+                    result[block == key] = value
+                result[np.isnan(block)] = np.nan
+                writer.write(result)
+        return 0
+
+    # Nulls and masks
+
+    def _rewrite(self, mapname, function, nodata=None):
+        """Rewrite a map over its own grid, applying `function` to masked
+        arrays of row blocks. The map keeps its data type."""
+        input_filename = self.map_path(mapname)
+        output_filename = self.map_filename(mapname)
+        tmp_filename = output_filename + '.tmp'
+        with rasterio.open(input_filename) as src:
+            profile = src.profile
+            profile.update(driver='GTiff', compress=(self.compressor or 'deflate').lower(), nodata=nodata)
+            with rasterio.open(tmp_filename, 'w', **profile) as dst:
+                dst.scales, dst.offsets = src.scales, src.offsets
+                for start, stop in iter_row_blocks(src.height, block_rows(src.width)):
+                    window = Window(0, start, src.width, stop - start)
+                    dst.write(function(src.read(1, window=window, masked=True)), 1, window=window)
+        os.replace(tmp_filename, output_filename)
+        self.unregister(mapname)
+        return 0
+
+    def fill_nulls(self, mapname, value):
+        return self._rewrite(mapname, lambda arr: arr.filled(value).astype(arr.dtype))
+
+    def set_nulls(self, mapname, value):
+        with rasterio.open(self.map_path(mapname)) as src:
+            nodata = src.nodata if src.nodata is not None else value
+
+        def function(arr):
+            return np.where(arr.mask | (arr.data == value), nodata, arr.data).astype(arr.dtype)
+
+        return self._rewrite(mapname, function, nodata=nodata)
+
+    def grow(self, input_map, output_map, overwrite=False):
+        if self._skip(output_map, overwrite):
+            return 0
+        nrows, ncols = region_shape(self.region_definition())
+        # Rows are read in blocks of whole seed cells. The seed grid is the
+        # map coarsened so that it fits in memory, with its nulls filled
+        factor = grow_seed_factor(nrows, ncols)
+        nrows_per_block = max(factor, block_rows(ncols, factor=3) // factor * factor)
+        with self.block_reader([input_map]) as reader:
+            seeds = fill_nearest(np.concatenate([
+                coarse_seeds(reader.read(start, stop)[0], factor) 
+                for start, stop in iter_row_blocks(nrows, nrows_per_block)
+            ]))
+
+        # Cells are filled from the nearest non-null cell within the halo,
+        # or else from the seed grid, so that no nulls remain unless the map
+        # has no data at all
+        with self.block_reader([input_map]) as reader, \
+             self.block_writer([output_map], overwrite=True) as writer:
+            for start, stop in iter_row_blocks(nrows, nrows_per_block):
+                halo_start, halo_stop = max(0, start - GROW_HALO_ROWS), min(nrows, stop + GROW_HALO_ROWS)
+                result = fill_nearest(reader.read(halo_start, halo_stop)[0])
+                result = fill_from_seeds(result[(start - halo_start):(stop - halo_start)], seeds, factor, row0=start)
+                writer.write(result[None])
+        return 0
+
+    def set_mask(self, mapname, maskcats=1):
+        cats = [float(cat) for cat in str(maskcats).split()]
+        self.mask = (mapname, cats)
+        return 0
+
+    def remove_mask(self):
+        self.mask = None
+        return 0
+
+    def remove_maps(self, pattern):
+        registry = self._registry()
+        for mapname in list(registry.keys()):
+            if fnmatch.fnmatchcase(mapname, pattern):
+                registry.pop(mapname)
+        self._write_registry(registry)
+        for filename in os.listdir(self.directory):
+            mapname, ext = os.path.splitext(filename)
+            if ext == '.tif' and fnmatch.fnmatchcase(mapname, pattern):
+                os.remove(os.path.join(self.directory, filename))
+        return 0
+
+    # Block I/O
+
+    def block_reader(self, mapnames):
+        return NativeRasterBlockReader(self, mapnames)
+
+    def block_writer(self, mapnames, overwrite=False, fraction=False):
+        return NativeRasterBlockWriter(self, mapnames, overwrite=overwrite, fraction=fraction)
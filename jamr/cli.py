@@ -4,14 +4,11 @@ import sys
 import click
 import tomllib
 
-from grass_session import Session
-
-from grass.pygrass.modules.shortcuts import raster as r
-
+from jamr.backends.backend import (BackendFactory, get_backend, set_backend)
 from jamr.utils.setup_logging import setup_logging
-from jamr.utils.regions import set_regions
-from jamr.input.input import InputData
-from jamr.process.process import ProcessData
+
+# Modules importing GRASS, GDAL, netCDF4 and the like are imported by the 
+# commands which use them, so that the CLI starts quickly
 
 
 def parse_config(config):
@@ -21,12 +18,55 @@ def parse_config(config):
     return config_dict
 
 
-def start_session(gisdb):
+def start_session(gisdb, mapset=None):
+    # GRASS modules are imported on demand, so that runs with the native 
+    # backend do not need a GRASS installation
+    from grass_session import Session
     PERMANENT = Session()
-    PERMANENT.open(gisdb = gisdb, location = "jamr", create_opts='EPSG:4326')
+    PERMANENT.open(gisdb = gisdb, location = "jamr", mapset = mapset, create_opts='EPSG:4326')
     return PERMANENT
 
 
+def start_backend(config_dict, mapset=None):
+    """Set the processing backend of the run, starting a GRASS session if 
+    the backend is GRASS. Returns the session, or None."""
+    backend = set_backend(BackendFactory.create_backend(config_dict))
+    if backend.name != 'grass':
+        return None
+
+    gisdb = config_dict['main']['grass_gis_database']
+    if 'snapshot' in config_dict['main']:
+        # Input maps and regions are cloned from the snapshot. Its PERMANENT 
+        # mapset is hard linked, so the run writes to a mapset of its own
+        from jamr.utils.snapshot import (clone_snapshot, run_mapset)
+        clone_snapshot(config_dict['main']['snapshot'], gisdb, config_dict)
+        session = start_session(gisdb = gisdb, mapset = mapset or run_mapset(config_dict))
+        backend.initial()
+        return session
+
+    # Named regions are saved in the location when first used
+    session = start_session(gisdb = gisdb, mapset = mapset)
+    backend.initial()
+    return session
+
+
+def close_session(session):
+    get_backend().close()
+    if session is not None:
+        session.close()
+
+
+def check_inputs(config_dict):
+    """Check the headers of the input files before any processing starts."""
+    from jamr.input.preflight import preflight
+
+    problems = preflight(config_dict)
+    for problem in problems:
+        click.echo(problem, err=True)
+    if len(problems) > 0:
+        raise click.ClickException(f'Found {len(problems)} problem(s) with the input files')
+
+
 @click.group()
 def main(args=None):
     """Console script for jamr."""
@@ -37,51 +77,114 @@ def main(args=None):
     # return 0
 
 
-# @main.command()
-# @click.option('--config', default='config.toml', help='Path to configuration file')
-# def download(config):
-#     config_dict = parse_config(config)
-#     download_esacci_landcover(config_dict)
-#     download_esacci_waterbodies(config_dict)
-#     download_soilgrids250m(config_dict)
-#     download_soilgrids1000m(config_dict)
-#     # download_hydrography90m(config_dict)
-#     download_merit_dem(config_dict)
-#     download_merit_hydro(config_dict)
+DOWNLOAD_DATASETS = ['esacci_landcover', 'esacci_waterbodies', 'soilgrids250m', 'soilgrids1000m', 
+                     'hydrography90m', 'merit_dem', 'merit_hydro']
 
 
 @main.command()
 @click.option('--config', default='config.toml', help='Path to configuration file')
-def preprocess(config):
-    
+@click.option('--dataset', multiple=True, type=click.Choice(DOWNLOAD_DATASETS), help='Data set to download (default: all but hydrography90m)')
+@click.option('--overwrite', is_flag=True, help='Download files which exist already')
+def download(config, dataset, overwrite):
+    """Download the input data sets to the data directory."""
+    from jamr.download import download as downloads
+    from jamr.download.downloader import DownloadError
+
     setup_logging("output.log")
 
     config_dict = parse_config(config)
+    datasets = dataset or [name for name in DOWNLOAD_DATASETS if name != 'hydrography90m']
+    # Data sets are all attempted, so that one failure does not hold up the 
+    # others, and the run fails at the end if any files are missing
+    failed = []
+    for name in datasets:
+        try:
+            getattr(downloads, f'download_{name}')(config_dict, overwrite=overwrite)
+        except DownloadError as e:
+            click.echo(f'{name}: {e}', err=True)
+            failed.append(name)
+    if len(failed) > 0:
+        raise click.ClickException(f"Failed to download {', '.join(failed)}; run again to resume")
 
-    gisdb = config_dict['main']['grass_gis_database']
 
-    # Start GRASS session
+@main.command()
+@click.option('--config', default='config.toml', help='Path to configuration file')
+@click.option('--tile', type=int, default=None, help='Process a single tile, in its own mapset (tiled runs only)')
+@click.option('--mosaic', is_flag=True, help='Mosaic processed tiles and write output files (tiled runs only)')
+@click.option('--prepare', is_flag=True, help='Import input maps and build the coarse land index only (tiled runs only)')
+@click.option('--resume', is_flag=True, help='Skip steps completed by a previous run, as recorded in its journal')
+@click.option('--keep-intermediates', is_flag=True, help='Keep intermediate maps rather than removing them once they are no longer needed')
+@click.option('--plan', is_flag=True, help='List the steps of the run with estimates of their cost, without running them')
+@click.option('--skip-preflight', is_flag=True, help='Do not check the input files before importing them')
+def preprocess(config, tile, mosaic, prepare, resume, keep_intermediates, plan, skip_preflight):
+    config_dict = parse_config(config)
+    if plan:
+        from jamr.process.plan import Plan
+        click.echo(Plan(config_dict).format())
+        return
+
+    from jamr.input.input import InputData
+    from jamr.process.process import ProcessData
+    from jamr.process.journal import StepJournal
+    
+    setup_logging("output.log")
+
+    if keep_intermediates:
+        config_dict['main']['keep_intermediates'] = True
+
+    tiled = 'tiling' in config_dict
+    if (tile is not None or mosaic or prepare) and not tiled:
+        raise click.UsageError('--tile, --mosaic and --prepare require a [tiling] section in the configuration file')
+
+    if resume and tiled:
+        raise click.UsageError('--resume is not available for tiled runs')
+
+    if tiled:
+        # Tiles are processed in their own GRASS mapsets
+        if config_dict['main'].get('backend', 'grass') != 'grass':
+            raise click.UsageError('Tiled processing is only available with the GRASS backend')
+        from jamr.process.tiles import (TiledProcessData, target_tiles, tile_name)
 
-    session = start_session(gisdb = gisdb)
+    # Input maps are imported once, by a run which is not restricted to a 
+    # single tile or to mosaicking (e.g. with --prepare), unless they are 
+    # cloned from a snapshot
+    read = tile is None and not mosaic and 'snapshot' not in config_dict['main']
+    if read and not skip_preflight:
+        check_inputs(config_dict)
 
-    # FIXME This may not be necessary 
-    # Create regions
-    set_regions()
+    # Set the processing backend [starting a GRASS session for GRASS runs]
 
-    # Make sure we're not using external
-    r.external_out(flags='r')
+    mapset = None
+    if tile is not None:
+        mapset = tile_name(config_dict, target_tiles(config_dict)[tile])
+
+    session = start_backend(config_dict, mapset = mapset)
 
     # Raw data products:
     # ==================
 
     inputdata = InputData(config_dict, overwrite=False)
-    inputdata.initial()
+    inputdata.initial(read=read)
     inputdata.compute()
 
-    outputdata = ProcessData(config_dict, inputdata, overwrite=True)
-    outputdata.initial()
-    outputdata.compute()
-    outputdata.write()
+    if tiled:
+        outputdata = TiledProcessData(config_dict, inputdata, overwrite=True)
+        outputdata.initial()
+        if tile is not None:
+            outputdata.compute(tiles=[outputdata.tiles[tile]])
+        elif not prepare:
+            if not mosaic:
+                outputdata.compute()
+            outputdata.mosaic()
+            outputdata.write()
+    else:
+        # Completed steps are recorded in the output directory, so that a 
+        # failed run can be resumed with --resume
+        journal = StepJournal(config_dict['main']['output_directory'], config_dict, resume=resume)
+        outputdata = ProcessData(config_dict, inputdata, overwrite=True, journal=journal)
+        outputdata.initial()
+        outputdata.compute()
+        outputdata.write()
 
     # Derived data products:
     # ======================
@@ -98,8 +201,115 @@ def preprocess(config):
     # output_directory = config_dict['main']['output_directory']
     # os.makedirs(output_directory, exist_ok=True)
 
+    close_session(session)
+
+
+@main.command()
+@click.option('--config', default='config.toml', help='Path to configuration file')
+@click.option('--sites', required=True, help='CSV file of sites, with columns id, lat and lon')
+def points(config, sites):
+    from jamr.input.input import InputData
+    from jamr.process.points import (PointProcessData, read_sites)
+
+    setup_logging("output.log")
+
+    config_dict = parse_config(config)
+
+    # Only the input files are read, but the GRASS backend is used to 
+    # preprocess some of them
+    session = start_backend(config_dict)
+
+    # Only windows of the preprocessed input files around the sites are 
+    # read, so input maps are not imported
+    inputdata = InputData(config_dict, overwrite=False)
+    inputdata.initial(read=False)
+
+    outputdata = PointProcessData(config_dict, inputdata, read_sites(sites))
+    outputdata.compute()
+    outputdata.write()
+
+    close_session(session)
+
+
+@main.command()
+@click.option('--manifest', default='batch.toml', help='Path to batch manifest listing region configuration files')
+def batch(manifest):
+    from jamr.input.input import InputData
+    from jamr.process.batch import (read_manifest, run_batch, write_batch_summary)
+
+    setup_logging("output.log")
+
+    batch_dict = read_manifest(manifest)
+    configs = batch_dict['configs']
+
+    # All regions share the GRASS database and inputs of the first region
+    config_dict = configs[0]
+    if config_dict['main'].get('backend', 'grass') != 'grass':
+        raise click.UsageError('Batch runs are only available with the GRASS backend')
+    if 'snapshot' not in config_dict['main']:
+        check_inputs(config_dict)
+    session = start_backend(config_dict)
+
+    # Input maps are imported once into the PERMANENT mapset, where they are 
+    # visible to the mapsets of all regions, or cloned from a snapshot
+    inputdata = InputData(config_dict, overwrite=False)
+    inputdata.initial(read=('snapshot' not in config_dict['main']))
+    inputdata.compute()
     session.close()
 
+    # Regions are then run concurrently, each in its own mapset
+    summaries = run_batch(configs, nprocs=batch_dict['nprocs'])
+    write_batch_summary(summaries, batch_dict['output_directory'])
+
+
+@main.command()
+@click.option('--config', default='config.toml', help='Path to configuration file')
+@click.option('--output', required=True, help='Directory of the snapshot')
+def snapshot(config, output):
+    """Import the input maps and freeze them as a snapshot, which runs with 
+    `snapshot` set in the main section of their configuration clone."""
+    from jamr.input.input import InputData
+    from jamr.utils.snapshot import create_snapshot
+
+    setup_logging("output.log")
+
+    config_dict = parse_config(config)
+    if config_dict['main'].get('backend', 'grass') != 'grass':
+        raise click.UsageError('Snapshots are only available with the GRASS backend')
+
+    # Inputs are imported into the PERMANENT mapset of the GRASS database
+    config_dict['main'].pop('snapshot', None)
+    check_inputs(config_dict)
+    session = start_backend(config_dict)
+    inputdata = InputData(config_dict, overwrite=False)
+    inputdata.initial()
+    inputdata.compute()
+    close_session(session)
+
+    create_snapshot(config_dict['main']['grass_gis_database'], output, config_dict)
+
+
+@main.command()
+@click.option('--config', default='config.toml', help='Path to configuration file')
+def validate(config):
+    """Check a configuration file without reading any data."""
+    from jamr.config.config import validate_config
+
+    problems = validate_config(parse_config(config))
+    for problem in problems:
+        click.echo(problem)
+    if len(problems) > 0:
+        raise click.ClickException(f'{config} has {len(problems)} problem(s)')
+    click.echo(f'{config} is valid')
+
+
+@main.command()
+@click.option('--config', default='config.toml', help='Path to configuration file')
+def preflight(config):
+    """Check the headers of the input files against the configured region."""
+    check_inputs(parse_config(config))
+    click.echo('All input files can be used')
+
 
 @main.command()
 def process(config):
@@ -24,3 +24,65 @@ class Configuration:
 
     def soil(self):
         pass
+
+
+# Methods implemented for each step, as accepted by the factories in
+# jamr.process
+METHODS = {
+    'land_fraction': ['ESA'],
+    'frac': ['Poulter'],
+    'npft': [5, 9],
+    'soil_props': ['Cosby']
+}
+BACKENDS = ['grass', 'native', 'dask']
+
+
+def validate_config(config):
+    """Check a run configuration without reading any data.
+
+    Returns a list of problems, which is empty if the configuration is valid.
+    """
+    from jamr.backends.backend import STORAGE_PROFILES
+
+    problems = []
+    main = config.get('main', {})
+    backend = main.get('backend', 'grass')
+    if backend not in BACKENDS:
+        problems.append(f'[main] backend must be one of {BACKENDS}, not {backend!r}')
+    required = ['data_directory', 'scratch_directory', 'output_directory']
+    if backend == 'grass':
+        required.append('grass_gis_database')
+    for key in required:
+        if key not in main:
+            problems.append(f'[main] {key} is missing')
+
+    region = config.get('region', {})
+    for key in ['name', 'north', 'south', 'east', 'west']:
+        if key not in region:
+            problems.append(f'[region] {key} is missing')
+    if all(key in region for key in ['north', 'south', 'east', 'west']):
+        if region['north'] <= region['south'] or region['east'] <= region['west']:
+            problems.append('[region] north must exceed south and east must exceed west')
+
+    resolutions = sorted([float(res) for res in region.get('target_resolutions', [])])
+    for res in resolutions[1:]:
+        if abs(res / resolutions[0] - round(res / resolutions[0])) > 1e-6:
+            problems.append(f'Target resolution {res} is not a whole multiple of {resolutions[0]}')
+
+    methods = config.get('methods', {})
+    for key, valid in METHODS.items():
+        values = methods.get(key, [])
+        for value in (values if isinstance(values, list) else [values]):
+            if key == 'npft' and str(value).isdigit():
+                value = int(value)
+            if value not in valid:
+                problems.append(f'[methods] {key} must be one of {valid}, not {value!r}')
+
+    profile = config.get('storage', {}).get('profile', 'double')
+    if profile not in STORAGE_PROFILES:
+        problems.append(f'[storage] profile must be one of {STORAGE_PROFILES}, not {profile!r}')
+
+    if 'tiling' in config and backend != 'grass':
+        problems.append('Tiled processing is only available with the GRASS backend')
+
+    return problems
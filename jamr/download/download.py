@@ -1,80 +1,31 @@
 #!/usr/bin/env python3
 
 import os
-import requests
-import urllib.request
 import cdsapi
 import zipfile
 
-from urllib.error import HTTPError
-from urllib.parse import urlparse
-
 from osgeo import gdal, gdalconst
 
-from jamr.constants import (ESA_CCI_LC_YEARS,
-                            SOILGRIDS_VARIABLES,
-                            SOILGRIDS_HORIZONS)
-
-
-def download_http_file(url, username, password, local_filename):
-    try:
-        # # Parse the URL to extract the hostname and path
-        # parsed_url = urlparse(url)
-        # hostname = parsed_url.hostname
-        # path = parsed_url.path
-
-        # # Create a password manager
-        # password_mgr = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-        # password_mgr.add_password(None, hostname, username, password)
-
-        # # Create an HTTP Basic Authentication handler
-        # auth_handler = urllib.request.HTTPBasicAuthHandler(password_mgr)
-
-        # # Create an opener with the authentication handler
-        # opener = urllib.request.build_opener(auth_handler)
-
-        # # Install the opener
-        # urllib.request.install_opener(opener)
-
-        # # # Download the file from the URL and save it to the local file
-        # # urllib.request.urlretrieve(url, local_filename)
+from jamr.download.downloader import (Downloader, DownloadJob)
+from jamr.utils.constants import (ESA_CCI_LC_YEARS,
+                                  SG_HORIZONS,
+                                  SG_VARIABLES,
+                                  SG_VARIABLES_ABBR)
 
-        # # Open the URL and read the content
-        # with opener.open(url) as response:
-        #     content = response.read()
+# Variables and horizons as named in the SoilGrids file names
+SOILGRIDS_VARIABLES = [SG_VARIABLES_ABBR[variable] for variable in SG_VARIABLES]
+SOILGRIDS_HORIZONS = list(dict.fromkeys(SG_HORIZONS))
 
-        # # Write the content to the local file
-        # with open(local_filename, 'wb') as file:
-        #     file.write(content)
 
-        # Send an HTTP GET request with authentication
-        response = requests.get(url, auth=(username, password))
-
-        # Check if the request was successful (status code 200)
-        if response.status_code == 200:
-            # Write the response content to the local file
-            with open(local_filename, 'wb') as file:
-                file.write(response.content)
-
-        print(f"File downloaded successfully to '{local_filename}'.")
-    except HTTPError as e:
-        print(f"HTTP Error: {e}")
-    except Exception as e:
-        print(f"Error: {e}")
-    return 0
+def download_http_file(url, username, password, local_filename):
+    """Download a single file over HTTP(S), with basic authentication."""
+    auth = (username, password) if username is not None else None
+    return Downloader().fetch(DownloadJob(url, local_filename, auth))
 
 
 def download_ftp_file(hostname, remote_filename, local_filename):
-    try:
-        # Build FTP URL
-        ftp_url = f"ftp://{hostname}/{remote_filename}"
-
-        # Download the file
-        urllib.request.urlretrieve(ftp_url, local_filename)
-
-        print(f"File '{remote_filename}' downloaded successfully.")
-    except Exception as e:
-        print(f"Error: {e}")
+    """Download a single file by anonymous FTP."""
+    return Downloader().fetch(DownloadJob(f"ftp://{hostname}/{remote_filename.lstrip('/')}", local_filename))
 
 
 def unpack_zip(zip_filename, extract_to):
@@ -96,17 +47,6 @@ def zip_contents(zip_filename):
     return contents
 
 
-def _download_esacci_landcover_ftp(year, dest, overwrite):
-    hostname = 'geo10.elie.ucl.ac.be'
-    filename = f'ESACCI-LC-L4-LCCS-Map-300m-P1Y-{year}-v2.0.7.tif'
-    remote_filename = os.path.join('CCI/LandCover/byYear', filename)
-    local_filename = os.path.join(dest, filename)
-    if not os.path.exists(local_filename) or overwrite:
-        download_ftp_file(hostname, remote_filename, local_filename)
-
-    return 0
-
-
 def _download_esacci_landcover_cds(year, dest, overwrite):
 
     if year <= 2015:
@@ -155,10 +95,18 @@ def _download_esacci_landcover_cds(year, dest, overwrite):
 def download_esacci_landcover(config, overwrite=False):
     dest = os.path.join(config['main']['data_directory'], 'ESACCI_LC')
     os.makedirs(dest, exist_ok=True)
+
+    # Years to 2015 are on the FTP server, and later years in the CDS
+    hostname = 'geo10.elie.ucl.ac.be'
+    jobs = []
     for year in ESA_CCI_LC_YEARS:
         if year <= 2015:
-            _download_esacci_landcover_ftp(year, dest, overwrite)
-        else:
+            filename = f'ESACCI-LC-L4-LCCS-Map-300m-P1Y-{year}-v2.0.7.tif'
+            jobs.append(DownloadJob(f'ftp://{hostname}/CCI/LandCover/byYear/{filename}', os.path.join(dest, filename)))
+    Downloader.from_config(config).download(jobs, overwrite=overwrite)
+
+    for year in ESA_CCI_LC_YEARS:
+        if year > 2015:
             _download_esacci_landcover_cds(year, dest, overwrite)
     return 0
 
@@ -170,7 +118,8 @@ def download_esacci_waterbodies(config, overwrite=False):
     filename = 'ESACCI-LC-L4-WB-Ocean-Land-Map-150m-P13Y-2000-v4.0.tif'
     remote_filename = os.path.join('CCI/WaterBodies', filename)
     local_filename = os.path.join(dest, filename)
-    download_ftp_file(hostname, remote_filename, local_filename)
+    if not os.path.exists(local_filename) or overwrite:
+        download_ftp_file(hostname, remote_filename, local_filename)
     return 0
 
 
@@ -195,13 +144,13 @@ def download_soilgrids250m(config, overwrite=False):
 def download_soilgrids1000m(config, overwrite=False):
     dest = os.path.join(config['main']['data_directory'], 'SoilGrids_1000m')
     os.makedirs(dest, exist_ok=True)
-    kwargs = {'format': 'GTiff', 'creationOptions': ["TILED=YES", "COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"]}
+    jobs = []
     for var in SOILGRIDS_VARIABLES:
         for horizon in SOILGRIDS_HORIZONS:
             filename = f'{var}_{horizon}_mean_1000.tif'
             http_url = f'https://files.isric.org/soilgrids/latest/data_aggregated/1000m/{var}/{filename}'
-            local_filename = os.path.join(dest, filename)
-            urllib.request.urlretrieve(http_url, local_filename)
+            jobs.append(DownloadJob(http_url, os.path.join(dest, filename)))
+    Downloader.from_config(config).download(jobs, overwrite=overwrite)
 
 
 def download_hydrography90m(config, overwrite=False):
@@ -209,18 +158,23 @@ def download_hydrography90m(config, overwrite=False):
     os.makedirs(dest, exist_ok=True)
 
     # Get the tile list, which we will use to download the dataset
+    downloader = Downloader.from_config(config)
     tmpdir = os.environ.get('TMPDIR', '/tmp')
-    urllib.request.urlretrieve(
+    tile_list = os.path.join(tmpdir, "tile_list.txt")
+    downloader.fetch(DownloadJob(
         "https://gitlab.com/selvaje74/hydrography.org/-/raw/main/images/hydrography90m/tiles20d/tile_list.txt",
-        os.path.join(tmpdir, "tile_list.txt")
-    )
-    with open(os.path.join(tmpdir, "tile_list.txt"), "r") as f:
+        tile_list
+    ))
+    jobs = []
+    with open(tile_list, "r") as f:
         for tile in f:
             tile = tile.strip()
+            if tile == '':
+                continue
             filename = f'cti_{tile}.tif'
             http_url = f'https://public.igb-berlin.de/index.php/s/agciopgzXjWswF4/download?path=%2Fflow.index%2Fcti_tiles20d&files={filename}'
-            local_filename = os.path.join(dest, filename)
-            urllib.request.urlretrieve(http_url, local_filename)
+            jobs.append(DownloadJob(http_url, os.path.join(dest, filename)))
+    downloader.download(jobs, overwrite=overwrite)
 
 
 MERIT_DEM_USERNAME = 'globaldem'
@@ -233,23 +187,28 @@ MERIT_LONGITUDES = ['w' + str(w).zfill(3) for w in range(180, 0, -30)] + ['e' +
 def download_merit_dem(config, overwrite=False):
     dest = os.path.join(config['main']['data_directory'], 'MERIT', 'dem')
     os.makedirs(dest, exist_ok=True)
+
+    # Tiles which are entirely ocean are not available, and are skipped
+    jobs = []
     for lat in MERIT_LATITUDES:
         for lon in MERIT_LONGITUDES:
             filename = f'dem_tif_{lat}{lon}.tar'
             http_url = f'http://hydro.iis.u-tokyo.ac.jp/~yamadai/MERIT_DEM/distribute/v1.0.2/{filename}'
-            local_filename = os.path.join(dest, filename)
-            download_http_file(http_url, MERIT_DEM_USERNAME, MERIT_DEM_PASSWORD, local_filename)
+            jobs.append(DownloadJob(http_url, os.path.join(dest, filename), (MERIT_DEM_USERNAME, MERIT_DEM_PASSWORD)))
+    Downloader.from_config(config).download(jobs, overwrite=overwrite)
 
 
 def download_merit_hydro(config, overwrite=False):
     dest_root = os.path.join(config['main']['data_directory'], 'MERIT', 'hydro')
+    jobs = []
     for var in MERIT_HYDRO_VARS:
         for lat in MERIT_LATITUDES:
             for lon in MERIT_LONGITUDES:
                 dest = os.path.join(dest_root, var)
-                os.makedirs(dest, exist_ok=True)
                 filename = f'{var}_{lat}{lon}.tar'
                 http_url = f'http://hydro.iis.u-tokyo.ac.jp/~yamadai/MERIT_Hydro/distribute/v1.0/{filename}'
-                local_filename = os.path.join(dest, filename)
-                download_http_file(http_url, MERIT_HYDRO_USERNAME, MERIT_HYDRO_PASSWORD, local_filename)
+                jobs.append(DownloadJob(
+                    http_url, os.path.join(dest, filename), (MERIT_HYDRO_USERNAME, MERIT_HYDRO_PASSWORD)
+                ))
+    Downloader.from_config(config).download(jobs, overwrite=overwrite)
 
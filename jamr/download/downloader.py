@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import ftplib
+import logging
+import threading
+
+from collections import namedtuple
+from concurrent.futures import (ThreadPoolExecutor, as_completed)
+from urllib.parse import (unquote, urlparse)
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+LOGGER = logging.getLogger(__name__)
+
+DownloadJob = namedtuple('DownloadJob', ['url', 'local_filename', 'auth'], defaults=(None,))
+
+# Suffix of partly downloaded files, which are resumed by later attempts
+PARTIAL_SUFFIX = '.part'
+
+# Size (bytes) of the chunks streamed to disk
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# HTTP status codes of transient errors, which are retried. Other client
+# errors are not, and 404 (e.g. for MERIT tiles over the ocean) means that
+# the file is not available
+RETRY_STATUS_CODES = [408, 429, 500, 502, 503, 504]
+
+
+class DownloadError(Exception):
+    """Files could not be downloaded.
+
+    Parameters
+    ----------
+    message : str
+        Description of the failure.
+    jobs : list, optional
+        The jobs which failed.
+    """
+    def __init__(self, message, jobs=None):
+        super().__init__(message)
+        self.jobs = jobs if jobs is not None else []
+
+
+class FileNotAvailable(DownloadError):
+    """The server does not have the requested file."""
+
+
+def _content_range_total(response):
+    # Total size in the Content-Range of partial (206) and unsatisfiable
+    # range (416) responses, e.g. 'bytes 0-99/1000' or 'bytes */1000'
+    if 'Content-Range' not in response.headers:
+        return None
+    total = response.headers['Content-Range'].rsplit('/', 1)[-1]
+    return int(total) if total.strip().isdigit() else None
+
+
+def _http_total_size(response, offset):
+    # The total size is given by the Content-Range of partial responses
+    if response.status_code == 206 and 'Content-Range' in response.headers:
+        return _content_range_total(response)
+    if 'Content-Length' in response.headers:
+        return int(response.headers['Content-Length']) + (offset if response.status_code == 206 else 0)
+    return None
+
+
+class Downloader:
+    """Download files concurrently over HTTP(S) and FTP.
+
+    Files are streamed to a partial file next to the destination, which is
+    renamed once the download is complete, so that a destination file is
+    always whole. Interrupted downloads are resumed from the partial file
+    (with HTTP Range requests or the FTP REST command), and failed attempts
+    are retried with exponential backoff. HTTP sessions are kept for each
+    worker thread, so that connections are reused.
+
+    Parameters
+    ----------
+    nworkers : int
+        Number of files downloaded at once.
+    retries : int
+        Number of times a failed download is retried.
+    backoff : float
+        Delay (seconds) before the first retry, doubled for each later one.
+    timeout : float
+        Timeout (seconds) of connecting to and reading from a server.
+    chunk_size : int
+        Size (bytes) of the chunks streamed to disk.
+    """
+    def __init__(self, nworkers=4, retries=5, backoff=2.0, timeout=60, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.nworkers = nworkers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, config):
+        """Downloader with the options in the `download` section of the
+        configuration."""
+        options = config.get('download', {})
+        return cls(
+            nworkers=int(options.get('nworkers', 4)),
+            retries=int(options.get('retries', 5)),
+            backoff=float(options.get('backoff', 2.0)),
+            timeout=float(options.get('timeout', 60))
+        )
+
+    @property
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return self._local.session
+
+    def download(self, jobs, overwrite=False):
+        """Download files, skipping those which exist unless `overwrite` is
+        True.
+
+        Files which the server does not have (HTTP 404 or FTP 550, e.g. 
+        MERIT tiles over the ocean) are skipped, and the jobs of these files 
+        are returned. All other files are attempted before DownloadError is 
+        raised for those which could not be downloaded after all retries.
+        """
+        jobs = [job for job in jobs if overwrite or not os.path.exists(job.local_filename)]
+        not_available = []
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.nworkers) as executor:
+            futures = {executor.submit(self.fetch, job): job for job in jobs}
+            for i, future in enumerate(as_completed(futures)):
+                job = futures[future]
+                try:
+                    future.result()
+                    LOGGER.info(f'[{i + 1}/{len(jobs)}] Downloaded {job.local_filename}')
+                except FileNotAvailable as e:
+                    LOGGER.warning(f'[{i + 1}/{len(jobs)}] {e}')
+                    not_available.append(job)
+                except Exception as e:
+                    LOGGER.error(f'[{i + 1}/{len(jobs)}] Failed to download {job.url}: {e}')
+                    failed.append(job)
+        if len(failed) > 0:
+            raise DownloadError(
+                f'{len(failed)} of {len(jobs)} files could not be downloaded, including {failed[0].url}', failed
+            )
+        return not_available
+
+    def fetch(self, job):
+        """Download a single file, retrying failed attempts."""
+        os.makedirs(os.path.dirname(os.path.abspath(job.local_filename)), exist_ok=True)
+        partial_filename = job.local_filename + PARTIAL_SUFFIX
+        scheme = urlparse(job.url).scheme
+        for attempt in range(self.retries + 1):
+            try:
+                if scheme == 'ftp':
+                    self._fetch_ftp(job, partial_filename)
+                else:
+                    self._fetch_http(job, partial_filename)
+                break
+            except DownloadError:
+                raise
+            except (requests.RequestException, ftplib.Error, OSError, EOFError) as e:
+                if attempt == self.retries:
+                    raise DownloadError(f'Failed to download {job.url} after {self.retries + 1} attempts: {e}', [job]) from e
+                delay = self.backoff * 2 ** attempt
+                LOGGER.warning(f'Downloading {job.url} failed ({e}), retrying in {delay:g}s')
+                time.sleep(delay)
+
+        os.replace(partial_filename, job.local_filename)
+        return job.local_filename
+
+    def _http_size(self, job):
+        """Size of a file given by the Content-Length of a HEAD request, or 
+        None."""
+        response = self.session.head(
+            job.url, auth=job.auth, headers={'Accept-Encoding': 'identity'}, 
+            allow_redirects=True, timeout=self.timeout
+        )
+        if response.ok and 'Content-Length' in response.headers:
+            return int(response.headers['Content-Length'])
+        return None
+
+    def _fetch_http(self, job, partial_filename):
+        offset = os.path.getsize(partial_filename) if os.path.exists(partial_filename) else 0
+        # Content encoding is disabled so that sizes are those of the file
+        headers = {'Accept-Encoding': 'identity'}
+        if offset > 0:
+            headers['Range'] = f'bytes={offset}-'
+        with self.session.get(job.url, auth=job.auth, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # The range starts at or beyond the end of the file, so the 
+                # partial file is complete, or else is not part of the file
+                # (e.g. because the file has changed on the server)
+                total = _content_range_total(response)
+                if total is None:
+                    total = self._http_size(job)
+                if total is not None and offset == total:
+                    return
+                LOGGER.warning(f'Restarting download of {job.url}: the partial file has {offset} of {total} bytes')
+                restart = True
+            else:
+                restart = False
+                if response.status_code == 404:
+                    raise FileNotAvailable(f'{job.url} is not available')
+                if response.status_code >= 400 and response.status_code not in RETRY_STATUS_CODES:
+                    # e.g. 401 for wrong credentials, which are not retried
+                    raise DownloadError(f'{job.url} returned status {response.status_code}', [job])
+                response.raise_for_status()
+
+                # Servers which ignore the Range header send the whole file
+                if response.status_code != 206:
+                    offset = 0
+                total = _http_total_size(response, offset)
+                with open(partial_filename, 'ab' if offset > 0 else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+
+        if restart:
+            os.remove(partial_filename)
+            return self._fetch_http(job, partial_filename)
+
+        size = os.path.getsize(partial_filename)
+        if total is not None and size != total:
+            raise OSError(f'Incomplete download of {job.url} ({size} of {total} bytes)')
+
+    def _fetch_ftp(self, job, partial_filename):
+        url = urlparse(job.url)
+        user, password = job.auth if job.auth is not None else (url.username or 'anonymous', url.password or '')
+        offset = os.path.getsize(partial_filename) if os.path.exists(partial_filename) else 0
+        with ftplib.FTP(timeout=self.timeout) as ftp:
+            ftp.connect(url.hostname, url.port or 21)
+            ftp.login(user, password)
+            ftp.voidcmd('TYPE I')
+            path = unquote(url.path)
+            try:
+                total = ftp.size(path)
+            except ftplib.error_perm as e:
+                if str(e).startswith('550'):
+                    raise FileNotAvailable(f'{job.url} is not available ({e})')
+                raise DownloadError(f'{job.url} could not be downloaded ({e})', [job])
+            if total is not None and offset == total:
+                return
+            if total is not None and offset > total:
+                offset = 0
+            with open(partial_filename, 'ab' if offset > 0 else 'wb') as f:
+                ftp.retrbinary(f'RETR {path}', f.write, blocksize=self.chunk_size, rest=offset or None)
+
+        size = os.path.getsize(partial_filename)
+        if total is not None and size != total:
+            raise OSError(f'Incomplete download of {job.url} ({size} of {total} bytes)')
@@ -3,14 +3,10 @@ import os
 import xarray
 import logging
 
-from subprocess import PIPE
-
-import grass.script as gscript
-
 from osgeo import gdal
 
+from jamr.backends.backend import get_backend
 from jamr.input.dataset import SFDS
-from jamr.utils.grass_utils import *
 
 
 LOGGER = logging.getLogger(__name__)
@@ -22,9 +18,10 @@ class C4Fraction(SFDS):
         self.variables = ['C4_area', 'C4_grass_area', 'C4_crop_area']
         super().__init__(config, overwrite)
         
-    def initial(self):
+    def initial(self, read=True):
         self.preprocess()
-        self.read()
+        if read:
+            self.read()
 
     def get_input_filenames(self):
         self.filenames = [self.config['landcover']['c4']['data_file']]
@@ -75,13 +72,6 @@ class C4Fraction(SFDS):
                 input_file = self.preprocessed_filenames[year][variable]
                 mapname = self.mapnames[year][variable]
                 print("Hello, world")
-                p = gscript.start_command('r.in.gdal', 
-                                          input=input_file, 
-                                          output=mapname, 
-                                          overwrite=True,
-                                        #   overwrite=self.overwrite,
-                                          stderr=PIPE)
-                stdout, stderr = p.communicate()
+                get_backend().import_raster(input_file, mapname, overwrite=True)
                 # Set null values to zero
-                p = gscript.start_command('r.null', map=mapname, null=0, stderr=PIPE)
-                stdout, stderr = p.communicate()
+                get_backend().fill_nulls(mapname, 0)
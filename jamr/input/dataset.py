@@ -4,7 +4,6 @@ import os
 import re
 import glob
 import logging
-import grass.script as gscript
 
 from abc import ABC, abstractmethod
 
@@ -6,16 +6,7 @@ import glob
 
 from abc import ABC, abstractmethod
 
-import grass.script as gscript
-import grass.exceptions 
-
-# import grass python libraries
-from grass.pygrass.modules.shortcuts import general as g
-from grass.pygrass.modules.shortcuts import raster as r
-
-from osgeo import gdal
-
-from jamr.utils.grass_utils import grass_maplist
+from jamr.backends.backend import get_backend
 from jamr.utils.constants import REGIONS
 from jamr.input.dataset import DS
 
@@ -37,9 +28,10 @@ class MERITDEM(DS):
         self.merit_regions = ['globe_0.008333Deg', 'globe_0.004167Deg', 'globe_0.002778Deg']
         super().__init__(config, overwrite)
 
-    def initial(self):
+    def initial(self, read=True):
         self.preprocess()
-        self.read()
+        if read:
+            self.read()
 
     def get_input_filenames(self):
         data_directory = self.config['topography']['merit']['data_directory']
@@ -59,6 +51,9 @@ class MERITDEM(DS):
         self.mapnames = mapnames
 
     def preprocess(self):
+        # Imported here so that input file names can be listed without GDAL
+        from osgeo import gdal
+
         scratch = self.config['main']['scratch_directory']
         os.makedirs(scratch, exist_ok=True) # Just in case it's not been created yet
         preprocessed_filenames = {}
@@ -68,22 +63,13 @@ class MERITDEM(DS):
             rgn_filenames = []
             for f in self.filenames:
                 lat, lon = parse_merit_filename(f)
-                mapname=f'merit_dem_avg_{lat}_{lon}_{rgn}'
                 outfile = os.path.join(scratch, f'merit_dem_avg_{lat}_{lon}_{rgn}.tif')
                 rgn_filenames.append(outfile)
                 if os.path.exists(outfile) and not self.overwrite:
                     continue 
                 
-                # Import MERIT data file [note overwrite=True]
-                r.in_gdal(input=f, output=f'merit_dem', flags='a', overwrite=True)
-
-                # for rgn in merit_regions:
-                g.region(raster='merit_dem', res=resolution)
-                try:
-                    r.resamp_stats(input='merit_dem', output=mapname, method='average', overwrite=True)
-                except grass.exceptions.CalledModuleError:
-                    pass
-                r.out_gdal(input=mapname, output=outfile, createopt='COMPRESS=DEFLATE', overwrite=True)
+                # Aggregate MERIT data file to the resolution of the region
+                get_backend().aggregate_file(f, outfile, res=resolution, method='average')
 
             # Build VRT
             vrt_fn = os.path.join(scratch, f'merit_dem_{rgn}.vrt')
@@ -103,27 +89,12 @@ class MERITDEM(DS):
             input_filename = self.preprocessed_filenames[rgn]
             mapname = self.mapnames[rgn]
 
-            maplist = grass_maplist(pattern=mapname)
-            if (len(maplist) == 1) and not self.overwrite:
+            if get_backend().map_exists(mapname, mapset='PERMANENT') and not self.overwrite:
                 continue
 
-            try:
-                r.in_gdal(input=input_filename, output=mapname + '_tmp', flags='a', overwrite=True)
-            except grass.exceptions.CalledModuleError:
-                pass 
-
-            # This is needed to fix subtle errors in bounds
+            # Copying the map fixes subtle errors in bounds
             # FIXME - see whether this is still needed even with the 'a' flag to r.in.gdal
-            try:
-                r.mapcalc(f'{mapname} = {mapname}_tmp', overwrite=True)
-            except grass.exceptions.CalledModuleError:
-                pass 
-
-            # # Write a copy to scratch directory
-            # r.out_gdal(input=f'merit_dem_{rgn}', output=os.path.join(scratch, f'merit_dem_{rgn}.tif'), createopt='COMPRESS=DEFLATE,BIGTIFF=YES', overwrite=True)
-
-            # Clean up
-            g.remove(type='raster', name=f'{mapname}_tmp', flags='f')
+            get_backend().import_raster(input_filename, mapname, overwrite=True, flags='a', fix_bounds=True)
 
             # TODO this should be separate from the input dataset 
             # # Create slope map [needed for PDM] 
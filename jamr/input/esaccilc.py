@@ -5,10 +5,8 @@ import logging
 from typing import List 
 from pathlib import Path
 from collections import namedtuple
-from subprocess import PIPE, DEVNULL
-
-import grass.script as gscript
 
+from jamr.backends.backend import get_backend
 from jamr.input.dataset import SFDS, MFDS
 from jamr.utils import *
 
@@ -21,9 +19,10 @@ class ESACCIWB(SFDS):
     def __init__(self, config, overwrite):
         super().__init__(config, overwrite)
 
-    def initial(self):
+    def initial(self, read=True):
         self.preprocess()
-        self.read()
+        if read:
+            self.read()
 
     def get_input_filenames(self):
         self.filenames = [self.config['landfraction']['esa']['data_file']]
@@ -33,8 +32,7 @@ class ESACCIWB(SFDS):
 
     def read(self):
         LOGGER.info('Importing ESA CCI Water Bodies map')
-        p = gscript.start_command('r.in.gdal', input=self.preprocessed_filename, output=self.mapname, stderr=PIPE)
-        stdout, stderr = p.communicate()
+        get_backend().import_raster(self.preprocessed_filename, self.mapname)
 
 
 class ESACCILC(MFDS):
@@ -49,9 +47,10 @@ class ESACCILC(MFDS):
         ]
         super().__init__(config, overwrite)
 
-    def initial(self):
+    def initial(self, read=True):
         self.preprocess()
-        self.read()
+        if read:
+            self.read()
 
     def _get_filename(self, year):
         if int(year) <= 2015:
@@ -78,10 +77,7 @@ class ESACCILC(MFDS):
             LOGGER.info(f'Importing land cover map for {year}')
             filename = self.preprocessed_filenames[year]
             mapname = self.mapnames[year]
-            # This approach allows us to hide stdout/stderr:
-            # https://grass.osgeo.org/grass83/manuals/libpython/pygrass_modules.html
-            p = gscript.start_command('r.in.gdal', input=filename, output=mapname, stderr=PIPE)
-            stdout, stderr = p.communicate()
+            get_backend().import_raster(filename, mapname)
 
     def __getitem__(self, index):
         return self.mapnames[index]
@@ -1,8 +1,6 @@
 
 import os 
 
-import grass.script as gscript
-
 from jamr.input.soilgrids import SoilGrids
 from jamr.input.elevation import MERITDEM
 from jamr.input.esaccilc import ESACCIWB, ESACCILC
@@ -33,13 +31,15 @@ class InputData:
         self.c4fraction = C4Fraction(config, overwrite)
         self.overwrite = overwrite
 
-    def initial(self):
-        self.landcover.initial()
-        self.waterbodies.initial()
-        self.soil.initial()
-        self.elevation.initial()
-        self.ecoregions.initial()
-        self.c4fraction.initial() 
+    def initial(self, read=True):
+        # With read=False, input maps are assumed to have been imported 
+        # already (e.g. when processing a tile in a separate mapset)
+        self.landcover.initial(read)
+        self.waterbodies.initial(read)
+        self.soil.initial(read)
+        self.elevation.initial(read)
+        self.ecoregions.initial(read)
+        self.c4fraction.initial(read) 
 
     def compute(self):
         pass
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import os
+import zipfile
+import logging
+
+from jamr.input.elevation import (MERITDEM, parse_merit_filename)
+from jamr.input.esaccilc import (ESACCILC, ESACCIWB)
+from jamr.input.soilgrids import (SoilGrids, SoilGridsHorizon)
+from jamr.utils.headers import read_header
+
+LOGGER = logging.getLogger(__name__)
+
+# Resolutions (degrees) and band types expected of the input files
+ESA_CCI_LC_RES = 1 / 360.
+ESA_CCI_WB_RES = 1 / 720.
+MERIT_DEM_RES = 1 / 1200.
+ESA_CCI_DTYPES = ['uint8']
+SOILGRIDS_DTYPES = ['int16', 'uint16', 'int32', 'float32']
+MERIT_DEM_DTYPES = ['float32']
+
+# Contents of the C4 fraction and ecoregions files read by the input classes
+C4_FRACTION_VARIABLES = ['C4_area', 'C4_grass_area', 'C4_crop_area']
+C4_FRACTION_DIMENSIONS = ('years', 'lat', 'lon')
+TEOW_SHAPEFILE = 'official/wwf_terr_ecos.shp'
+
+
+def _region_bounds(config):
+    rgn = config['region']
+    return rgn['west'], rgn['south'], rgn['east'], rgn['north']
+
+
+def _covers(bounds, region_bounds, tol):
+    left, bottom, right, top = bounds
+    west, south, east, north = region_bounds
+    return left <= west + tol and bottom <= south + tol and right >= east - tol and top >= north - tol
+
+
+def _intersects(bounds, region_bounds):
+    left, bottom, right, top = bounds
+    west, south, east, north = region_bounds
+    return left < east and right > west and bottom < north and top > south
+
+
+def check_raster(label, filename, region_bounds, dtypes, res=None, projected_res=None, coverage=True):
+    """Check the header of an input raster, returning a list of problems.
+
+    `res` is the expected resolution (degrees) of files in geographic 
+    coordinates, and `projected_res` that (e.g. metres) of files in 
+    projected coordinates.
+    """
+    # rasterio is imported on demand, as in jamr.utils.headers
+    from rasterio.crs import CRS
+    from rasterio.errors import (CRSError, RasterioIOError)
+    from rasterio.warp import transform_bounds
+
+    try:
+        header = read_header(filename)
+    except RasterioIOError as e:
+        # e.g. truncated downloads
+        return [f'{label}: {filename} could not be read ({e})']
+    if header is None:
+        return [f'{label}: {filename} does not exist']
+
+    problems = []
+    if header.crs is None:
+        return [f'{label}: {filename} has no coordinate reference system']
+
+    try:
+        crs = CRS.from_string(header.crs)
+    except CRSError as e:
+        return [f'{label}: {filename} has a coordinate reference system which cannot be used ({e})']
+    if header.count != 1:
+        problems.append(f'{label}: {filename} has {header.count} bands, not 1')
+    if header.dtypes[0] not in dtypes:
+        problems.append(f'{label}: {filename} has band type {header.dtypes[0]}, not one of {dtypes}')
+    xres, yres = header.res
+    expected_res, units = (res, 'degrees') if crs.is_geographic else (projected_res, crs.linear_units)
+    if expected_res is not None and (
+            abs(xres - expected_res) > 1e-3 * expected_res or abs(yres - expected_res) > 1e-3 * expected_res):
+        problems.append(
+            f'{label}: {filename} has resolution {xres:.6g} x {yres:.6g} {units}, not {expected_res:.6g}'
+        )
+    if crs.is_geographic:
+        if coverage and not _covers(header.bounds, region_bounds, tol=max(xres, yres) / 2):
+            problems.append(f'{label}: {filename} with bounds {header.bounds} does not cover the region {region_bounds}')
+    elif coverage:
+        # Inputs in projected coordinates (e.g. SoilGrids in the Interrupted
+        # Goode Homolosine projection) are warped to latitude/longitude
+        try:
+            projected_bounds = transform_bounds('EPSG:4326', crs, *region_bounds)
+        except Exception:
+            LOGGER.warning(f'{label}: could not transform the region to the coordinates of {filename}')
+        else:
+            if not _covers(header.bounds, projected_bounds, tol=max(header.res) / 2):
+                problems.append(f'{label}: {filename} does not cover the region {region_bounds}')
+    return problems
+
+
+def check_c4_fraction(filename):
+    # netCDF4 is imported on demand, so that the checks start quickly
+    import netCDF4
+
+    if not os.path.exists(filename):
+        return [f'C4 fraction: {filename} does not exist']
+
+    problems = []
+    try:
+        with netCDF4.Dataset(filename) as nc:
+            for variable in C4_FRACTION_VARIABLES:
+                if variable not in nc.variables:
+                    problems.append(f'C4 fraction: {filename} has no variable {variable}')
+                elif set(nc.variables[variable].dimensions) != set(C4_FRACTION_DIMENSIONS):
+                    problems.append(
+                        f'C4 fraction: variable {variable} of {filename} has dimensions '
+                        f'{nc.variables[variable].dimensions}, not {C4_FRACTION_DIMENSIONS}'
+                    )
+    except (OSError, RuntimeError) as e:
+        # netCDF4 raises these for files which are not netCDF or are truncated
+        return [f'C4 fraction: {filename} could not be read ({e})']
+    return problems
+
+
+def check_ecoregions(filename):
+    if not os.path.exists(filename):
+        return [f'Ecoregions: {filename} does not exist']
+    if not zipfile.is_zipfile(filename):
+        return [f'Ecoregions: {filename} is not a zip archive']
+    try:
+        with zipfile.ZipFile(filename) as f:
+            if TEOW_SHAPEFILE not in f.namelist():
+                return [f'Ecoregions: {filename} does not contain {TEOW_SHAPEFILE}']
+    except zipfile.BadZipFile as e:
+        return [f'Ecoregions: {filename} could not be read ({e})']
+    return []
+
+
+def preflight(config):
+    """Check the input files of a run against the configured region.
+
+    Only the headers of the files are read, so that missing or mismatched
+    inputs are found before any processing starts. Returns a list of
+    problems, which is empty if all inputs can be used.
+    """
+    region_bounds = _region_bounds(config)
+    problems = []
+
+    landcover = ESACCILC(config, False)
+    for year in landcover.years:
+        problems += check_raster(
+            f'ESA CCI land cover {year}', landcover.filenames[year], region_bounds,
+            ESA_CCI_DTYPES, res=ESA_CCI_LC_RES
+        )
+
+    waterbodies = ESACCIWB(config, False)
+    problems += check_raster(
+        'ESA CCI water bodies', waterbodies.filename, region_bounds, ESA_CCI_DTYPES, res=ESA_CCI_WB_RES
+    )
+
+    try:
+        soil = SoilGrids(config, False)
+    except ValueError:
+        problems.append('SoilGrids: the variables, horizons, resolution or summary statistic are not valid')
+    else:
+        for horizon in soil.horizons:
+            horizon_obj = SoilGridsHorizon(
+                config, soil.data_directory, soil.scratch_directory, soil.variables,
+                soil.resolution, soil.summary_statistic, horizon, False
+            )
+            for variable, filename in horizon_obj.filenames.items():
+                # SoilGrids resolutions are given in metres, which are nominally
+                # 1 / 120 degrees per kilometre
+                problems += check_raster(
+                    f'SoilGrids {variable} {horizon}', os.path.join(soil.data_directory, filename),
+                    region_bounds, SOILGRIDS_DTYPES, res=soil.resolution / 120000.,
+                    projected_res=float(soil.resolution)
+                )
+
+    # MERIT tiles are missing over the ocean, so the region is not required
+    # to be covered, but the tiles within it are checked
+    elevation = MERITDEM(config, False)
+    if len(elevation.filenames) == 0:
+        problems.append(f"MERIT DEM: no tiles found in {config['topography']['merit']['data_directory']}")
+    tiles = []
+    for filename in elevation.filenames:
+        lat, lon = parse_merit_filename(os.path.basename(filename))
+        south = int(lat[1:]) * (1 if lat[0] == 'n' else -1)
+        west = int(lon[1:]) * (1 if lon[0] == 'e' else -1)
+        if _intersects((west, south, west + 5, south + 5), region_bounds):
+            tiles.append(filename)
+    if len(elevation.filenames) > 0 and len(tiles) == 0:
+        LOGGER.warning('MERIT DEM: no tiles intersect the region')
+    for filename in tiles:
+        problems += check_raster(
+            'MERIT DEM', filename, region_bounds, MERIT_DEM_DTYPES, res=MERIT_DEM_RES, coverage=False
+        )
+
+    problems += check_c4_fraction(config['landcover']['c4']['data_file'])
+    problems += check_ecoregions(config['landcover']['teow']['data_file'])
+    return problems
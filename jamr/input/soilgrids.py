@@ -3,13 +3,9 @@ import os
 import logging
 
 from pathlib import Path
-from subprocess import PIPE
 from collections import namedtuple
 
-import grass.script as gscript
-
-from osgeo import gdal
-
+from jamr.backends.backend import get_backend
 from jamr.utils import *
 from jamr.input.dataset import MFDS
 from jamr.utils.constants import (SG_VARIABLES,
@@ -81,11 +77,15 @@ class SoilGridsHorizon(MFDS):
             mapnames[variable] = f'sg_{self.resolution}_{variable_abbr}_{horizon_fmt}_{self.summary_statistic}'
         self.mapnames = SoilHorizonMaps(**mapnames)
 
-    def initial(self):
+    def initial(self, read=True):
         self.preprocess()
-        self.read()    
+        if read:
+            self.read()    
 
     def preprocess(self):
+        # Imported here so that input file names can be listed without GDAL
+        from osgeo import gdal
+
         preprocessed_filenames = {}
         opts = gdal.WarpOptions(format='GTiff', outputBounds=[-180, -90, 180, 90], xRes = 1 / 120., yRes = 1 / 120., dstSRS = 'EPSG:4326')
         for key, filename in self.filenames.items():
@@ -101,8 +101,7 @@ class SoilGridsHorizon(MFDS):
     def read(self):
         for key, filename in self.preprocessed_filenames.items():
             mapname = getattr(self.mapnames, key)
-            p = gscript.start_command('r.in.gdal', input=filename, output=mapname, stderr=PIPE)
-            stdout, stderr = p.communicate()
+            get_backend().import_raster(filename, mapname)
 
 
 class SoilGrids(MFDS):
@@ -150,13 +149,13 @@ class SoilGrids(MFDS):
     def set_mapnames(self):
         pass
 
-    def initial(self): 
+    def initial(self, read=True): 
         # The soilgrids data is repeated for several horizons. 
         data = {}
         for horizon in self.horizons:
             self.current_horizon = horizon 
             horizon_obj = SoilGridsHorizon(self.config, self.data_directory, self.scratch_directory, self.variables, self.resolution, self.summary_statistic, horizon, self.overwrite)
-            horizon_obj.initial() 
+            horizon_obj.initial(read) 
             data[horizon] = horizon_obj
 
         self.data = data
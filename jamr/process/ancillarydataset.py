@@ -1,14 +1,131 @@
 
+import os
+import copy
+
 from abc import abstractmethod
-from subprocess import PIPE
 
-import grass.script as gscript
+import numpy as np
+
+from jamr.backends.backend import get_backend
+from jamr.utils.blocks import (aggregation_factor,
+                               block_rows,
+                               block_sum,
+                               iter_row_blocks,
+                               region_shape,
+                               rows_have_land)
+from jamr.utils.constants import DEFAULT_TARGET_RES
+
+def target_resolutions(config):
+    """Target resolutions (degrees) in the configuration, finest first."""
+    resolutions = config['region'].get('target_resolutions', [DEFAULT_TARGET_RES])
+    return sorted([float(res) for res in resolutions])
+
+
+def target_resolution(config):
+    # Maps are computed at the finest target resolution
+    res = target_resolutions(config)[0]
+    return res, res
+
+
+def resolution_label(res):
+    return '{0:.6f}Deg'.format(res)
+
+
+def resolution_config(config, res, rename=True):
+    """Copy of the configuration targeting a single resolution.
+
+    Output files are labelled with the resolution. If `rename` is True the 
+    region is also renamed, so that maps at this resolution do not clash 
+    with those of the other target resolutions.
+    """
+    label = resolution_label(res)
+    config = copy.deepcopy(config)
+    config['region']['target_resolutions'] = [res]
+    if rename:
+        config['region']['name'] = f"{config['region']['name']}_{label}"
+        # Only output at the finest resolution is regridded
+        config.pop('regrid', None)
+    config.setdefault('output', {})['suffix'] = f'_{label}'
+    return config
+
+
+def aggregate_to_target(fine_config, coarse_config, maps, overwrite):
+    """Aggregate maps from one target grid to a coarser one.
+
+    Each coarse cell is the mean of the non-null fine cells within it, 
+    weighted by the product of a list of weight maps, or else by the number 
+    of fine cells. Maps of quantities relative to the land area (e.g. PFT 
+    fractions and soil properties) should be weighted by the land fraction, 
+    and the surface height of a PFT by the land fraction times the fraction 
+    of the PFT, so that the coarse mean is that of the land (or PFT) area. 
+    The fine maps are themselves means over the native cells, so the result 
+    approximates, but is not identical to, aggregating the native maps.
+
+    Parameters
+    ----------
+    maps : list 
+        Tuples of (fine map, coarse map, list of weight maps).
+    """
+    backend = get_backend()
+    set_target_region(coarse_config)
+    coarse_rgn = backend.region_definition()
+    set_target_region(fine_config)
+    fine_rgn = backend.region_definition()
+    factor = aggregation_factor(fine_rgn, coarse_rgn)
+    if factor is None:
+        raise ValueError(
+            f'Target resolution {coarse_rgn["nsres"]} is not a whole multiple of {fine_rgn["nsres"]} '
+            f'over the extent of region {fine_config["region"]["name"]}'
+        )
+
+    fy, fx = factor
+    nrows, ncols = region_shape(coarse_rgn)
+    for fine_map, coarse_map, weight_maps in maps:
+        weight_maps = list(weight_maps or [])
+        mapnames = [fine_map] + weight_maps
+        nrows_per_block = block_rows(ncols * fx, len(mapnames), fy)
+        tmp_filename = backend.tempfile()
+        result = np.memmap(tmp_filename, dtype=np.float64, mode='w+', shape=(1, nrows, ncols))
+        set_target_region(fine_config)
+        with backend.block_reader(mapnames) as reader:
+            for start, stop in iter_row_blocks(nrows, nrows_per_block):
+                block = reader.read(start * fy, stop * fy)
+                values = block[0]
+                valid = np.isfinite(values)
+                weights = np.prod(np.nan_to_num(block[1:]), axis=0) if weight_maps else np.ones_like(values)
+                weights = np.where(valid, weights, 0.)
+                weighted_sum = block_sum(np.where(valid, values, 0.) * weights, fy, fx)
+                weights_sum = block_sum(weights, fy, fx)
+                result[0, start:stop, :] = np.divide(
+                    weighted_sum, weights_sum, 
+                    out=np.full_like(weighted_sum, np.nan), 
+                    where=weights_sum > 0
+                )
+
+        set_target_region(coarse_config)
+        with backend.block_writer([coarse_map], overwrite=overwrite) as writer:
+            for start, stop in iter_row_blocks(nrows, nrows_per_block):
+                writer.write(result[:, start:stop, :])
+
+        del result
+        os.remove(tmp_filename)
+    return 0
+
+
+def set_target_region(config):
+    nsres, ewres = target_resolution(config)
+    get_backend().set_region(ewres=ewres, 
+                             nsres=nsres, 
+                             n=config['region']['north'],
+                             s=config['region']['south'],
+                             e=config['region']['east'],
+                             w=config['region']['west'])
 
-from jamr.utils.grass_utils import (grass_remove_mask,
-                              grass_set_region,
-                              grass_set_region_from_raster)
 
 class AncillaryDataset:
+    # CoarseLandIndex used to skip blocks which are entirely ocean
+    coarse_land_index = None
+
     def __init__(self, 
                  config, 
                  inputdata,
@@ -18,9 +135,13 @@ class AncillaryDataset:
         self.inputdata = inputdata
         self.overwrite = overwrite
         self.region_name = config['region']['name']
-        grass_remove_mask()
+        self.backend.remove_mask()
         self._set_mapnames() 
 
+    @property
+    def backend(self):
+        return get_backend()
+
     @abstractmethod
     def _set_mapnames(self):
         pass 
@@ -30,33 +151,69 @@ class AncillaryDataset:
         pass
 
     def _set_native_region(self, mapname):
-        grass_set_region_from_raster(raster=mapname,
-                                     n=self.config['region']['north'],
-                                     s=self.config['region']['south'],
-                                     e=self.config['region']['east'],
-                                     w=self.config['region']['west'])
+        self.backend.set_region_from_raster(raster=mapname,
+                                            n=self.config['region']['north'],
+                                            s=self.config['region']['south'],
+                                            e=self.config['region']['east'],
+                                            w=self.config['region']['west'])
         
     def _set_target_region(self):
-        # TODO set target region in config
-        grass_set_region(ewres=0.008333333333, 
-                         nsres=0.008333333333, 
-                         n=self.config['region']['north'],
-                         s=self.config['region']['south'],
-                         e=self.config['region']['east'],
-                         w=self.config['region']['west'])
+        set_target_region(self.config)
+
+    def _block_reader(self, mapnames):
+        return self.backend.block_reader(mapnames)
 
     def _resample(self, input_map, output_map, method):
-        # p = gscript.start_command('r.external.out', 
-        #                           directory=self.config['main']['output_directory'], 
-        #                           format='GTiff', 
-        #                           option='COMPRESS=DEFLATE')
-        p = gscript.start_command('r.resamp.stats',
-                                  flags='w', # weighted average
-                                  input=input_map,
-                                  output=output_map,
-                                  method=method,
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        stdout, stderr = p.communicate()
-        # p = gscript.start_command('r.external.out', flags='r', stderr=PIPE)
-        return 0
+        # Weighted average
+        return self.backend.resample(input_map, output_map, method, overwrite=self.overwrite)
+
+    def _weighted_mean(self, value_map, weight_maps, output_maps, native_raster):
+        """Compute the weighted mean of `value_map` in each target cell for 
+        several weight maps at once.
+
+        The value map and all weight maps are read once, block by block, at 
+        native resolution. Returns False without doing anything if the target 
+        cells are not whole multiples of the native cells, in which case the 
+        caller should fall back to `_resample`.
+        """
+        self._set_target_region()
+        target_rgn = self.backend.region_definition()
+        self._set_native_region(native_raster)
+        native_rgn = self.backend.region_definition()
+        factor = aggregation_factor(native_rgn, target_rgn)
+        if factor is None:
+            return False
+
+        fy, fx = factor
+        nrows, ncols = region_shape(target_rgn)
+        nmaps = len(weight_maps)
+        nrows_per_block = block_rows(ncols * fx, nmaps + 1, fy)
+
+        # Hold the result on disk so that memory use is bounded by the block size
+        tmp_filename = self.backend.tempfile()
+        result = np.memmap(tmp_filename, dtype=np.float64, mode='w+', shape=(nmaps, nrows, ncols))
+        with self._block_reader([value_map] + list(weight_maps)) as reader:
+            for start, stop in iter_row_blocks(nrows, nrows_per_block):
+                if not rows_have_land(self.coarse_land_index, target_rgn, start, stop):
+                    result[:, start:stop, :] = np.nan
+                    continue
+                block = reader.read(start * fy, stop * fy)
+                values, weights = block[0], block[1:]
+                weighted_values = weights * values[None, ...]
+                weighted_sum = block_sum(weighted_values, fy, fx)
+                weights_sum = block_sum(weights, fy, fx)
+                has_values = block_sum(np.isfinite(weighted_values), fy, fx) > 0
+                result[:, start:stop, :] = np.divide(
+                    weighted_sum, weights_sum, 
+                    out=np.full_like(weighted_sum, np.nan), 
+                    where=has_values & (weights_sum > 0)
+                )
+
+        self._set_target_region()
+        with self.backend.block_writer(output_maps, overwrite=self.overwrite) as writer:
+            for start, stop in iter_row_blocks(nrows, nrows_per_block):
+                writer.write(result[:, start:stop, :])
+
+        del result
+        os.remove(tmp_filename)
+        return True
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import os
+import csv
+import copy
+import time
+import logging
+import tomllib
+import multiprocessing
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor
+
+from grass_session import Session
+
+from jamr.backends.backend import (BackendFactory, set_backend)
+from jamr.input.input import InputData
+from jamr.process.process import ProcessData
+from jamr.process.tiles import (TiledProcessData, tiling_enabled)
+from jamr.utils.setup_logging import setup_logging
+from jamr.utils.snapshot import INPUT_SECTIONS
+
+LOGGER = logging.getLogger(__name__)
+
+
+def read_manifest(manifest):
+    """Read a batch manifest.
+
+    The manifest is a TOML file with a `batch` section listing the region
+    configuration files (`configs`, relative to the manifest) and optionally
+    the number of regions run concurrently (`nprocs`) and the directory of
+    the summary report (`output_directory`, by default the output directory
+    of the first region).
+    """
+    with open(manifest, 'rb') as f:
+        batch = tomllib.load(f)['batch']
+
+    manifest_directory = os.path.dirname(os.path.abspath(manifest))
+    configs = []
+    for filename in batch['configs']:
+        with open(os.path.join(manifest_directory, filename), 'rb') as f:
+            configs.append(tomllib.load(f))
+
+    check_batch_configs(configs)
+    return {
+        'configs': [region_batch_config(config) for config in configs],
+        'nprocs': int(batch.get('nprocs', 1)),
+        'output_directory': batch.get('output_directory', configs[0]['main']['output_directory'])
+    }
+
+
+def check_batch_configs(configs):
+    """Check that regions can share one GRASS database and one set of inputs."""
+    if len(configs) == 0:
+        raise ValueError('The batch manifest does not list any region configurations')
+
+    reference = configs[0]
+    names = set()
+    for config in configs:
+        name = config['region']['name']
+        if name in names:
+            raise ValueError(f'Region {name} appears more than once in the batch')
+        names.add(name)
+        for key in ['grass_gis_database', 'data_directory', 'scratch_directory']:
+            if config['main'].get(key) != reference['main'].get(key):
+                raise ValueError(f'Region {name} does not share [main] {key} with the other regions')
+        for section in INPUT_SECTIONS:
+            if config.get(section) != reference.get(section):
+                raise ValueError(f'Region {name} does not share the [{section}] inputs with the other regions')
+
+
+def region_mapset(config):
+    return f"region_{config['region']['name']}"
+
+
+def region_batch_config(config):
+    """Copy of a region configuration writing to its own output directory."""
+    config = copy.deepcopy(config)
+    config['main']['output_directory'] = os.path.join(
+        config['main']['output_directory'], config['region']['name']
+    )
+    return config
+
+
+def process_region(config, inputdata):
+    """Compute and write the output of a region in the current mapset."""
+    os.makedirs(config['main']['output_directory'], exist_ok=True)
+    if tiling_enabled(config):
+        outputdata = TiledProcessData(config, inputdata, overwrite=True)
+        outputdata.initial()
+        outputdata.compute()
+        outputdata.mosaic()
+    else:
+        outputdata = ProcessData(config, inputdata, overwrite=True)
+        outputdata.initial()
+        outputdata.compute()
+    outputdata.write()
+
+
+def run_region(config):
+    """Process one region of a batch in its own mapset.
+
+    Runs in a fresh worker process, which opens its own GRASS session and 
+    sets up its backend (e.g. the storage profile) from the region 
+    configuration. Input maps are read from the PERMANENT mapset, where 
+    they were imported once for the whole batch. Returns a summary of the 
+    run.
+    """
+    name = config['region']['name']
+    output_directory = config['main']['output_directory']
+    os.makedirs(output_directory, exist_ok=True)
+    setup_logging(os.path.join(output_directory, 'output.log'))
+
+    start = time.time()
+    summary = {
+        'region': name, 'mapset': region_mapset(config),
+        'output_directory': output_directory, 'status': 'ok', 'error': ''
+    }
+    session = Session()
+    session.open(
+        gisdb=config['main']['grass_gis_database'], location='jamr',
+        mapset=region_mapset(config), create_opts='EPSG:4326'
+    )
+    try:
+        # Spawned workers do not inherit the backend of the parent process
+        backend = set_backend(BackendFactory.create_backend(config))
+        backend.initial()
+        inputdata = InputData(config, overwrite=False)
+        inputdata.initial(read=False)
+        process_region(config, inputdata)
+    except Exception as e:
+        LOGGER.error(f'Region {name} failed:\n{traceback.format_exc()}')
+        summary['status'] = 'failed'
+        summary['error'] = f'{type(e).__name__}: {e}'
+    finally:
+        session.close()
+
+    summary['elapsed_seconds'] = round(time.time() - start, 1)
+    return summary
+
+
+def run_batch(configs, nprocs=1):
+    """Run regions concurrently, each in a separate worker process."""
+    # Workers are spawned rather than forked so that each starts with a
+    # clean GRASS environment for its own session
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(1, min(nprocs, len(configs))), mp_context=context) as executor:
+        return list(executor.map(run_region, configs))
+
+
+def write_batch_summary(summaries, output_directory):
+    """Log a summary of a batch and write it to `batch_summary.csv`."""
+    os.makedirs(output_directory, exist_ok=True)
+    filename = os.path.join(output_directory, 'batch_summary.csv')
+    fieldnames = ['region', 'mapset', 'status', 'elapsed_seconds', 'output_directory', 'error']
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow(summary)
+
+    for summary in summaries:
+        LOGGER.info(
+            f"Region {summary['region']}: {summary['status']} in {summary['elapsed_seconds']}s"
+            + (f" ({summary['error']})" if summary['error'] else '')
+        )
+    nfailed = sum(summary['status'] != 'ok' for summary in summaries)
+    LOGGER.info(f'{len(summaries) - nfailed} of {len(summaries)} regions succeeded; summary written to {filename}')
+    return filename
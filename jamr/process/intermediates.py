@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import logging
+
+from jamr.backends.backend import get_backend
+
+LOGGER = logging.getLogger(__name__)
+
+
+class IntermediateMaps:
+    """Intermediate maps of a run, removed once no later step needs them.
+
+    Each map is registered with the steps which still read it. When a step
+    finishes it releases its maps, and maps with no remaining steps are
+    removed, so that only the intermediates of the steps still to run are
+    kept on disk.
+
+    Parameters
+    ----------
+    keep : bool
+        Keep all intermediate maps, e.g. for debugging.
+    """
+    def __init__(self, keep=False):
+        self.keep = keep
+        self.consumers = {}
+
+    def add(self, mapnames, steps):
+        """Register maps which are read by `steps`."""
+        for mapname in mapnames:
+            self.consumers.setdefault(mapname, set()).update(steps)
+
+    def release(self, step):
+        """Release the maps read by a finished step, removing those which are
+        not needed by any other step."""
+        for mapname in list(self.consumers.keys()):
+            steps = self.consumers[mapname]
+            steps.discard(step)
+            if len(steps) == 0:
+                self.consumers.pop(mapname)
+                self.remove(mapname)
+
+    def remove(self, mapname):
+        if self.keep:
+            return
+        LOGGER.info(f'Removing intermediate map {mapname}')
+        get_backend().remove_maps(mapname)
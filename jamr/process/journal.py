@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+from jamr.backends.backend import get_backend
+
+LOGGER = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = 'jamr_journal.jsonl'
+
+# Options which control how a run is carried out rather than what it 
+# produces, by section. They are left out of the fingerprint, so that a run
+# can be resumed with other values (e.g. with --keep-intermediates)
+RUN_CONTROL_OPTIONS = {
+    'main': ['keep_intermediates', 'nprocs'],
+    'dask': ['scheduler', 'num_workers', 'address', 'memory_limit'],
+    'output': ['nthreads']
+}
+
+
+def config_fingerprint(config):
+    """Hash of a run configuration, identifying the run in the journal."""
+    config = {
+        section: (
+            {key: value for key, value in options.items() if key not in RUN_CONTROL_OPTIONS.get(section, [])}
+            if isinstance(options, dict) else options
+        )
+        for section, options in config.items()
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class StepJournal:
+    """Append-only journal of the steps completed by a run.
+
+    The journal is a JSON lines file in the output directory. A run starts
+    with a `start` record holding the fingerprint of its configuration,
+    followed by a `done` record for each completed step, listing the maps
+    and files it produced. Records are flushed to disk as they are written,
+    so the journal is intact up to the last completed step if the run is
+    killed.
+
+    When a run is resumed, steps recorded since the last `start` record are
+    skipped if their maps and files still exist. A run can only be resumed
+    with the configuration it was started with, apart from the options in
+    `RUN_CONTROL_OPTIONS`.
+
+    Parameters
+    ----------
+    output_directory : str
+        The output directory of the run, which holds the journal.
+    config : dict
+        The run configuration.
+    resume : bool
+        Whether to resume the run recorded in the journal, rather than
+        starting a new one.
+    """
+    def __init__(self, output_directory, config, resume=False):
+        self.filename = os.path.join(output_directory, JOURNAL_FILENAME)
+        self.fingerprint = config_fingerprint(config)
+        self.completed = {}
+        os.makedirs(output_directory, exist_ok=True)
+        if resume and os.path.exists(self.filename):
+            self._read()
+            self._append({'event': 'resume', 'fingerprint': self.fingerprint})
+            LOGGER.info(f'Resuming run: {len(self.completed)} steps completed in {self.filename}')
+        else:
+            if resume:
+                LOGGER.warning(f'No journal found at {self.filename}; starting a new run')
+            self._append({'event': 'start', 'fingerprint': self.fingerprint})
+
+    def _read(self):
+        records = []
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # The last record may be incomplete if the run was killed
+                    # while writing it
+                    continue
+
+        starts = [i for i, record in enumerate(records) if record['event'] == 'start']
+        if len(starts) == 0:
+            raise ValueError(f'Journal {self.filename} does not record the start of a run')
+
+        records = records[starts[-1]:]
+        if records[0]['fingerprint'] != self.fingerprint:
+            raise ValueError(
+                f'The configuration has changed since the run recorded in {self.filename} '
+                'was started; rerun without resuming'
+            )
+        for record in records:
+            if record['event'] == 'done':
+                self.completed[record['step']] = record
+
+    def _append(self, record):
+        record['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, step):
+        """Whether a step has completed and its output still exists."""
+        record = self.completed.get(step)
+        if record is None:
+            return False
+        backend = get_backend()
+        missing = (
+            [mapname for mapname in record['maps'] if not backend.map_exists(mapname)]
+            + [filename for filename in record['files'] if not os.path.exists(filename)]
+        )
+        if len(missing) > 0:
+            LOGGER.warning(f'Rerunning step {step}: output no longer exists: {missing}')
+            return False
+        return True
+
+    def record(self, step, maps=None, files=None):
+        """Record that a step has completed."""
+        record = {'event': 'done', 'step': step, 'maps': list(maps or []), 'files': list(files or [])}
+        self._append(record)
+        self.completed[step] = record
+
+    def run(self, step, function, maps=None, files=None):
+        """Run a step unless it has already completed, then record it.
+        Returns True if the step was run."""
+        if self.is_done(step):
+            LOGGER.info(f'Skipping step {step}: completed by a previous run')
+            return False
+        function()
+        self.record(step, maps=maps, files=files)
+        return True
@@ -1,23 +1,15 @@
 #!/usr/bin/env python3
 
-import os
 import numpy as np
-import netCDF4
 import logging
 
-from subprocess import PIPE
-
-import grass.script as gscript
-
-from grass.script import array as garray 
-from grass.script import core as grass 
-
-from grass.pygrass.modules.shortcuts import general as g
-from grass.pygrass.modules.shortcuts import raster as r
-
+from jamr.backends.backend import (expression_names, get_backend)
 from jamr.process.ancillarydataset import AncillaryDataset
-from jamr.utils.grass_utils import *
-from jamr.utils.utils import (raster2array, add_lat_lon_dims_2d, F8_FILLVAL, F4_FILLVAL, I4_FILLVAL)
+from jamr.process.writejobs import WriteJob
+from jamr.utils.blocks import (block_rows, iter_row_blocks, land_masked, rows_have_land)
+from jamr.utils.regrid import write_regridded
+from jamr.utils.utils import (region_coords, add_lat_lon_dims_2d, add_land_point_dims_1d, output_options, 
+                              output_path, open_output_dataset, create_output_variable, F8_FILLVAL, F4_FILLVAL, I4_FILLVAL)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -117,25 +109,6 @@ class _Poulter2015PFT:
     def initial(self):
         pass
 
-    def _write_reclass_rules(self, pft, factor=1000):
-        # TODO can also do this with r.category + r.mapcalc
-        try:
-            index = self.pft_names.index(pft)
-        except:
-            ValueError()
-
-        pft_crosswalk = self.crosswalk[pft]
-        text = ""
-        for key, value in pft_crosswalk.items():
-            ln = str(key) + " = " + str(int(value * factor)) + os.linesep
-            text = text + ln
-        text = text + "* = 0"
-        # for key, value in pft_crosswalk.items():
-        #     ln = str(key) + ":" + str(value) + os.linesep
-        #     text = text + ln
-        with open("/tmp/rules.txt", "w") as f:
-            f.write(text)
-
     def set_mapnames(self):
         mapnames = {}
         for year in self.years:
@@ -151,26 +124,8 @@ class _Poulter2015PFT:
         input_map = self.landcover.mapnames[year]
         output_map = self.mapnames[year][pft]
 
-        # r.reclass only works with integers, so we multiply by a suitably 
-        # large factor to convert the fractions in the crosswalk table to integers 
-        # the alternative would be to use a python dictionary with pft fractions
-        mult_factor = 1000
-        self._write_reclass_rules(pft, factor=mult_factor)
-        
-        # g.region(raster=input_map)
-        p = gscript.start_command('r.reclass', 
-                                  input=input_map, 
-                                  output=output_map + '_step1', 
-                                  rules='/tmp/rules.txt', 
-                                  overwrite=self.overwrite, stderr=PIPE)
-        stdout, stderr = p.communicate()
-
-        # Divide by factor used to convert percentages to integers in step 1 
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{output_map} = {output_map}_step1 / {mult_factor}.0', 
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        stdout, stderr = p.communicate()
+        # Fractions of each land cover class are taken from the crosswalk table
+        get_backend().reclass(input_map, output_map, self.crosswalk[pft], overwrite=self.overwrite, fraction=True)
 
         # # Intermediate output 
         # r.out_gdal(input=output_map, 
@@ -178,20 +133,6 @@ class _Poulter2015PFT:
         #            createopt="COMPRESS=DEFLATE",
         #            overwrite=True)
 
-        # self._write_reclass_rules(pft)
-        # g.region(raster=input_map)
-        # p = gscript.start_command('r.category',
-        #                           map=input_map,
-        #                           separator=":",
-        #                           rules='/tmp/rules.txt',
-        #                           stderr=PIPE)
-        # stdout, stderr = p.communicate()
-        # p = gscript.start_command('r.mapcalc',
-        #                           expression=f'{output_map} = @{input_map}',
-        #                           overwrite=self.overwrite,
-        #                           stderr=PIPE)
-        # stdout, stderr = p.communicate()
-
     def compute(self):
         # This converts the discrete classes of the ESA land cover map to the 
         # fractions outlined in Poulter et al. (2015)
@@ -212,6 +153,34 @@ JULES_9PFT_NAMES = [
     'urban', 'water', 'bare_soil', 'snow_ice'
 ]
 
+# Map algebra expressions giving the fraction of each JULES type from the 
+# Poulter et al. (2015) PFT fractions, the percentage of natural grass and 
+# crop area which is C4 (`c4_grass_area`, `c4_crop_area`) and whether cells
+# are in tropical broadleaf forest biomes (`tropical`). Used for both gridded
+# output and point sites. Types which are a single Poulter et al. (2015) PFT
+# are resampled from its map directly
+JULES_PFT_EXPRESSIONS = {
+    'tree_broadleaf': '{trees_broadleaf_deciduous} + {trees_broadleaf_evergreen}',
+    'tree_needleleaf': '{trees_needleleaf_deciduous} + {trees_needleleaf_evergreen}',
+    'shrub': (
+        '{shrubs_broadleaf_deciduous} + {shrubs_broadleaf_evergreen} '
+        '+ {shrubs_needleleaf_deciduous} + {shrubs_needleleaf_evergreen}'
+    ),
+    'tree_broadleaf_evergreen_tropical': '{trees_broadleaf_evergreen} * {tropical}',
+    'tree_broadleaf_evergreen_temperate': '{trees_broadleaf_evergreen} * (1-{tropical})',
+    'tree_broadleaf_deciduous': '{trees_broadleaf_deciduous}',
+    'tree_needleleaf_evergreen': '{trees_needleleaf_evergreen}',
+    'tree_needleleaf_deciduous': '{trees_needleleaf_deciduous}',
+    'shrub_evergreen': '{shrubs_broadleaf_evergreen} + {shrubs_needleleaf_evergreen}',
+    'shrub_deciduous': '{shrubs_broadleaf_deciduous} + {shrubs_needleleaf_deciduous}',
+    'c3_grass': '({natural_grass} * (1. - {c4_grass_area} / 100.)) + ({crops} * (1. - {c4_crop_area} / 100.))',
+    'c4_grass': '({natural_grass} * {c4_grass_area} / 100.) + ({crops} * {c4_crop_area} / 100.)',
+    'urban': '{urban}',
+    'water': '{water}',
+    'bare_soil': '{bare_soil}',
+    'snow_ice': '{snow_ice}'
+}
+
 
 class Poulter2015JulesPFT(AncillaryDataset):
     def __init__(self, config, inputdata, npft, overwrite):
@@ -285,6 +254,20 @@ class Poulter2015JulesPFT(AncillaryDataset):
         # Note `native` here refers to the native resolution of the elevation map
         self._resample(input_map=self.elevation_mapname_native, output_map=self.elevation_mapname, method='average')
 
+        # Compute the fraction-weighted mean elevation of all PFTs in a single 
+        # pass over the native maps
+        LOGGER.info('Computing surface height maps')
+        done = self._weighted_mean(
+            value_map=self.elevation_mapname, 
+            weight_maps=[self.mapnames_native[year][pft] for pft in self.pft_names],
+            output_maps=[self.surf_hgt_mapnames[year][pft] for pft in self.pft_names], 
+            native_raster=self.inputdata.landcover.mapnames[2015]
+        )
+        if done:
+            return 
+
+        # Otherwise the native and target grids are not aligned, so we 
+        # use weighted resampling for each PFT in turn
         for pft in self.pft_names:
             LOGGER.info(f'Computing surface height map for {pft}')
             native_weighted_elev_map = self.weighted_elev_mapnames_native[year][pft]
@@ -294,19 +277,29 @@ class Poulter2015JulesPFT(AncillaryDataset):
             weights_map = self.weights_mapnames[year][pft] 
             surf_hgt_map = self.surf_hgt_mapnames[year][pft]
             self._set_native_region(self.inputdata.landcover.mapnames[2015])
-            p = gscript.start_command('r.mapcalc',
-                                      expression=f'{native_weighted_elev_map} = {native_lc_map} * {native_elev_map}',
-                                      overwrite=self.overwrite,
-                                      stderr=PIPE)
-            stdout, stderr = p.communicate()
+            self.backend.calc(native_weighted_elev_map,
+                              '{native_lc_map} * {native_elev_map}',
+                              overwrite=self.overwrite,
+                              native_lc_map=native_lc_map,
+                              native_elev_map=native_elev_map)
             self._set_target_region()
             self._resample(input_map=native_weighted_elev_map, output_map=weighted_elev_map, method='sum')
             self._resample(input_map=native_lc_map, output_map=weights_map, method='sum')
-            p = gscript.start_command('r.mapcalc',
-                                      expression=f'{surf_hgt_map} = {weighted_elev_map} / {weights_map}',
-                                      overwrite=self.overwrite,
-                                      stderr=PIPE)
-            stdout, stderr = p.communicate()
+            self.backend.calc(surf_hgt_map,
+                              '{weighted_elev_map} / {weights_map}',
+                              overwrite=self.overwrite,
+                              weighted_elev_map=weighted_elev_map,
+                              weights_map=weights_map)
+
+    def _compute_passthrough(self, year, pft):
+        # Some JULES types are identical to one of the Poulter et al. (2015)
+        # maps. Rather than copying the source map with r.mapcalc we point the
+        # native map name at the source map and resample it directly
+        source_pft, = expression_names(JULES_PFT_EXPRESSIONS[pft])
+        source_map = self.pfts.mapnames[year][source_pft]
+        self.mapnames_native[year][pft] = source_map
+        self._set_target_region()
+        self._resample(input_map=source_map, output_map=self.mapnames[year][pft], method='average')
 
     def compute_c3_grass(self, year):
         LOGGER.info(f'Computing C3 grass')
@@ -317,11 +310,14 @@ class Poulter2015JulesPFT(AncillaryDataset):
         c4_natural_vegetation_fraction_map = self.inputdata.c4fraction.mapnames[2015]['C4_grass_area']
         c4_crop_fraction_map = self.inputdata.c4fraction.mapnames[2015]['C4_crop_area']
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc',
-                                  expression=f'{native_output_map} = ({natural_grass_map} * (1. - {c4_natural_vegetation_fraction_map} / 100.)) + ({managed_grass_map} * (1. - {c4_crop_fraction_map} / 100.))',
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['c3_grass'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          natural_grass=natural_grass_map,
+                          c4_grass_area=c4_natural_vegetation_fraction_map,
+                          crops=managed_grass_map,
+                          c4_crop_area=c4_crop_fraction_map)
         # r.out_gdal(input=c4_natural_vegetation_fraction_map, 
         #            output=os.path.join(self.config['main']['output_directory'], c4_natural_vegetation_fraction_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -359,11 +355,14 @@ class Poulter2015JulesPFT(AncillaryDataset):
         c4_natural_vegetation_fraction_map = self.inputdata.c4fraction.mapnames[2015]['C4_grass_area']
         c4_crop_fraction_map = self.inputdata.c4fraction.mapnames[2015]['C4_crop_area']
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc',
-                                  expression=f'{native_output_map} = ({natural_grass_map} * {c4_natural_vegetation_fraction_map} / 100.) + ({managed_grass_map} * {c4_crop_fraction_map} / 100.)',
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['c4_grass'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          natural_grass=natural_grass_map,
+                          c4_grass_area=c4_natural_vegetation_fraction_map,
+                          crops=managed_grass_map,
+                          c4_crop_area=c4_crop_fraction_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -377,153 +376,221 @@ class Poulter2015JulesPFT(AncillaryDataset):
 
     def compute_urban(self, year):
         LOGGER.info(f'Computing urban land')
-        native_output_map = self.mapnames_native[year]['urban']
-        output_map = self.mapnames[year]['urban']
-        urban_map = self.pfts.mapnames[year]['urban']
-        self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc',
-                                  expression=f'{native_output_map} = {urban_map}',
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        p.communicate()
-        # r.out_gdal(input=native_output_map, 
-        #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
-        #            createopt="COMPRESS=DEFLATE",
-        #            overwrite=True)
-        self._set_target_region()
-        self._resample(input_map=native_output_map, output_map=output_map, method='average')
+        self._compute_passthrough(year, 'urban')
 
     def compute_water(self, year):
         LOGGER.info(f'Computing water')
-        native_output_map = self.mapnames_native[year]['water']
-        output_map = self.mapnames[year]['water']
-        water_map = self.pfts.mapnames[year]['water']
-        self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc',
-                                  expression=f'{native_output_map} = {water_map}',
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        p.communicate()
-        # r.out_gdal(input=native_output_map, 
-        #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
-        #            createopt="COMPRESS=DEFLATE",
-        #            overwrite=True)
-        self._set_target_region()
-        self._resample(input_map=native_output_map, output_map=output_map, method='average')
+        self._compute_passthrough(year, 'water')
 
     def compute_bare_soil(self, year):
         LOGGER.info(f'Computing bare soil')
-        native_output_map = self.mapnames_native[year]['bare_soil']
-        output_map = self.mapnames[year]['bare_soil']
-        bare_soil_map = self.pfts.mapnames[year]['bare_soil']
-        self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc',
-                                  expression=f'{native_output_map} = {bare_soil_map}', 
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        p.communicate()
-        # r.out_gdal(input=native_output_map, 
-        #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
-        #            createopt="COMPRESS=DEFLATE",
-        #            overwrite=True)
-        self._set_target_region()
-        self._resample(input_map=native_output_map, output_map=output_map, method='average')
+        self._compute_passthrough(year, 'bare_soil')
 
     def compute_snow_ice(self, year):
         LOGGER.info(f'Computing snow/ice')
-        native_output_map = self.mapnames_native[year]['snow_ice']
-        output_map = self.mapnames[year]['snow_ice']
-        snow_ice_map = self.pfts.mapnames[year]['snow_ice']
-        self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc',
-                                  expression=f'{native_output_map} = {snow_ice_map}', 
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        p.communicate()
-        # r.out_gdal(input=native_output_map, 
-        #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
-        #            createopt="COMPRESS=DEFLATE",
-        #            overwrite=True)
+        self._compute_passthrough(year, 'snow_ice')
+
+    def output_mapnames(self):
+        return (
+            [self.mapnames[year][pft] for year in self.years for pft in self.pft_names]
+            + [self.surf_hgt_mapnames[year][pft] for year in self.years for pft in self.pft_names]
+        )
+
+    def output_weights(self):
+        return {
+            self.surf_hgt_mapnames[year][pft]: self.mapnames[year][pft] 
+            for year in self.years for pft in self.pft_names
+        }
+
+    def intermediate_mapnames(self):
+        """Maps computed on the way to the output maps."""
+        pft_mapnames = _Poulter2015PFT(self.config, self.inputdata.landcover, self.overwrite).mapnames
+        mapnames = [self.elevation_mapname]
+        for year in self.years:
+            mapnames += list(pft_mapnames[year].values())
+            for pft in self.pft_names:
+                mapnames += [
+                    f'{pft}_{year}_{self.region_name}_native',
+                    self.weighted_elev_mapnames_native[year][pft],
+                    self.weighted_elev_mapnames[year][pft],
+                    self.weights_mapnames[year][pft]
+                ]
+        return mapnames
+
+    def iter_data_blocks(self, year, landfrac_mapname, with_land_frac=False):
+        """Yield (start, stop, frac, surf_hgt) row blocks in the target region,
+        followed by the land fraction if `with_land_frac` is True.
+
+        Fractions are normalised, ice grid boxes consolidated and non-land 
+        cells masked block by block, so that memory use is bounded by the 
+        block size rather than the size of the grid.
+        """
+        ntype = len(self.pft_names)
+        mapnames = (
+            [landfrac_mapname] 
+            + [self.mapnames[year][pft] for pft in self.pft_names]
+            + [self.surf_hgt_mapnames[year][pft] for pft in self.pft_names]
+        )
+        rgn_def = self.backend.region_definition()
+        with self._block_reader(mapnames) as reader:
+            nrows, ncols = reader.shape
+            for start, stop in iter_row_blocks(nrows, block_rows(ncols, len(mapnames))):
+                if not rows_have_land(self.coarse_land_index, rgn_def, start, stop):
+                    ocean = np.ma.masked_all((ntype, stop - start, ncols), dtype=np.float64)
+                    ocean.fill_value = F8_FILLVAL
+                    land_frac = (np.zeros((1, stop - start, ncols)),) if with_land_frac else ()
+                    yield (start, stop, ocean, ocean.copy()) + land_frac
+                    continue
+                # Only the fractions are zero-filled, so that land cells 
+                # without a surface height are masked rather than set to 0 m
+                block = reader.read(start, stop)
+                land_frac = np.nan_to_num(block[0])
+                frac = np.nan_to_num(block[1:(ntype + 1)])
+                surf_hgt = block[(ntype + 1):]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    frac /= frac.sum(axis=0)
+
+                # Set ice grid boxes to 100% ice and add sub-threshold ice to bare soil
+                consolidate_ice(
+                    frac, surf_hgt, 
+                    soil_index=self.pft_names.index('bare_soil'), 
+                    ice_index=self.pft_names.index('snow_ice'),
+                    nrows_per_block=(stop - start)
+                )
+                blocks = (start, stop, land_masked(frac, land_frac), land_masked(surf_hgt, land_frac))
+                yield blocks + ((land_frac[None, ...],) if with_land_frac else ())
+
+    def write_jobs(self, landfrac_mapname, land_index=None):
+        output_directory = self.config['main']['output_directory']
+        options = output_options(self.config)
+        jobs = []
+        for year in self.years:
+            jobs.append(WriteJob(
+                output_path(output_directory, f'jamr_frac_{year}', options), self._write_frac, 
+                year=year, landfrac_mapname=landfrac_mapname, land_index=land_index
+            ))
+            if options['ants_frac']:
+                jobs.append(WriteJob(
+                    output_path(output_directory, f'jamr_frac_ants_{year}', options), self._write_frac_ants, 
+                    year=year, landfrac_mapname=landfrac_mapname
+                ))
+        return jobs
+
+    def regrid_jobs(self, regridder, landfrac_mapname):
+        output_directory = self.config['main']['output_directory']
+        options = output_options(self.config)
+        return [
+            WriteJob(
+                output_path(output_directory, f'jamr_frac_{year}', options), self._write_frac_regrid, 
+                year=year, landfrac_mapname=landfrac_mapname, regridder=regridder
+            )
+            for year in self.years
+        ]
+
+    def write_netcdf(self, landfrac_mapname, land_index=None):
+        for job in self.write_jobs(landfrac_mapname, land_index):
+            job.run()
+
+    def _write_frac(self, output_filename, year, landfrac_mapname, land_index=None):
         self._set_target_region()
-        self._resample(input_map=native_output_map, output_map=output_map, method='average')
+        coords, bnds = region_coords()
+        options = output_options(self.config)
 
-    def get_data_arrays(self, year):
-        frac_list = []
-        surf_hgt_list = []
-        for pft in self.pft_names:
-            frac = garray.array(mapname=self.mapnames[year][pft])
-            surf_hgt = garray.array(mapname=self.surf_hgt_mapnames[year][pft])
-            frac_list.append(frac)
-            surf_hgt_list.append(surf_hgt)
+        x_dim_name = 'x'
+        y_dim_name = 'y'
+        type_dim_name = 'type'
 
-        frac = np.stack(frac_list)
+        blocks = self.iter_data_blocks(year, landfrac_mapname)
+        if options['grid_layout'] == 'land_points':
+            write_jules_frac_1d(
+                blocks, len(self.pft_names), output_filename, land_index, 
+                coords[0], coords[1], 'land', type_dim_name, options
+            )
+        else:
+            write_jules_frac_2d(
+                blocks, len(self.pft_names), output_filename, 
+                coords[0], coords[1], bnds[0], bnds[1], x_dim_name, y_dim_name, type_dim_name, 
+                options
+            )
+
+
+    def _write_frac_regrid(self, output_filename, year, landfrac_mapname, regridder):
+        self._set_target_region()
+        # Fractions are weighted by the land fraction, as when they are 
+        # aggregated to coarser resolutions, and surface height also by the
+        # fraction of each type
+        frac, surf_hgt, _ = regridder.regrid(
+            self.iter_data_blocks(year, landfrac_mapname, with_land_frac=True), weighted_by={0: [2], 1: [2, 0]}
+        )
+        write_regridded(
+            output_filename, regridder.grid, 
+            [('frac', frac, 'type'), ('surf_hgt', surf_hgt, 'type')], 
+            output_options(self.config)
+        )
+
+    def _write_frac_ants(self, output_filename, year, landfrac_mapname):
+        self._set_target_region()
+        coords, bnds = region_coords()
+        write_jules_frac_ants(
+            self.iter_data_blocks(year, landfrac_mapname), len(self.pft_names), output_filename, 
+            coords[0], coords[1], bnds[0], bnds[1], output_options(self.config)
+        )
+
+
+def _weighted_surf_hgt(surf_hgt, frac):
+    # Fraction-weighted mean surface height of the types with a surface 
+    # height, which is NaN where none of the types present has one
+    valid = np.isfinite(surf_hgt) & (frac > 0)
+    weights = np.where(valid, frac, 0.).sum(axis=0)
+    total = np.where(valid, surf_hgt * frac, 0.).sum(axis=0)
+    return np.divide(total, weights, out=np.full_like(total, np.nan), where=weights > 0)
+
+
+def _consolidate_ice_block(frac, surf_hgt, soil_index, ice_index, threshold):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Weighted mean surface height of all types (for ice grid boxes)
+        mean_surf_hgt = _weighted_surf_hgt(surf_hgt, frac)
+
+        # Weighted mean surface height of bare soil and ice (for non-ice grid boxes)
+        soil_ice_sum = frac[soil_index] + frac[ice_index]
+        soil_ice_surf_hgt = _weighted_surf_hgt(surf_hgt[[soil_index, ice_index]], frac[[soil_index, ice_index]])
+        ice = frac[ice_index] > threshold
+        not_ice = np.logical_not(ice)
+
+        # Initially set all fractions/heights in ice grid boxes to zero
+        frac *= not_ice[None, ...]
+        surf_hgt *= not_ice[None, ...]
+        # Ice grid boxes are entirely ice, with the mean height of all types
+        frac[ice_index] = ice
+        surf_hgt[ice_index][ice] = mean_surf_hgt[ice]
+        # In non-ice grid boxes the original ice fraction is added to bare soil
+        frac[soil_index] = soil_ice_sum * not_ice
+        surf_hgt[soil_index][not_ice] = soil_ice_surf_hgt[not_ice]
+        # Ensure fractions continue to sum to one
         frac /= frac.sum(axis=0)
-        surf_hgt = np.stack(surf_hgt_list)
 
-        # # Compute weighted mean of all cells (for ice cells)
-        # mean_surf_hgt = (
-        #     np.sum(surf_hgt * frac, axis=0)
-        #     / np.sum(frac, axis=0)
-        # )
-        
-        # # Compute weighted mean of soil and ice cells (for non-ice cells)
-        # soil_ice_sum = np.sum(frac[-2:, ...], axis=0)
-        # mean_surf_hgt_soil_ice = np.divide(
-        #     np.sum(surf_hgt[-2:, ...] * frac[-2:, ...], axis=0),
-        #     soil_ice_sum,
-        #     out=np.zeros_like(soil_ice_sum),
-        #     where=soil_ice_sum>0
-        # )
-        # mean_surf_hgt_soil_ice = (
-        #     np.sum(surf_hgt[-2:, ...] * frac[-2:, ...], axis=0)
-        #     / np.sum(frac[-2:, ...], axis=0)
-        # )
-
-        # # original ice/soil fractions
-        # ice_orig = frac[-1, ...]
-        # soil_orig = frac[-2, ...]
-
-        # ice = np.zeros_like(ice_orig).astype(bool)
-        # ice[ice_orig > 0.5] = True
-        # not_ice = np.logical_not(ice)
-
-        # # initially set all fractions/heights in ice gridboxes to zero
-        # frac *= not_ice[None, ...]
-        # surf_hgt *= not_ice[None, ...]
-        # # then set ice fraction to one
-        # frac[-1][ice] = 1
-        # frac[-1][not_ice] = 0
-        # # in non-ice gridboxes, add original ice fraction to bare soil
-        # frac[-2] = (soil_orig + ice_orig) * not_ice
-        # # surface height in ice grid boxes is the mean of all fractions
-        # surf_hgt[-1][ice] = mean_surf_hgt[ice]
-        # # surface height in non-ice is the weighted mean of bare soil
-        # # and original ice fraction
-        # surf_hgt[-2][not_ice] = mean_surf_hgt_soil_ice[not_ice]
-        # # divide by sum again, to ensure fractions continue to sum to one
-        # frac /= frac.sum(axis=0)
-        return frac, surf_hgt
-
-    def write_netcdf(self, landfrac_mapname):
-        coords, bnds, land_frac = raster2array(landfrac_mapname)
 
-        x_dim_name = 'x'
-        y_dim_name = 'y'
-        type_dim_name = 'type'
+def consolidate_ice(frac, surf_hgt, soil_index, ice_index, threshold=0.5, nrows_per_block=None):
+    """Consolidate glacier and bare soil fractions.
 
-        for year in self.years:
-            # Collect data for all PFTs
-            frac, surf_hgt = self.get_data_arrays(year)
-            mask = np.broadcast_to(np.logical_not(land_frac), frac.shape)
-            frac = np.ma.array(frac, mask=mask, dtype=np.float64, fill_value=F8_FILLVAL)
-            surf_hgt = np.ma.array(surf_hgt, mask=mask, dtype=np.float64, fill_value=F8_FILLVAL)
-            output_filename = os.path.join(self.config['main']['output_directory'], f'jamr_frac_{year}.nc')
-            write_jules_frac_2d(frac, surf_hgt, output_filename, coords[0], coords[1], bnds[0], bnds[1], x_dim_name, y_dim_name, type_dim_name)
-
-
-def write_jules_frac_2d(frac_input, surf_hgt_input, output_filename, x_vals, y_vals, x_bnds, y_bnds, x_dim_name, y_dim_name, type_dim_name):
-    nco = netCDF4.Dataset(output_filename, 'w', format='NETCDF4')
-    ntype = frac_input.shape[0]
+    Grid boxes where the ice fraction exceeds `threshold` are set to 100% 
+    ice, with the weighted mean surface height of all types. Elsewhere ice 
+    is added to bare soil. `frac` and `surf_hgt` are arrays with shape 
+    (ntype, ny, nx) which are modified in place, one row block at a time, 
+    so that temporary arrays are no larger than a single block.
+    """
+    ntype, ny, nx = frac.shape
+    if nrows_per_block is None:
+        nrows_per_block = block_rows(nx, 2 * ntype)
+    for start, stop in iter_row_blocks(ny, nrows_per_block):
+        _consolidate_ice_block(
+            frac[:, start:stop, :], surf_hgt[:, start:stop, :], 
+            soil_index, ice_index, threshold
+        )
+
+
+def write_jules_frac_2d(blocks, ntype, output_filename, x_vals, y_vals, x_bnds, y_bnds, x_dim_name, y_dim_name, type_dim_name, options):
+    nco = open_output_dataset(output_filename, options)
     nco = add_lat_lon_dims_2d(nco, x_dim_name, y_dim_name, x_vals, y_vals, x_bnds, y_bnds)
 
     nco.createDimension(type_dim_name, ntype)
@@ -533,23 +600,126 @@ def write_jules_frac_2d(frac_input, surf_hgt_input, output_filename, x_vals, y_v
     var.long_name = type_dim_name
     var[:] = np.arange(1, ntype+1)
     
-    var = nco.createVariable(
-        'frac', 'f8', (type_dim_name, y_dim_name, x_dim_name),
-        fill_value=F8_FILLVAL
+    frac_var = create_output_variable(
+        nco, 'frac', options['dtype'], (type_dim_name, y_dim_name, x_dim_name), options,
+        fill_value=options['fill_value']
+    )
+    frac_var.units = '1'
+    frac_var.standard_name = 'frac'
+    frac_var.grid_mapping = 'latitude_longitude'
+
+    surf_hgt_var = create_output_variable(
+        nco, 'surf_hgt', options['dtype'], (type_dim_name, y_dim_name, x_dim_name), options,
+        fill_value=options['fill_value']
     )
+    surf_hgt_var.units = '1'
+    surf_hgt_var.standard_name = 'surf_hgt'
+    surf_hgt_var.grid_mapping = 'latitude_longitude'
+
+    for start, stop, frac, surf_hgt in blocks:
+        frac_var[:, start:stop, :] = frac
+        surf_hgt_var[:, start:stop, :] = surf_hgt
+
+    nco.close()
+
+
+def write_jules_frac_1d(blocks, ntype, output_filename, land_index, x_vals, y_vals, grid_dim_name, type_dim_name, options):
+    nco = open_output_dataset(output_filename, options)
+    nco = add_land_point_dims_1d(nco, grid_dim_name, land_index, x_vals, y_vals)
+
+    nco.createDimension(type_dim_name, ntype)
+    var = nco.createVariable(type_dim_name, 'i4', (type_dim_name,))
     var.units = '1'
-    var.standard_name = 'frac'
-    var.grid_mapping = 'latitude_longitude'
-    var[:] = frac_input
+    var.standard_name = type_dim_name
+    var.long_name = type_dim_name
+    var[:] = np.arange(1, ntype+1)
+
+    frac_var = create_output_variable(
+        nco, 'frac', options['dtype'], (type_dim_name, grid_dim_name), options,
+        fill_value=options['fill_value'], grid_ndim=1
+    )
+    frac_var.units = '1'
+    frac_var.standard_name = 'frac'
 
-    var = nco.createVariable(
-        'surf_hgt', 'f8', (type_dim_name, y_dim_name, x_dim_name),
-        fill_value=F8_FILLVAL
+    surf_hgt_var = create_output_variable(
+        nco, 'surf_hgt', options['dtype'], (type_dim_name, grid_dim_name), options,
+        fill_value=options['fill_value'], grid_ndim=1
     )
+    surf_hgt_var.units = '1'
+    surf_hgt_var.standard_name = 'surf_hgt'
+
+    for start, stop, frac, surf_hgt in blocks:
+        land_points = land_index.block_slice(start, stop)
+        frac_var[:, land_points] = land_index.subset(frac, start, stop)
+        surf_hgt_var[:, land_points] = land_index.subset(surf_hgt, start, stop)
+
+    nco.close()
+
+
+def write_jules_frac_ants(blocks, ntype, output_filename, x_vals, y_vals, x_bnds, y_bnds, options):
+    """Write fractional cover in the format used by ANTS, with longitudes in 
+    the range 0-360.
+
+    The western hemisphere is moved east of the eastern hemisphere by 
+    writing the two hemispheres of each block to the corresponding 
+    longitude offsets of the output variable, so that the rolled array is 
+    never created in memory.
+    """
+    # Regions are regular, so the western hemisphere is the leading run of columns
+    nwest = int(np.sum(x_vals < 0.))
+    neast = len(x_vals) - nwest
+    nco = open_output_dataset(output_filename, options)
+    nco.grid_staggering = 6
+
+    nco.createDimension('dim0', ntype)
+    nco.createDimension('latitude', len(y_vals))
+    nco.createDimension('longitude', len(x_vals))
+    nco.createDimension('bnds', 2)
+
+    var = nco.createVariable('longitude', 'f8', ('longitude',))
+    var.axis = 'X'
+    var.bounds = 'longitude_bnds'
+    var.units = 'degrees_east'
+    var.standard_name = 'longitude'
+    var[:neast] = x_vals[nwest:]
+    var[neast:] = x_vals[:nwest] + 360.
+    var = nco.createVariable('longitude_bnds', 'f8', ('longitude', 'bnds'))
+    var[:neast, :] = x_bnds[nwest:, :]
+    var[neast:, :] = x_bnds[:nwest, :] + 360.
+
+    var = nco.createVariable('latitude', 'f8', ('latitude',))
+    var.axis = 'Y'
+    var.bounds = 'latitude_bnds'
+    var.units = 'degrees_north'
+    var.standard_name = 'latitude'
+    var[:] = y_vals
+    var = nco.createVariable('latitude_bnds', 'f8', ('latitude', 'bnds'))
+    var[:] = y_bnds
+
+    var = nco.createVariable('latitude_longitude', 'i4')
+    var.grid_mapping_name = 'latitude_longitude'
+    var.longitude_of_prime_meridian = 0.
+    var.earth_radius = 6371229.
+
+    var = nco.createVariable('pseudo_level', 'i4', ('dim0',))
     var.units = '1'
-    var.standard_name = 'surf_hgt'
-    var.grid_mapping = 'latitude_longitude'
-    var[:] = surf_hgt_input
+    var.long_name = 'pseudo_level'
+    var[:] = np.arange(1, ntype+1)
+
+    frac_var = create_output_variable(
+        nco, 'land_cover_lccs', options['dtype'], ('dim0', 'latitude', 'longitude'), options,
+        fill_value=options['fill_value']
+    )
+    frac_var.units = '1'
+    frac_var.um_stash_source = 'm01s00i216'
+    frac_var.standard_name = 'land_cover_lccs'
+    frac_var.grid_mapping = 'latitude_longitude'
+    frac_var.coordinates = 'pseudo_level'
+
+    for start, stop, frac, _ in blocks:
+        frac_var[:, start:stop, :neast] = frac[:, :, nwest:]
+        if nwest > 0:
+            frac_var[:, start:stop, neast:] = frac[:, :, :nwest]
 
     nco.close()
 
@@ -561,7 +731,7 @@ class Poulter2015FivePFT(Poulter2015JulesPFT):
     def compute(self, landfrac_mapname):
         
         # Apply mask based on supplied land fraction map 
-        r.mask(raster=landfrac_mapname, maskcats=1)
+        self.backend.set_mask(landfrac_mapname, maskcats=1)
 
         # Set PFT fractions from Poulter et al.
         self._compute_pfts()
@@ -581,7 +751,7 @@ class Poulter2015FivePFT(Poulter2015JulesPFT):
         self.compute_surf_hgt(2015)
 
         # Remove mask 
-        r.mask(flags='r')
+        self.backend.remove_mask()
 
     def compute_tree_broadleaf(self, year):
         LOGGER.info(f'Computing broadleaf tree')
@@ -592,11 +762,12 @@ class Poulter2015FivePFT(Poulter2015JulesPFT):
         print(tree_broadleaf_deciduous_map)
         print(tree_broadleaf_evergreen_map)
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {tree_broadleaf_deciduous_map} + {tree_broadleaf_evergreen_map}',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['tree_broadleaf'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          trees_broadleaf_deciduous=tree_broadleaf_deciduous_map,
+                          trees_broadleaf_evergreen=tree_broadleaf_evergreen_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -613,11 +784,12 @@ class Poulter2015FivePFT(Poulter2015JulesPFT):
         print(tree_needleleaf_deciduous_map)
         print(tree_needleleaf_evergreen_map)
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {tree_needleleaf_deciduous_map} + {tree_needleleaf_evergreen_map}', 
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['tree_needleleaf'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          trees_needleleaf_deciduous=tree_needleleaf_deciduous_map,
+                          trees_needleleaf_evergreen=tree_needleleaf_evergreen_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -634,11 +806,14 @@ class Poulter2015FivePFT(Poulter2015JulesPFT):
         shrub_needleleaf_deciduous_map = self.pfts.mapnames[year]['shrubs_needleleaf_deciduous'] 
         shrub_needleleaf_evergreen_map = self.pfts.mapnames[year]['shrubs_needleleaf_evergreen']
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {shrub_broadleaf_deciduous_map} + {shrub_broadleaf_evergreen_map} + {shrub_needleleaf_deciduous_map} + {shrub_needleleaf_evergreen_map}',
-                                  overwrite=self.overwrite,
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['shrub'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          shrubs_broadleaf_deciduous=shrub_broadleaf_deciduous_map,
+                          shrubs_broadleaf_evergreen=shrub_broadleaf_evergreen_map,
+                          shrubs_needleleaf_deciduous=shrub_needleleaf_deciduous_map,
+                          shrubs_needleleaf_evergreen=shrub_needleleaf_evergreen_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -654,7 +829,7 @@ class Poulter2015NinePFT(Poulter2015JulesPFT):
     def compute(self, landfrac_mapname):
         
         # Apply mask based on supplied land fraction map 
-        r.mask(raster=landfrac_mapname, maskcats=1)
+        self.backend.set_mask(landfrac_mapname, maskcats=1)
 
         # Set PFT fractions from Poulter et al.
         self._compute_pfts()
@@ -678,7 +853,7 @@ class Poulter2015NinePFT(Poulter2015JulesPFT):
         self.compute_surf_hgt(2015)
 
         # Remove mask
-        r.mask(flags='r')
+        self.backend.remove_mask()
 
     def compute_tree_broadleaf_evergreen_tropical(self, year):
         native_output_map = self.mapnames_native[year]['tree_broadleaf_evergreen_tropical']
@@ -686,11 +861,12 @@ class Poulter2015NinePFT(Poulter2015JulesPFT):
         tree_broadleaf_evergreen_map = self.pfts.mapnames[year]['trees_broadleaf_evergreen']
         tropical_broadleaf_forest_map = self.inputdata.ecoregions.mapnames[0]
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {tree_broadleaf_evergreen_map} * {tropical_broadleaf_forest_map}',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['tree_broadleaf_evergreen_tropical'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          trees_broadleaf_evergreen=tree_broadleaf_evergreen_map,
+                          tropical=tropical_broadleaf_forest_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -704,11 +880,12 @@ class Poulter2015NinePFT(Poulter2015JulesPFT):
         tree_broadleaf_evergreen_map = self.pfts.mapnames[year]['trees_broadleaf_evergreen']
         tropical_broadleaf_forest_map = self.inputdata.ecoregions.mapnames[0]
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {tree_broadleaf_evergreen_map} * (1-{tropical_broadleaf_forest_map})',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['tree_broadleaf_evergreen_temperate'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          trees_broadleaf_evergreen=tree_broadleaf_evergreen_map,
+                          tropical=tropical_broadleaf_forest_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -717,67 +894,26 @@ class Poulter2015NinePFT(Poulter2015JulesPFT):
         self._resample(input_map=native_output_map, output_map=output_map, method='average')
 
     def compute_tree_broadleaf_deciduous(self, year):
-        native_output_map = self.mapnames_native[year]['tree_broadleaf_deciduous']
-        output_map = self.mapnames[year]['tree_broadleaf_deciduous']
-        tree_broadleaf_deciduous_map = self.pfts.mapnames[year]['trees_broadleaf_deciduous']
-        self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {tree_broadleaf_deciduous_map}',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
-        # r.out_gdal(input=native_output_map, 
-        #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
-        #            createopt="COMPRESS=DEFLATE",
-        #            overwrite=True)
-        self._set_target_region()
-        self._resample(input_map=native_output_map, output_map=output_map, method='average')
+        self._compute_passthrough(year, 'tree_broadleaf_deciduous')
 
     def compute_tree_needleleaf_evergreen(self, year):
-        native_output_map = self.mapnames_native[year]['tree_needleleaf_evergreen']
-        output_map = self.mapnames[year]['tree_needleleaf_evergreen']
-        tree_needleleaf_evergreen_map = self.pfts.mapnames[year]['trees_needleleaf_evergreen']
-        self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {tree_needleleaf_evergreen_map}',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
-        # r.out_gdal(input=native_output_map, 
-        #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
-        #            createopt="COMPRESS=DEFLATE",
-        #            overwrite=True)
-        self._set_target_region()
-        self._resample(input_map=native_output_map, output_map=output_map, method='average')
+        self._compute_passthrough(year, 'tree_needleleaf_evergreen')
 
     def compute_tree_needleleaf_deciduous(self, year):
-        native_output_map = self.mapnames_native[year]['tree_needleleaf_deciduous']
-        output_map = self.mapnames[year]['tree_needleleaf_deciduous']
-        tree_needleleaf_deciduous_map = self.pfts.mapnames[year]['trees_needleleaf_deciduous']
-        self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {tree_needleleaf_deciduous_map}',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
-        # r.out_gdal(input=native_output_map, 
-        #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
-        #            createopt="COMPRESS=DEFLATE",
-        #            overwrite=True)
-        self._set_target_region()
-        self._resample(input_map=native_output_map, output_map=output_map, method='average')
-    
+        self._compute_passthrough(year, 'tree_needleleaf_deciduous')
+
     def compute_shrub_evergreen(self, year):
         native_output_map = self.mapnames_native[year]['shrub_evergreen']
         output_map = self.mapnames[year]['shrub_evergreen']
         shrub_broadleaf_evergreen_map = self.pfts.mapnames[year]['shrubs_broadleaf_evergreen'] 
         shrub_needleleaf_evergreen_map = self.pfts.mapnames[year]['shrubs_needleleaf_evergreen']
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {shrub_broadleaf_evergreen_map} + {shrub_needleleaf_evergreen_map}',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['shrub_evergreen'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          shrubs_broadleaf_evergreen=shrub_broadleaf_evergreen_map,
+                          shrubs_needleleaf_evergreen=shrub_needleleaf_evergreen_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -791,11 +927,12 @@ class Poulter2015NinePFT(Poulter2015JulesPFT):
         shrub_broadleaf_deciduous_map = self.pfts.mapnames[year]['shrubs_broadleaf_deciduous'] 
         shrub_needleleaf_deciduous_map = self.pfts.mapnames[year]['shrubs_needleleaf_deciduous']
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
-        p = gscript.start_command('r.mapcalc', 
-                                  expression=f'{native_output_map} = {shrub_broadleaf_deciduous_map} + {shrub_needleleaf_deciduous_map}',
-                                  overwrite=self.overwrite, 
-                                  stderr=PIPE)
-        p.communicate()
+        self.backend.calc(native_output_map,
+                          JULES_PFT_EXPRESSIONS['shrub_deciduous'],
+                          overwrite=self.overwrite,
+                          fraction=True,
+                          shrubs_broadleaf_deciduous=shrub_broadleaf_deciduous_map,
+                          shrubs_needleleaf_deciduous=shrub_needleleaf_deciduous_map)
         # r.out_gdal(input=native_output_map, 
         #            output=os.path.join(self.config['main']['output_directory'], native_output_map + ".tif"),
         #            createopt="COMPRESS=DEFLATE",
@@ -804,79 +941,6 @@ class Poulter2015NinePFT(Poulter2015JulesPFT):
         self._resample(input_map=native_output_map, output_map=output_map, method='average')
 
 
-# def write_jules_frac_ants(year, lc_names, frac_fn):
-#     frac, _ = get_jules_frac(year, lc_names)    
-#     ntype = frac.shape[0]
-#     # extract region characteristics, and move western
-#     # hemisphere east of east hemisphere.
-#     land_frac, lat_vals, lon_vals, extent = get_region_data()
-#     nlat = len(lat_vals)
-#     nlon = len(lon_vals)
-#     lat_bnds = get_lat_lon_bnds(lat_vals, (extent.top, extent.bottom))
-#     lon_bnds = get_lat_lon_bnds(lon_vals, (extent.left, extent.right))
-#     west_hemisphere = lon_vals < 0.
-#     east_hemisphere = ~west_hemisphere
-#     frac = np.concatenate([frac[:, :, east_hemisphere], frac[:, :, west_hemisphere]], axis=2)
-#     lon_vals = np.concatenate([lon_vals[east_hemisphere], lon_vals[west_hemisphere] + 360.], axis=0)
-#     lon_bnds = np.concatenate([lon_bnds[east_hemisphere, :], lon_bnds[west_hemisphere, :] + 360.], axis=0)
-#     # create file
-#     nco = netCDF4.Dataset(frac_fn, 'w', format='NETCDF4')
-#     nco.grid_staggering = 6
-    
-#     # add dimensions
-#     nco.createDimension('dim0', ntype)
-#     nco.createDimension('latitude', nlat)
-#     nco.createDimension('longitude', nlon)
-#     nco.createDimension('bnds', 2)
-#     # add variables
-#     var = nco.createVariable(
-#         'longitude', 'f8', ('longitude',)
-#     )
-#     var.axis = 'X'
-#     var.bounds = 'longitude_bnds'
-#     var.units = 'degrees_east'
-#     var.standard_name = 'longitude'
-#     var[:] = lon_vals
-#     var = nco.createVariable(
-#         'longitude_bnds', 'f8', ('longitude', 'bnds')
-#     )
-#     var[:] = lon_bnds
-#     var = nco.createVariable(
-#         'latitude', 'f8', ('latitude',)
-#     )
-#     var.axis = 'Y'
-#     var.bounds = 'latitude_bnds'
-#     var.units = 'degrees_north'
-#     var.standard_name = 'latitude'
-#     var[:] = lat_vals
-#     var = nco.createVariable(
-#         'latitude_bnds', 'f8', ('latitude', 'bnds')
-#     )
-#     var[:] = lat_bnds
-#     var = nco.createVariable(
-#         'latitude_longitude', 'i4'
-#     )
-#     var.grid_mapping_name = 'latitude_longitude'
-#     var.longitude_of_prime_meridian = 0.
-#     var.earth_radius = 6371229.    
-#     # TODO: change variable name
-#     var = nco.createVariable(
-#         'land_cover_lccs', 'f8', ('dim0', 'latitude', 'longitude'),
-#         fill_value=F8_FILLVAL
-#     )
-#     var.units = '1'
-#     var.um_stash_source = 'm01s00i216'
-#     var.standard_name = 'land_cover_lccs'
-#     var.grid_mapping = 'latitude_longitude'
-#     var.coordinates = 'pseudo_level'
-#     var[:] = frac
-        
-#     var = nco.createVariable('pseudo_level', 'i4', ('dim0',))
-#     var.units = '1'
-#     var.long_name = 'pseudo_level'
-#     var[:] = np.arange(1, ntype+1)
-#     nco.close()
-    
 # def write_jules_frac_1d(frac_fn, frac, var_name, var_units, grid_dim_name, type_dim_name):
 #     nco = netCDF4.Dataset(frac_fn, 'w', format='NETCDF4')
 #     ntype, nland = frac.shape[0], frac.shape[1]
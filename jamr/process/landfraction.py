@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
 
-import os
 import re
 import glob
 import time
 import logging
 import rasterio 
 import numpy as np
-import netCDF4
-import grass.script as gscript
 
 LOGGER = logging.getLogger(__name__)
 
 from jamr.process.ancillarydataset import AncillaryDataset
-from jamr.utils.grass_utils import (grass_remove_mask, grass_map_exists, grass_remove_tmp)
-from jamr.utils.utils import (get_lat_lon_grids, add_lat_lon_dims_2d, raster2array)
-from jamr.utils.constants import I4_FILLVAL
+from jamr.process.writejobs import WriteJob
+from jamr.utils.utils import (add_lat_lon_dims_2d, add_land_point_dims_1d, region_coords, output_options, output_path, open_output_dataset, 
+                              create_output_variable)
+from jamr.utils.blocks import (CoarseLandIndex, LandPointIndex, block_rows, iter_row_blocks, region_shape, rows_have_land)
+from jamr.utils.regrid import write_regridded
+from jamr.utils.constants import (I4_FILLVAL, COARSE_LAND_INDEX_RES)
 
 
 class LandFractionFactory:
@@ -40,117 +40,200 @@ class ESALandFraction(AncillaryDataset):
         self.inputdata = inputdata
         self.overwrite = overwrite
         self.region_name = config['region']['name']
-        grass_remove_mask()
+        self.backend.remove_mask()
         self._set_mapnames() 
 
     def _set_mapnames(self): 
         self.mapname_native = f'esacci_landfrac_{self.region_name}_native'
         self.mapname = f'esacci_landfrac_{self.region_name}'
+        self.land_index_mapname = f'esacci_land_index_{self.region_name}'
+
+    def compute_coarse_land_index(self):
+        """Build the coarse land index of the region.
+
+        A coarse cell may contain land unless every water bodies cell in it 
+        is ocean and every land cover cell is water, which is a necessary 
+        condition for the land fraction of all native cells to be zero.
+        """
+        if not self.backend.map_exists(self.land_index_mapname) or self.overwrite:
+            self.backend.set_region(
+                n=self.config['region']['north'], s=self.config['region']['south'],
+                e=self.config['region']['east'], w=self.config['region']['west'],
+                res=COARSE_LAND_INDEX_RES
+            )
+            esaccilc_ref_map = self.inputdata.landcover.mapnames[2015]
+            for input_map, method in [
+                    (self.inputdata.waterbodies.mapnames[-1], 'maximum'), 
+                    (esaccilc_ref_map, 'minimum'), 
+                    (esaccilc_ref_map, 'maximum')]:
+                self.backend.resample(
+                    input_map, f'land_index_{input_map}_{method}_tmp', method, overwrite=True, weighted=False
+                )
+
+            self.backend.calc(
+                self.land_index_mapname,
+                'where(where(isnull({wb_max}), 0, {wb_max} > 0) | '
+                'where(isnull({lc_min}), 0, ({lc_min} != 210) | ({lc_max} != 210)), 1, 0)',
+                overwrite=True,
+                wb_max=f'land_index_{self.inputdata.waterbodies.mapnames[-1]}_maximum_tmp',
+                lc_min=f'land_index_{esaccilc_ref_map}_minimum_tmp',
+                lc_max=f'land_index_{esaccilc_ref_map}_maximum_tmp'
+            )
+            self.backend.remove_maps('*_tmp')
+        else:
+            self.backend.set_region(raster=self.land_index_mapname)
+
+        rgn_def = self.backend.region_definition()
+        with self._block_reader([self.land_index_mapname]) as reader:
+            land = np.nan_to_num(reader.read(0, reader.shape[0])[0]) > 0
+
+        LOGGER.info(f'Coarse land index: {land.mean():.1%} of cells may contain land')
+        return CoarseLandIndex(land, rgn_def['n'], rgn_def['w'], rgn_def['nsres'], rgn_def['ewres'])
 
     def compute(self):
         self._set_native_region(self.inputdata.landcover.mapnames[2015])
 
         # Resample waterbodies map to the landcover map resolution
-        if not grass_map_exists('raster', self.mapname_native, 'PERMANENT') or self.overwrite:
+        if not self.backend.map_exists(self.mapname_native, mapset='PERMANENT') or self.overwrite:
             # LOGGER.info(f'Resampling water bodies map to resolution of land cover maps')
-            p = gscript.start_command(
-                'r.resamp.stats', 
-                input=self.inputdata.waterbodies.mapnames[-1],
-                output='water_bodies_min_tmp',
-                method='minimum',
-                overwrite=self.overwrite, 
+            self.backend.resample(
+                self.inputdata.waterbodies.mapnames[-1], 'water_bodies_min_tmp', 'minimum',
+                overwrite=self.overwrite, weighted=False
             )
-            p.communicate()
 
             # LOGGER.info(f'Identifying ocean grid cells from water bodies map')
-            p = gscript.start_command(
-                'r.mapcalc', 
-                expression='ocean_min_tmp = if(water_bodies_min_tmp == 0, 1, 0)', 
-                overwrite=self.overwrite, 
+            self.backend.calc(
+                'ocean_min_tmp', 'where({wb_min} == 0, 1, 0)', 
+                overwrite=self.overwrite, wb_min='water_bodies_min_tmp'
             )
-            p.communicate()
-            # stdout, stderr = p.communicate()
 
             # LOGGER.info(f'Identifying water cells from reference land cover map')
             esaccilc_ref_map = self.inputdata.landcover[2015]
-            p = gscript.start_command(
-                'r.mapcalc', 
-                expression=f'esacci_lc_water_tmp = if({esaccilc_ref_map} == 210, 1, 0)', 
-                overwrite=self.overwrite, 
+            self.backend.calc(
+                'esacci_lc_water_tmp', 'where({lc} == 210, 1, 0)', 
+                overwrite=self.overwrite, lc=esaccilc_ref_map
             )
-            p.communicate()
             
             # LOGGER.info(f'Identifying ocean grid cells as union of water bodies map and land cover map')
-            p = gscript.start_command(
-                'r.mapcalc', 
-                expression=f'ocean_tmp = if((ocean_min_tmp==1 && esacci_lc_water_tmp==1), 1, 0)', 
-                overwrite=self.overwrite, 
+            self.backend.calc(
+                'ocean_tmp', 'where(({ocean} == 1) & ({water} == 1), 1, 0)', 
+                overwrite=self.overwrite, ocean='ocean_min_tmp', water='esacci_lc_water_tmp'
             )
-            p.communicate()
-
-            p = gscript.start_command(
-                'r.mapcalc', 
-                expression=f'{self.mapname_native} = 1 - ocean_tmp', 
-                overwrite=self.overwrite, 
+            self.backend.calc(
+                self.mapname_native, '1 - {ocean}', 
+                overwrite=self.overwrite, ocean='ocean_tmp'
             )
-            p.communicate()
 
         # Resample to target resolution
         self._set_target_region()
         self._resample(input_map=self.mapname_native, output_map=self.mapname, method='average')
 
         # Remove temporary maps
-        grass_remove_tmp()
-
-    def write_netcdf(self):
-        output_filename = os.path.join(self.config['main']['output_directory'], 'jamr_landfrac.nc')
-        # write_jules_land_frac_1d(input, output, 'land')
-        write_jules_land_frac_2d(self.mapname, output_filename, 'x', 'y')
-
+        self.backend.remove_maps('*_tmp')
+
+    def output_mapnames(self):
+        return [self.mapname]
+
+    def iter_data_blocks(self):
+        """Yield (start, stop, land_frac) row blocks in the target region."""
+        rgn_def = self.backend.region_definition()
+        with self._block_reader([self.mapname]) as reader:
+            nrows, ncols = reader.shape
+            for start, stop in iter_row_blocks(nrows, block_rows(ncols)):
+                if not rows_have_land(self.coarse_land_index, rgn_def, start, stop):
+                    yield start, stop, np.zeros((stop - start, ncols))
+                    continue
+                land_frac = np.nan_to_num(reader.read(start, stop)[0])
+                yield start, stop, land_frac
+
+    def land_point_index(self):
+        """Build the index of land points in the target grid."""
+        self._set_target_region()
+        nrows, ncols = region_shape(self.backend.region_definition())
+        return LandPointIndex.from_blocks(self.iter_data_blocks(), nrows, ncols)
+
+    def write_jobs(self, land_index=None):
+        output_directory = self.config['main']['output_directory']
+        options = output_options(self.config)
+        jobs = [WriteJob(
+            output_path(output_directory, 'jamr_landfrac', options), 
+            self._write_land_frac, land_index=land_index
+        )]
+        if options['grid_layout'] == 'land_points':
+            jobs.append(WriteJob(
+                output_path(output_directory, 'jamr_latlon', options), 
+                self._write_latlon, land_index=land_index
+            ))
+        return jobs
+
+    def regrid_jobs(self, regridder):
+        output_directory = self.config['main']['output_directory']
+        options = output_options(self.config)
+        return [WriteJob(
+            output_path(output_directory, 'jamr_landfrac', options), 
+            self._write_land_frac_regrid, regridder=regridder
+        )]
+
+    def write_netcdf(self, land_index=None):
+        for job in self.write_jobs(land_index):
+            job.run()
+
+    def _write_land_frac(self, output_filename, land_index=None):
+        options = output_options(self.config)
+        self._set_target_region()
+        coords, bnds = region_coords()
+        if options['grid_layout'] == 'land_points':
+            write_jules_land_frac_1d(
+                self.iter_data_blocks(), output_filename, land_index, 
+                coords[0], coords[1], 'land', options
+            )
+        else:
+            write_jules_land_frac_2d(
+                self.iter_data_blocks(), output_filename, 
+                coords[0], coords[1], bnds[0], bnds[1], 'x', 'y', options
+            )
 
-def write_jules_land_frac_1d(input, output, grid_dim_name):
+    def _write_land_frac_regrid(self, output_filename, regridder):
+        self._set_target_region()
+        land_frac, = regridder.regrid(self.iter_data_blocks())
+        write_regridded(output_filename, regridder.grid, [('land_frac', land_frac, None)], output_options(self.config))
 
-    coords, _, land_frac = raster2array(input)
+    def _write_latlon(self, output_filename, land_index):
+        self._set_target_region()
+        coords, _ = region_coords()
+        write_jules_latlon_1d(output_filename, land_index, coords[0], coords[1], 'land', output_options(self.config))
 
-    nco = netCDF4.Dataset(output, 'w', format='NETCDF4')
-    mask = land_frac > 0.
-    lon_vals_2d, lat_vals_2d = get_lat_lon_grids(coords[1], coords[0])
-    lon_vals_1d = lon_vals_2d.transpose()[mask.transpose()]
-    lat_vals_1d = lat_vals_2d.transpose()[mask.transpose()]
-    nland = mask.sum()
-    nco.createDimension(grid_dim_name, nland)
 
-    var = nco.createVariable('longitude', 'f8', (grid_dim_name,))
-    var.units = 'degrees_east'
-    var.standard_name = 'longitude'
-    var[:] = lon_vals_1d
+def write_jules_latlon_1d(output, land_index, x_vals, y_vals, grid_dim_name, options):
+    nco = open_output_dataset(output, options)
+    nco = add_land_point_dims_1d(nco, grid_dim_name, land_index, x_vals, y_vals)
+    nco.close()
 
-    var = nco.createVariable('latitude', 'f8', (grid_dim_name,))
-    var.units = 'degrees_north'
-    var.standard_name = 'latitude'
-    var[:] = lat_vals_1d
 
-    var = nco.createVariable(
-        'land_frac', 'i4', (grid_dim_name,),
-        fill_value=I4_FILLVAL
+def write_jules_land_frac_1d(blocks, output, land_index, x_vals, y_vals, grid_dim_name, options):
+    nco = open_output_dataset(output, options)
+    nco = add_land_point_dims_1d(nco, grid_dim_name, land_index, x_vals, y_vals)
+    var = create_output_variable(
+        nco, 'land_frac', 'i4', (grid_dim_name,), options,
+        fill_value=I4_FILLVAL, grid_ndim=1
     )
     var.units = '1'
     var.standard_name = 'land_frac'
-    var[:] = land_frac.transpose()[mask.transpose()]
+    for start, stop, land_frac in blocks:
+        var[land_index.block_slice(start, stop)] = land_index.subset(land_frac, start, stop)
     nco.close()
-    return None
 
 
-def write_jules_land_frac_2d(input, output, x_dim_name, y_dim_name):
-    coords, bnds, land_frac = raster2array(input)
-    nco = netCDF4.Dataset(output, 'w', format='NETCDF4')
-    nco = add_lat_lon_dims_2d(nco, x_dim_name, y_dim_name, coords[0], coords[1], bnds[0], bnds[1])
-    var = nco.createVariable(
-        'land_frac', 'i4', (y_dim_name, x_dim_name),
+def write_jules_land_frac_2d(blocks, output, x_vals, y_vals, x_bnds, y_bnds, x_dim_name, y_dim_name, options):
+    nco = open_output_dataset(output, options)
+    nco = add_lat_lon_dims_2d(nco, x_dim_name, y_dim_name, x_vals, y_vals, x_bnds, y_bnds)
+    var = create_output_variable(
+        nco, 'land_frac', 'i4', (y_dim_name, x_dim_name), options,
         fill_value=I4_FILLVAL
     )
     var.units = '1'
     var.standard_name = 'land_frac'
     var.grid_mapping = 'latitude_longitude'
-    var[:] = land_frac
+    for start, stop, land_frac in blocks:
+        var[start:stop, :] = land_frac
     nco.close()
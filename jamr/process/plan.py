@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import logging
+
+from collections import namedtuple
+
+import numpy as np
+
+from jamr.input.esaccilc import (ESACCILC, ESACCIWB)
+from jamr.process.ancillarydataset import (resolution_label, target_resolutions)
+from jamr.utils.blocks import DEFAULT_BLOCK_CELLS
+from jamr.utils.constants import (JULES_SOIL_VARIABLES, REGIONS)
+from jamr.utils.headers import read_header
+
+LOGGER = logging.getLogger(__name__)
+
+PlanStep = namedtuple(
+    'PlanStep',
+    ['name', 'kind', 'nmaps', 'native_cells', 'target_cells', 'seconds', 'disk', 'memory']
+)
+
+# Seconds per million cells (summed over all maps) processed by each kind of
+# step. These are rough defaults, which should be replaced by values measured
+# on the machine running jamr in the `calibration` table of the `plan` section
+# of the configuration
+DEFAULT_CALIBRATION = {
+    'import': 0.05,
+    'native': 0.02,
+    'resample': 0.04,
+    'aggregate': 0.02,
+    'write': 0.1
+}
+
+# Nominal resolutions (degrees) of the inputs, used when the header of an
+# input file cannot be read
+ESA_CCI_LC_RES = 1 / 360.
+SOILGRIDS_RES = 1 / 120.
+
+# Sizes of the global grids of preprocessed inputs, which are fixed by the
+# preprocessing rather than by the input files
+ECOREGIONS_SHAPE = (21600, 43200)
+C4_FRACTION_SHAPE = (360, 720)
+C4_FRACTION_MAPS = 19 * 3
+
+MERIT_REGIONS = ['globe_0.008333Deg', 'globe_0.004167Deg', 'globe_0.002778Deg']
+
+# Number of copies of a block held at once by the arithmetic of the blocked
+# operations (the block itself, masks and weighted values)
+BLOCK_COPIES = 3
+
+
+def region_cells(config, res):
+    """Number of cells in the configured region at resolution `res`."""
+    rgn = config['region']
+    nrows = math.ceil(round((rgn['north'] - rgn['south']) / res, 6))
+    ncols = math.ceil(round((rgn['east'] - rgn['west']) / res, 6))
+    return nrows * ncols
+
+
+def global_cells(res):
+    return math.ceil(round(180 / res, 6)) * math.ceil(round(360 / res, 6))
+
+
+def cell_bytes(profile, fraction=False):
+    """Bytes per cell of a computed map with the given storage profile."""
+    if profile == 'double':
+        return 8
+    if profile == 'compact' and fraction:
+        return 2
+    return 4
+
+
+class Plan:
+    """Steps of a preprocessing run, with estimates of their cost.
+
+    The plan is computed from the configuration, `REGIONS` and the headers
+    of the input files, without starting the processing backend. Sizes are
+    those of uncompressed maps, so are upper bounds. Memory is the peak 
+    held by each step: its blocks (or Dask chunks) and the arrays it holds 
+    for the whole grid, i.e. the results of weighted means and aggregation, 
+    the chunk caches of output files and the accumulators of regridding.
+
+    Parameters
+    ----------
+    config : dict
+        The run configuration.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.profile = config.get('storage', {}).get('profile', 'double')
+        self.calibration = dict(DEFAULT_CALIBRATION)
+        self.calibration.update(config.get('plan', {}).get('calibration', {}))
+        self.landcover = ESACCILC(config, False)
+        self.waterbodies = ESACCIWB(config, False)
+        header = read_header(self.landcover.filenames.get(2015, ''))
+        self.landcover_res = header.res[0] if header is not None else ESA_CCI_LC_RES
+        self.steps = []
+        self._plan_imports()
+        self._plan_compute()
+        self._plan_writes()
+
+    def add(self, name, kind, nmaps, native_cells, target_cells, nbytes, nread=None, grid_memory=0):
+        """Add a step writing `nmaps` maps, reading `nread` maps at once and
+        holding `grid_memory` bytes for the whole grid."""
+        cells = max(native_cells, target_cells)
+        nread = nmaps if nread is None else nread
+        # Imported and native maps are at the native resolution of the inputs
+        stored_cells = native_cells if kind in ['import', 'native'] else target_cells
+        self.steps.append(PlanStep(
+            name=name,
+            kind=kind,
+            nmaps=nmaps,
+            native_cells=native_cells,
+            target_cells=target_cells,
+            seconds=nmaps * cells / 1e6 * self.calibration[kind],
+            disk=nmaps * stored_cells * nbytes,
+            memory=self.block_memory(nread, cells) + grid_memory
+        ))
+
+    def block_memory(self, nread, cells):
+        """Bytes of the blocks of `nread` maps processed at once."""
+        if self.config['main'].get('backend', 'grass') == 'dask':
+            # Each Dask worker computes a chunk of every map it reads
+            dask_config = self.config.get('dask', {})
+            chunk_size = int(dask_config.get('chunk_size', 1024))
+            nworkers = int(dask_config.get('num_workers', None) or os.cpu_count() or 1)
+            return BLOCK_COPIES * nread * min(chunk_size ** 2, cells) * 8 * nworkers
+        return BLOCK_COPIES * min(nread * cells, DEFAULT_BLOCK_CELLS) * 8
+
+    def _plan_imports(self):
+        # Inputs cloned from a snapshot are not imported
+        if 'snapshot' in self.config['main']:
+            return
+
+        inputs = [(self.landcover.mapnames[year], filename) for year, filename in self.landcover.filenames.items()]
+        inputs.append((self.waterbodies.mapname, self.waterbodies.filename))
+        for mapname, filename in inputs:
+            header = read_header(filename)
+            if header is None:
+                cells, itemsize = global_cells(ESA_CCI_LC_RES), 1
+            else:
+                cells, itemsize = header.width * header.height, np.dtype(header.dtypes[0]).itemsize
+            self.add(f'import {mapname}', 'import', 1, cells, 0, itemsize)
+
+        soil = self.config['soil']['soilgrids']
+        nmaps = len(soil['variables']) * len(soil['horizons'])
+        self.add('import soilgrids', 'import', nmaps, global_cells(SOILGRIDS_RES), 0, 2)
+        for rgn in MERIT_REGIONS:
+            self.add(f'import merit_dem_{rgn}', 'import', 1, global_cells(REGIONS[rgn]['res']), 0, 4)
+        self.add('import ecoregions', 'import', 3, int(np.prod(ECOREGIONS_SHAPE)), 0, 1)
+        self.add('import c4 fraction', 'import', C4_FRACTION_MAPS, int(np.prod(C4_FRACTION_SHAPE)), 0, 4)
+
+    def _plan_compute(self):
+        # Imported here as they import the output libraries
+        from jamr.process.landcover import (ADJUSTED_POULTER_CROSSWALK, JULES_5PFT_NAMES, JULES_9PFT_NAMES)
+
+        resolutions = target_resolutions(self.config)
+        target = region_cells(self.config, resolutions[0])
+        native_lc = region_cells(self.config, self.landcover_res)
+        native_soil = region_cells(self.config, SOILGRIDS_RES)
+        methods = self.config['methods']
+
+        self.add('land_fraction', 'native', 5, native_lc, target, cell_bytes(self.profile))
+        self.add('land_fraction', 'resample', 1, native_lc, target, cell_bytes(self.profile, fraction=True))
+        self.noutputs = 1
+        nyears = len(self.landcover.years)
+        for method in methods['frac']:
+            for npft in methods['npft']:
+                pft_names = JULES_5PFT_NAMES if int(npft) == 5 else JULES_9PFT_NAMES
+                step = f"frac_{method}2015{'Five' if int(npft) == 5 else 'Nine'}PFT"
+                nmaps = nyears * len(ADJUSTED_POULTER_CROSSWALK) + len(pft_names)
+                self.add(step, 'native', nmaps, native_lc, target, cell_bytes(self.profile, fraction=True))
+                self.add(step, 'native', 1, native_lc, target, cell_bytes(self.profile))
+                # The weighted mean surface heights of a year are held on disk
+                # (memory mapped) for the whole target grid
+                self.add(
+                    step, 'resample', 2 * nyears * len(pft_names), native_lc, target,
+                    cell_bytes(self.profile), nread=len(pft_names) + 1, 
+                    grid_memory=len(pft_names) * target * 8
+                )
+                self.noutputs += 2 * nyears * len(pft_names)
+
+        nhorizons = len(self.config['soil']['soilgrids']['horizons'])
+        for method in methods['soil_props']:
+            nmaps = nhorizons * len(JULES_SOIL_VARIABLES)
+            self.add(f'soil_props_{method}', 'native', nmaps, native_soil, target, cell_bytes(self.profile))
+            self.add(f'soil_props_{method}', 'resample', nmaps, native_soil, target, cell_bytes(self.profile))
+            self.noutputs += nmaps
+
+        # Each map is aggregated with up to two weight maps, into a memory 
+        # mapped coarse grid
+        for res in resolutions[1:]:
+            coarse = region_cells(self.config, res)
+            self.add(
+                f"aggregate_{self.config['region']['name']}_{resolution_label(res)}", 'aggregate', self.noutputs,
+                target, coarse, cell_bytes(self.profile), nread=3, grid_memory=coarse * 8
+            )
+
+    def regrid_shape(self):
+        """Shape of the grid output is regridded to, or None."""
+        if 'regrid' not in self.config:
+            return None
+        # Imported here as it imports the output libraries
+        from jamr.utils.regrid import TargetGrid
+        try:
+            return TargetGrid.from_config(self.config).shape
+        except OSError as e:
+            LOGGER.warning(f'Could not read the regridding template ({e}); sizing regridded output as the target grid')
+            return None
+
+    def _plan_writes(self):
+        # Imported here as they import the output libraries
+        from jamr.process.landcover import (JULES_5PFT_NAMES, JULES_9PFT_NAMES)
+        from jamr.utils.utils import (CHUNK_CACHE_ROWS, output_options, output_path)
+
+        options = output_options(self.config)
+        itemsize = np.dtype(options['dtype']).itemsize
+        directory = self.config['main']['output_directory']
+        methods = self.config['methods']
+        resolutions = target_resolutions(self.config)
+        rgn = self.config['region']
+        self.land_points = options['grid_layout'] == 'land_points'
+        regrid_shape = self.regrid_shape()
+        for i, res in enumerate(resolutions):
+            nrows = math.ceil(round((rgn['north'] - rgn['south']) / res, 6))
+            ncols = math.ceil(round((rgn['east'] - rgn['west']) / res, 6))
+            # Only output at the finest resolution is regridded, from the 
+            # target grid, replacing the lat/lon output
+            regridded = i == 0 and regrid_shape is not None
+            if len(resolutions) > 1:
+                options['suffix'] = f'_{resolution_label(res)}'
+            files = [(output_path(directory, 'jamr_landfrac', options), 1)]
+            if self.land_points:
+                files.append((output_path(directory, 'jamr_latlon', options), 2))
+            for npft in methods['npft']:
+                ntype = len(JULES_5PFT_NAMES if int(npft) == 5 else JULES_9PFT_NAMES)
+                for year in self.landcover.years:
+                    files.append((output_path(directory, f'jamr_frac_{year}', options), 2 * ntype))
+                    if options['ants_frac'] and not regridded:
+                        files.append((output_path(directory, f'jamr_frac_ants_{year}', options), ntype))
+            nhorizons = len(self.config['soil']['soilgrids']['horizons'])
+            files.append((output_path(directory, 'jamr_soil_props', options), nhorizons * len(JULES_SOIL_VARIABLES)))
+            for filename, nlayers in files:
+                if regridded:
+                    out_rows, out_cols = regrid_shape
+                    # Sums and weights are accumulated for every layer and 
+                    # target cell, then divided into the (masked) output
+                    grid_memory = nlayers * out_rows * out_cols * (2 * 8 + 8 + 1)
+                else:
+                    out_rows, out_cols = nrows, ncols
+                    grid_memory = 0
+                # Land points are sized as all cells, as their number is not 
+                # known before the land fraction is computed
+                if self.land_points:
+                    cache_cells = options['chunk_rows'] * options['chunk_cols'] * CHUNK_CACHE_ROWS
+                else:
+                    cache_cells = min(options['chunk_rows'], out_rows) * out_cols * CHUNK_CACHE_ROWS
+                grid_memory += nlayers * cache_cells * itemsize
+                # Regridded output is read from the target lat/lon grid
+                self.add(
+                    f'write {os.path.basename(filename)}', 'write', nlayers, nrows * ncols if regridded else 0, 
+                    out_rows * out_cols, itemsize, nread=nlayers + 1, grid_memory=grid_memory
+                )
+
+    @property
+    def seconds(self):
+        return sum(step.seconds for step in self.steps)
+
+    @property
+    def disk(self):
+        return sum(step.disk for step in self.steps)
+
+    @property
+    def output_disk(self):
+        return sum(step.disk for step in self.steps if step.kind == 'write')
+
+    @property
+    def memory(self):
+        # Output files are written by `nprocs` processes at once
+        nprocs = int(self.config['main'].get('nprocs', 1))
+        writes = sorted([step.memory for step in self.steps if step.kind == 'write'], reverse=True)
+        others = [step.memory for step in self.steps if step.kind != 'write']
+        return max(others + [sum(writes[:nprocs])])
+
+    def tiles(self):
+        """Number of tiles of a tiled run, or None."""
+        if 'tiling' not in self.config:
+            return None
+        res = target_resolutions(self.config)[0]
+        rgn = self.config['region']
+        nrows = math.ceil(round((rgn['north'] - rgn['south']) / res, 6))
+        ncols = math.ceil(round((rgn['east'] - rgn['west']) / res, 6))
+        tile_rows = int(self.config['tiling'].get('tile_rows', 1200))
+        tile_cols = int(self.config['tiling'].get('tile_cols', 1200))
+        return math.ceil(nrows / tile_rows) * math.ceil(ncols / tile_cols)
+
+    def format(self):
+        """The plan as a table, one line per step."""
+        lines = [
+            f"{'step':<48} {'kind':<9} {'maps':>5} {'native cells':>14} {'target cells':>14} "
+            f"{'time':>9} {'disk':>9} {'memory':>9}"
+        ]
+        for step in self.steps:
+            lines.append(
+                f'{step.name:<48} {step.kind:<9} {step.nmaps:>5} {step.native_cells:>14,} {step.target_cells:>14,} '
+                f'{format_seconds(step.seconds):>9} {format_bytes(step.disk):>9} {format_bytes(step.memory):>9}'
+            )
+        lines.append('')
+        lines.append(f'Estimated time:   {format_seconds(self.seconds)}')
+        lines.append(f'Maps and outputs: {format_bytes(self.disk)} ({format_bytes(self.output_disk)} of output files)')
+        lines.append(f'Peak memory:      {format_bytes(self.memory)}')
+        if self.land_points:
+            lines.append('Output sizes assume every cell is a land point, so are upper bounds')
+        ntiles = self.tiles()
+        if ntiles is not None:
+            compute = sum(step.seconds for step in self.steps if step.kind in ['native', 'resample'])
+            lines.append(f'Tiles:            {ntiles}, each taking about {format_seconds(compute / ntiles)}')
+        return '\n'.join(lines)
+
+
+def format_seconds(seconds):
+    if seconds < 60:
+        return f'{seconds:.0f}s'
+    if seconds < 3600:
+        return f'{seconds / 60:.1f}m'
+    return f'{seconds / 3600:.1f}h'
+
+
+def format_bytes(nbytes):
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if nbytes < 1024:
+            return f'{nbytes:.0f}{unit}' if unit == 'B' else f'{nbytes:.1f}{unit}'
+        nbytes /= 1024
+    return f'{nbytes:.1f}TiB'
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+import csv
+import logging
+import multiprocessing
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+
+from rasterio.enums import Resampling
+from rasterio.windows import Window, from_bounds
+from rasterio.windows import bounds as window_bounds
+from rasterio.windows import transform as window_transform
+
+from jamr.backends.backend import expression_names
+from jamr.backends.native_backend import (evaluate_expression, fill_nearest)
+from jamr.process.ancillarydataset import target_resolution
+from jamr.process.landcover import (ADJUSTED_POULTER_CROSSWALK, JULES_5PFT_NAMES, JULES_9PFT_NAMES,
+                                    JULES_PFT_EXPRESSIONS, consolidate_ice, write_jules_frac_1d)
+from jamr.process.landfraction import (write_jules_land_frac_1d, write_jules_latlon_1d)
+from jamr.process.soilprops import (BROOKS_COREY_EXPRESSION, COSBY_EXPRESSIONS, write_jules_soil_props_1d)
+from jamr.process.writejobs import (WriteJob, run_write_jobs)
+from jamr.utils.blocks import (SitePointIndex, land_masked)
+from jamr.utils.utils import (output_options, output_path)
+from jamr.utils.constants import (CRITICAL_POINT_SUCTION,
+                                  WILTING_POINT_SUCTION,
+                                  JULES_SOIL_VARIABLES)
+
+LOGGER = logging.getLogger(__name__)
+
+# Tolerance used when snapping site boxes to input grids
+EPS = 1e-9
+
+# Padding (degrees) of the window of the ecoregions searched for the nearest
+# ecoregion of cells without one, as r.grow.distance does for gridded output
+ECOREGIONS_PAD = 1.0
+
+Site = namedtuple('Site', ['id', 'lat', 'lon'])
+
+
+def read_sites(filename):
+    """Read sites from a CSV file with columns `id`, `lat` and `lon`."""
+    with open(filename, newline='') as f:
+        return [Site(row['id'], float(row['lat']), float(row['lon'])) for row in csv.DictReader(f)]
+
+
+def group_sites(sites, group_size):
+    """Group the indices of sites falling in the same `group_size` degree
+    tile, so that the sites in a group share one read of each input."""
+    groups = {}
+    for index, site in enumerate(sites):
+        key = (int(np.floor(site.lat / group_size)), int(np.floor(site.lon / group_size)))
+        groups.setdefault(key, []).append(index)
+    return list(groups.values())
+
+
+def crosswalk_table(pft):
+    """Lookup table from ESA CCI land cover class to the fraction of a
+    Poulter et al. (2015) PFT."""
+    table = np.zeros(256, dtype=np.float64)
+    for lc_class, fraction in ADJUSTED_POULTER_CROSSWALK[pft].items():
+        table[lc_class] = fraction
+    return table
+
+
+def _evaluate(expression, arrays, shape):
+    """Evaluate a map algebra expression on arrays given by name, as the
+    backends do on maps."""
+    names = expression_names(expression)
+    block = np.zeros((len(names),) + shape)
+    for i, name in enumerate(names):
+        block[i] = arrays[name]
+    return evaluate_expression(expression, names, block)
+
+
+def jules_pft_fractions(pfts, c4_grass_area, c4_crop_area, tropical, npft):
+    """Fractions of the JULES types from the Poulter et al. (2015) PFT
+    fractions, with the expressions used by Poulter2015FivePFT and 
+    Poulter2015NinePFT. Returns an array with shape (ntype, ...)."""
+    if npft == 5:
+        names = JULES_5PFT_NAMES
+    elif npft == 9:
+        names = JULES_9PFT_NAMES
+    else:
+        raise ValueError(f'Unknown number of PFTs: {npft}')
+    arrays = dict(pfts, c4_grass_area=c4_grass_area, c4_crop_area=c4_crop_area, tropical=tropical)
+    return np.stack([_evaluate(JULES_PFT_EXPRESSIONS[name], arrays, np.shape(tropical)) for name in names])
+
+
+def cosby_soil_props(clay_content, sand_content):
+    """Cosby et al. (1984) soil properties, with the expressions used by 
+    CosbyPTF."""
+    shape = np.shape(clay_content)
+    arrays = {'clay_content': clay_content, 'sand_content': sand_content}
+    props = {property: _evaluate(expression, arrays, shape) for property, expression in COSBY_EXPRESSIONS.items()}
+    for property, suction in [('theta_crit', CRITICAL_POINT_SUCTION), ('theta_wilt', WILTING_POINT_SUCTION)]:
+        props[property] = _evaluate(BROOKS_COREY_EXPRESSION.format(suction=suction), props, shape)
+    return props
+
+
+def _snap_window(transform, bounds):
+    """Smallest window of a grid covering `bounds` (w, s, e, n)."""
+    w, s, e, n = bounds
+    col0 = int(np.floor((w - transform.c) / transform.a + EPS))
+    col1 = int(np.ceil((e - transform.c) / transform.a - EPS))
+    row0 = int(np.floor((transform.f - n) / -transform.e + EPS))
+    row1 = int(np.ceil((transform.f - s) / -transform.e - EPS))
+    return Window(col0, row0, max(col1 - col0, 1), max(row1 - row0, 1))
+
+
+def _read_resampled(filename, bounds, shape, resampling):
+    """Read the part of a raster within `bounds`, resampled to `shape`.
+    Cells outside the raster or without data are NaN."""
+    with rasterio.open(filename) as src:
+        window = from_bounds(*bounds, transform=src.transform)
+        arr = src.read(1, window=window, out_shape=shape, resampling=resampling, boundless=True, masked=True)
+    return arr.astype(np.float64).filled(np.nan)
+
+
+def _read_ecoregions(filename, bounds, shape, pad=ECOREGIONS_PAD):
+    """Read the biomes within `bounds`, resampled to `shape`, with cells 
+    without a biome (e.g. water) filled from the nearest cell with one."""
+    w, s, e, n = bounds
+    yres, xres = (n - s) / shape[0], (e - w) / shape[1]
+    prows, pcols = int(np.ceil(pad / yres)), int(np.ceil(pad / xres))
+    padded_bounds = (w - pcols * xres, s - prows * yres, e + pcols * xres, n + prows * yres)
+    padded_shape = (shape[0] + 2 * prows, shape[1] + 2 * pcols)
+    biome = _read_resampled(filename, padded_bounds, padded_shape, Resampling.nearest)
+    # Zero is the null value of the rasterized ecoregions
+    biome[biome == 0] = np.nan
+    return fill_nearest(biome)[prows:(prows + shape[0]), pcols:(pcols + shape[1])]
+
+
+def _site_bounds(site, resolution):
+    return (site.lon - resolution / 2, site.lat - resolution / 2, site.lon + resolution / 2, site.lat + resolution / 2)
+
+
+def _weighted_mean(values, weights):
+    valid = np.isfinite(values)
+    weights = np.where(valid, weights, 0.)
+    weights_sum = weights.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weights_sum > 0, (np.where(valid, values, 0.) * weights).sum(axis=-1) / weights_sum, np.nan)
+
+
+def process_site_group(filenames, horizons, sites, resolution, npfts):
+    """Compute the ancillary data of a group of sites.
+
+    Each input is read once for the group, over the smallest window of the
+    ESA CCI land cover grid covering all the sites, and resampled to that
+    grid. The land fraction, crosswalk and PTFs are then applied to the
+    native cells within the box around each site, with the other fields
+    averaged over the land cells in the box.
+
+    Returns a list with a (land_frac, frac, surf_hgt, soil_props) tuple
+    for each site, where `frac` and `surf_hgt` map each number of PFTs to
+    an array with one value per type and `soil_props` maps each soil
+    property to an array with one value per horizon.
+    """
+    site_bounds = np.array([_site_bounds(site, resolution) for site in sites])
+    bounds = (site_bounds[:, 0].min(), site_bounds[:, 1].min(), site_bounds[:, 2].max(), site_bounds[:, 3].max())
+    with rasterio.open(filenames['landcover']) as src:
+        window = _snap_window(src.transform, bounds)
+        transform = window_transform(window, src.transform)
+        lc = src.read(1, window=window, boundless=True, fill_value=0, masked=True).filled(0).astype(np.int64)
+        bounds = window_bounds(window, src.transform)
+
+    def read(key, resampling=Resampling.nearest):
+        return _read_resampled(filenames[key], bounds, lc.shape, resampling)
+
+    # Land fraction, as ESALandFraction
+    water_bodies = read('waterbodies', Resampling.min)
+    land = np.logical_not((water_bodies == 0) & (lc == 210))
+
+    # PFT fractions, as _Poulter2015PFT and the JULES PFT classes
+    lc = np.clip(lc, 0, 255)
+    pfts = {pft: crosswalk_table(pft)[lc] for pft in ADJUSTED_POULTER_CROSSWALK.keys()}
+    c4_grass_area = read('c4_grass_area')
+    c4_crop_area = read('c4_crop_area')
+    biome = _read_ecoregions(filenames['ecoregions'], bounds, lc.shape)
+    tropical = ((biome == 1) | (biome == 2)).astype(np.float64)
+    frac = {npft: jules_pft_fractions(pfts, c4_grass_area, c4_crop_area, tropical, npft) for npft in npfts}
+    elevation = read('elevation', Resampling.average)
+
+    # Soil properties, as CosbyPTF
+    soil_props = {}
+    for horizon in horizons:
+        props = cosby_soil_props(read(f'clay_content_{horizon}'), read(f'sand_content_{horizon}'))
+        for property in JULES_SOIL_VARIABLES:
+            soil_props.setdefault(property, []).append(props[property])
+    soil_props = {property: np.stack(arrs) for property, arrs in soil_props.items()}
+
+    results = []
+    for site_bnds in site_bounds:
+        site_window = _snap_window(transform, site_bnds)
+        rows = slice(max(site_window.row_off, 0), min(site_window.row_off + site_window.height, lc.shape[0]))
+        cols = slice(max(site_window.col_off, 0), min(site_window.col_off + site_window.width, lc.shape[1]))
+        site_land = land[rows, cols]
+        land_frac = site_land.mean()
+        site_elevation = elevation[rows, cols][site_land]
+        site_frac = {}
+        site_surf_hgt = {}
+        for npft in npfts:
+            # Null cells (e.g. without C4 fractions) are left out of the 
+            # mean, as when the maps are resampled
+            native_frac = frac[npft][:, rows, cols][:, site_land]
+            site_frac[npft] = _weighted_mean(native_frac, np.ones_like(native_frac))
+            site_surf_hgt[npft] = _weighted_mean(site_elevation[None, :], np.nan_to_num(native_frac))
+
+        site_soil_props = {}
+        for property, arr in soil_props.items():
+            values = arr[:, rows, cols][:, site_land]
+            site_soil_props[property] = _weighted_mean(values, np.ones_like(values))
+
+        results.append((land_frac, site_frac, site_surf_hgt, site_soil_props))
+
+    return results
+
+
+class PointProcessData:
+    """Data set class to compute JULES ancillary data at point sites.
+
+    Only small windows of the input files around the sites are read, and
+    the output is written in the land point layout with one point per site,
+    in the order of the sites file.
+
+    Parameters
+    ----------
+    config : dict
+        The run configuration. The `points` section may set `resolution`,
+        the size (degrees) of the box around each site, which defaults to
+        the finest target resolution, and `group_size`, the size (degrees)
+        of the tiles used to group sites which share reads.
+    inputdata : InputData
+        The raw input data, preprocessed but not necessarily imported.
+    sites : list
+        Sites returned by `read_sites`.
+    """
+    def __init__(self, config, inputdata, sites):
+        self.config = config
+        self.inputdata = inputdata
+        self.sites = sites
+        points = config.get('points', {})
+        self.resolution = float(points.get('resolution', target_resolution(config)[0]))
+        self.group_size = float(points.get('group_size', 1.0))
+        self.npfts = [int(n) for n in config['methods']['npft']]
+        self.year = 2015
+        if any(method != 'Poulter' for method in config['methods']['frac']):
+            raise ValueError('Only the Poulter land cover fraction method is available at point sites')
+        if any(method != 'Cosby' for method in config['methods']['soil_props']):
+            raise ValueError('Only the Cosby soil properties method is available at point sites')
+
+    def input_filenames(self):
+        filenames = {
+            'landcover': self.inputdata.landcover.preprocessed_filenames[self.year],
+            'waterbodies': self.inputdata.waterbodies.preprocessed_filename,
+            'elevation': self.inputdata.elevation.preprocessed_filenames['globe_0.002778Deg'],
+            'ecoregions': self.inputdata.ecoregions.preprocessed_filenames[0],
+            'c4_grass_area': self.inputdata.c4fraction.preprocessed_filenames[self.year]['C4_grass_area'],
+            'c4_crop_area': self.inputdata.c4fraction.preprocessed_filenames[self.year]['C4_crop_area']
+        }
+        for horizon, soilhorizon in self.inputdata.soil.items():
+            filenames[f'clay_content_{horizon}'] = soilhorizon.preprocessed_filenames['clay_content']
+            filenames[f'sand_content_{horizon}'] = soilhorizon.preprocessed_filenames['sand_content']
+        return filenames
+
+    def compute(self):
+        filenames = self.input_filenames()
+        horizons = list(self.inputdata.soil.keys())
+        groups = group_sites(self.sites, self.group_size)
+        nprocs = int(self.config['main'].get('nprocs', 1))
+        LOGGER.info(f'Computing ancillary data for {len(self.sites)} sites in {len(groups)} groups')
+        args = [
+            (filenames, horizons, [self.sites[index] for index in group], self.resolution, self.npfts)
+            for group in groups
+        ]
+        if nprocs > 1 and len(groups) > 1:
+            with ProcessPoolExecutor(max_workers=nprocs, mp_context=multiprocessing.get_context('fork')) as executor:
+                group_results = list(executor.map(process_site_group, *zip(*args)))
+        else:
+            group_results = [process_site_group(*arg) for arg in args]
+
+        nsites = len(self.sites)
+        self.land_frac = np.zeros(nsites)
+        self.frac = {}
+        self.surf_hgt = {}
+        self.soil_props = {property: np.zeros((len(horizons), nsites)) for property in JULES_SOIL_VARIABLES}
+        for group, results in zip(groups, group_results):
+            for index, (land_frac, frac, surf_hgt, soil_props) in zip(group, results):
+                self.land_frac[index] = land_frac
+                for npft in self.npfts:
+                    self.frac.setdefault(npft, np.zeros((len(frac[npft]), nsites)))[:, index] = frac[npft]
+                    self.surf_hgt.setdefault(npft, np.zeros((len(surf_hgt[npft]), nsites)))[:, index] = surf_hgt[npft]
+                for property in JULES_SOIL_VARIABLES:
+                    self.soil_props[property][:, index] = soil_props[property]
+
+        # Normalise fractions and consolidate ice, as Poulter2015JulesPFT.iter_data_blocks
+        for npft in self.npfts:
+            pft_names = JULES_5PFT_NAMES if npft == 5 else JULES_9PFT_NAMES
+            frac = np.nan_to_num(self.frac[npft])
+            surf_hgt = self.surf_hgt[npft].copy()
+            with np.errstate(invalid='ignore', divide='ignore'):
+                frac /= frac.sum(axis=0)
+            consolidate_ice(
+                frac[:, None, :], surf_hgt[:, None, :],
+                soil_index=pft_names.index('bare_soil'), ice_index=pft_names.index('snow_ice')
+            )
+            self.frac[npft] = frac
+            self.surf_hgt[npft] = surf_hgt
+
+    def _masked(self, arr):
+        return land_masked(arr, self.land_frac)
+
+    def write_jobs(self):
+        output_directory = self.config['main']['output_directory']
+        options = output_options(self.config)
+        options['suffix'] = options['suffix'] + '_points'
+        land_index = SitePointIndex(len(self.sites))
+        x_vals = np.array([site.lon for site in self.sites])
+        y_vals = np.array([site.lat for site in self.sites])
+        kwargs = dict(land_index=land_index, x_vals=x_vals, y_vals=y_vals, options=options)
+        jobs = [
+            WriteJob(output_path(output_directory, 'jamr_latlon', options), self._write_latlon, **kwargs),
+            WriteJob(output_path(output_directory, 'jamr_landfrac', options), self._write_land_frac, **kwargs),
+            WriteJob(output_path(output_directory, 'jamr_soil_props', options), self._write_soil_props, **kwargs)
+        ]
+        for npft in self.npfts:
+            basename = f'jamr_frac_{self.year}' if len(self.npfts) == 1 else f'jamr_frac_{npft}pft_{self.year}'
+            jobs.append(WriteJob(output_path(output_directory, basename, options), self._write_frac, npft=npft, **kwargs))
+        return jobs
+
+    def write(self):
+        run_write_jobs(self.write_jobs(), nprocs=int(self.config['main'].get('nprocs', 1)))
+
+    def _write_latlon(self, output_filename, land_index, x_vals, y_vals, options):
+        write_jules_latlon_1d(output_filename, land_index, x_vals, y_vals, 'land', options)
+
+    def _write_land_frac(self, output_filename, land_index, x_vals, y_vals, options):
+        blocks = [(0, land_index.nland, self.land_frac)]
+        write_jules_land_frac_1d(blocks, output_filename, land_index, x_vals, y_vals, 'land', options)
+
+    def _write_frac(self, output_filename, npft, land_index, x_vals, y_vals, options):
+        frac = self.frac[npft]
+        blocks = [(0, land_index.nland, self._masked(frac), self._masked(self.surf_hgt[npft]))]
+        write_jules_frac_1d(blocks, frac.shape[0], output_filename, land_index, x_vals, y_vals, 'land', 'type', options)
+
+    def _write_soil_props(self, output_filename, land_index, x_vals, y_vals, options):
+        fields = {
+            property: [(0, land_index.nland, self._masked(arr))]
+            for property, arr in self.soil_props.items()
+        }
+        nsoil = len(self.inputdata.soil)
+        write_jules_soil_props_1d(fields, nsoil, output_filename, land_index, x_vals, y_vals, 'land', 'soil', options)
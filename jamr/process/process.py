@@ -1,7 +1,13 @@
-
+from jamr.backends.backend import get_backend
+from jamr.process.ancillarydataset import (aggregate_to_target, resolution_config, set_target_region, 
+                                           target_resolutions)
+from jamr.process.intermediates import IntermediateMaps
 from jamr.process.landfraction import LandFractionFactory
 from jamr.process.landcover import LandCoverFractionFactory
 from jamr.process.soilprops import SoilPropsFactory
+from jamr.process.writejobs import run_write_jobs
+from jamr.utils.regrid import (Regridder, regrid_enabled)
+from jamr.utils.utils import output_options
 
 
 class ProcessData:
@@ -15,15 +21,39 @@ class ProcessData:
         The raw input data.
     overwrite : bool 
         Whether to overwrite files in the GRASS GIS database.  
+    coarse_land_index : CoarseLandIndex, optional
+        Index used to skip ocean blocks. If not supplied it is built from the
+        land fraction inputs when first needed.
+    journal : StepJournal, optional
+        Journal recording completed steps, which are skipped when a run is
+        resumed.
+
+    Maps are computed at the finest target resolution. Output at coarser 
+    target resolutions is aggregated from these maps and written by a 
+    ProcessData object for each resolution. Intermediate maps are removed 
+    once the last step reading them has finished, unless `keep_intermediates`
+    is set in the `main` section of the configuration.
     """
     def __init__(self, 
                  config, 
                  inputdata, 
-                 overwrite):
+                 overwrite,
+                 coarse_land_index=None,
+                 journal=None):
 
         self.config = config
         self.inputdata = inputdata 
         self.overwrite = overwrite 
+        self.coarse_land_index = coarse_land_index
+        self.journal = journal
+        self.intermediates = IntermediateMaps(keep=config['main'].get('keep_intermediates', False))
+
+        resolutions = target_resolutions(config)
+        self.coarse = []
+        if len(resolutions) > 1:
+            self.config = resolution_config(config, resolutions[0], rename=False)
+            for res in resolutions[1:]:
+                self.coarse.append(ProcessData(resolution_config(config, res), inputdata, overwrite, journal=journal))
         
         # NOTE only one method allowed
         land_fraction_method = self.config['methods']['land_fraction']
@@ -59,22 +89,136 @@ class ProcessData:
         #     frac_obj.initial()
         for soil_props_obj in self.soil_props:
             soil_props_obj.initial()
+
+        for process in self.coarse:
+            process.initial()
         
+    def build_coarse_land_index(self):
+        if self.coarse_land_index is None:
+            self.coarse_land_index = self.landfrac.compute_coarse_land_index()
+
+        for obj in [self.landfrac] + self.frac + self.soil_props:
+            obj.coarse_land_index = self.coarse_land_index
+
+        return self.coarse_land_index
+
+    def run_step(self, step, function, maps):
+        """Run a step producing `maps`, recording it in the journal, if any, 
+        then remove intermediate maps which are no longer needed."""
+        if self.journal is None:
+            function()
+        else:
+            self.journal.run(f"{self.config['region']['name']}/{step}", function, maps=maps)
+        self.intermediates.release(step)
+
     def compute(self):
-        self.landfrac.compute()
+        self.build_coarse_land_index()
+        frac_steps = [f'frac_{type(frac_obj).__name__}' for frac_obj in self.frac]
+        soil_props_steps = [f'soil_props_{soil_props_obj.method}' for soil_props_obj in self.soil_props]
+
+        # The native land fraction map masks the land cover and soil steps
         landfrac_mapname = self.landfrac.mapname_native
-        for frac_obj in self.frac: 
-            frac_obj.compute(landfrac_mapname)
+        self.intermediates.add([landfrac_mapname], (frac_steps + soil_props_steps) or ['land_fraction'])
+        self.run_step('land_fraction', self.landfrac.compute, self.landfrac.output_mapnames())
+        for step, frac_obj in zip(frac_steps, self.frac): 
+            self.intermediates.add(frac_obj.intermediate_mapnames(), [step])
+            self.run_step(step, lambda: frac_obj.compute(landfrac_mapname), frac_obj.output_mapnames())
+
+        for step, soil_props_obj in zip(soil_props_steps, self.soil_props):
+            self.intermediates.add(soil_props_obj.intermediate_mapnames(), [step])
+            self.run_step(step, lambda: soil_props_obj.compute(landfrac_mapname), soil_props_obj.output_mapnames())
+
+        self.aggregate()
+
+    def aggregate(self):
+        """Aggregate the output maps to the coarser target resolutions."""
+        weights = self.output_weights()
+        for process in self.coarse:
+            maps = [
+                (mapname, coarse_mapname, weights[mapname]) 
+                for mapname, coarse_mapname in zip(self.output_mapnames(), process.output_mapnames())
+            ]
+            self.run_step(
+                f"aggregate_{process.config['region']['name']}", 
+                lambda: aggregate_to_target(self.config, process.config, maps, overwrite=True), 
+                process.output_mapnames()
+            )
+
+    def output_mapnames(self):
+        """Maps in the target region which are read by the writers."""
+        mapnames = self.landfrac.output_mapnames()
+        for frac_obj in self.frac:
+            mapnames += frac_obj.output_mapnames()
 
         for soil_props_obj in self.soil_props:
-            soil_props_obj.compute(landfrac_mapname)
+            mapnames += soil_props_obj.output_mapnames()
 
-    def write(self):
-        self.landfrac.write_netcdf()
-        
+        return mapnames
+
+    def output_weights(self):
+        """Weight maps of each output map, used to aggregate it to coarser 
+        target resolutions. Maps relative to the land area are weighted by 
+        the land fraction, and the surface height of each PFT also by the 
+        fraction of the PFT."""
         landfrac_mapname = self.landfrac.mapname
+        weights = {mapname: [landfrac_mapname] for mapname in self.output_mapnames()}
+        weights[landfrac_mapname] = []
+        for frac_obj in self.frac:
+            for mapname, weight_mapname in frac_obj.output_weights().items():
+                weights[mapname] = [landfrac_mapname, weight_mapname]
+
+        return weights
+
+    def write_jobs(self):
+        self.build_coarse_land_index()
+
+        landfrac_mapname = self.landfrac.mapname
+        if regrid_enabled(self.config):
+            jobs = self.regrid_jobs()
+        else:
+            # The land point index is built once and shared by all writers
+            land_index = None
+            if output_options(self.config)['grid_layout'] == 'land_points':
+                land_index = self.landfrac.land_point_index()
+
+            # Each output file is written by an independent job
+            jobs = self.landfrac.write_jobs(land_index)
+            for frac_obj in self.frac: 
+                jobs += frac_obj.write_jobs(landfrac_mapname, land_index)
+            
+            for soil_props_obj in self.soil_props:
+                jobs += soil_props_obj.write_jobs(landfrac_mapname, land_index)
+
+        set_target_region(self.config)
+        region = get_backend().region_env()
+        for job in jobs:
+            job.region = region
+
+        return jobs
+
+    def regrid_jobs(self):
+        """Jobs writing output regridded from the target lat/lon grid to the 
+        grid in the `regrid` section of the configuration."""
+        if output_options(self.config)['grid_layout'] == 'land_points':
+            raise ValueError('Regridded output is only available with the grid layout')
+
+        # The weights are computed (or read from the cache) once and shared by all writers
+        set_target_region(self.config)
+        regridder = Regridder.from_config(self.config, get_backend().region_definition())
+        landfrac_mapname = self.landfrac.mapname
+        jobs = self.landfrac.regrid_jobs(regridder)
         for frac_obj in self.frac: 
-            frac_obj.write_netcdf(landfrac_mapname)
-        
+            jobs += frac_obj.regrid_jobs(regridder, landfrac_mapname)
+
         for soil_props_obj in self.soil_props:
-            soil_props_obj.write_netcdf(landfrac_mapname)
\ No newline at end of file
+            jobs += soil_props_obj.regrid_jobs(regridder, landfrac_mapname)
+
+        return jobs
+
+    def write(self):
+        jobs = self.write_jobs()
+        for process in self.coarse:
+            process.coarse_land_index = self.coarse_land_index
+            jobs += process.write_jobs()
+
+        run_write_jobs(jobs, nprocs=int(self.config['main'].get('nprocs', 1)), journal=self.journal)
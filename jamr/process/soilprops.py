@@ -1,23 +1,16 @@
 #!/usr/bin/env python3
 
-import os
 import numpy as np
-import netCDF4 
 
 import logging
 
-from subprocess import PIPE
-
-import grass.script as gscript
-
-from grass.script import array as garray 
-from grass.script import core as grass 
-
-from grass.pygrass.modules.shortcuts import raster as r
-
-from jamr.process.ancillarydataset import AncillaryDataset
-from jamr.utils.grass_utils import *
-from jamr.utils.utils import (raster2array, add_lat_lon_dims_2d, F8_FILLVAL)
+from jamr.backends.backend import get_backend
+from jamr.process.ancillarydataset import (AncillaryDataset, set_target_region)
+from jamr.process.writejobs import WriteJob
+from jamr.utils.blocks import (block_rows, iter_row_blocks, land_masked, rows_have_land)
+from jamr.utils.regrid import write_regridded
+from jamr.utils.utils import (region_coords, add_lat_lon_dims_2d, add_land_point_dims_1d, output_options, 
+                              output_path, open_output_dataset, create_output_variable)
 from jamr.utils.constants import (F8_FILLVAL,
                                   ZHANGSCHAAP_FACTORS, 
                                   CRITICAL_POINT_SUCTION, 
@@ -65,61 +58,71 @@ class PTF(AncillaryDataset):
         self.horizon = soilhorizon.horizon.replace('-', '_')
         # Variables computed by this class
         # self.variables = JULES_SOIL_VARIABLES
-        grass_remove_mask()
+        self.backend.remove_mask()
+
+    def intermediate_mapnames(self):
+        """Maps computed at the native resolution of the soil data."""
+        return [mapname for key, mapname in vars(self).items() if key.endswith('_mapname_native')]
+
+
+# Map algebra expressions of the Cosby et al. (1984) PTF and the Brooks and
+# Corey equation of the water content at a given suction, used for both 
+# gridded output and point sites
+COSBY_EXPRESSIONS = {
+    'b': '(3.10 + 0.157 * {clay_content} - 0.003 * {sand_content})',
+    'psi_m': '0.01 * (10 ** (2.17 - (0.0063 * {clay_content}) - (0.0158 * {sand_content})))',
+    'ksat': '(25.4 / (60 * 60)) * (10 ** (-0.60 - (0.0064 * {clay_content}) + (0.0126 * {sand_content})))',
+    'theta_sat': '0.01 * (50.5 - 0.037 * {clay_content} - 0.142 * {sand_content})',
+    'theta_res': '0'
+}
+BROOKS_COREY_EXPRESSION = '{{theta_sat}} * ({{psi_m}} / {suction}) ** (1 / {{b}})'
 
 
 def cosby_brooks_corey_b(b, clay_content, sand_content, overwrite): 
-    p = gscript.start_command('r.mapcalc', 
-                              expression=f'{b} = (3.10 + 0.157 * {clay_content} - 0.003 * {sand_content})',
+    return get_backend().calc(b, 
+                              COSBY_EXPRESSIONS['b'],
                               overwrite=overwrite, 
-                              stderr=PIPE)
-    stdout, stderr = p.communicate()
-    return 0
+                              clay_content=clay_content,
+                              sand_content=sand_content)
 
 
 def cosby_brooks_corey_psi_m(psi_m, clay_content, sand_content, overwrite):
-    p = gscript.start_command('r.mapcalc', 
-                              expression=f'{psi_m} = 0.01 * (10 ^ (2.17 - (0.0063 * {clay_content}) - (0.0158 * {sand_content})))',
+    return get_backend().calc(psi_m, 
+                              COSBY_EXPRESSIONS['psi_m'],
                               overwrite=overwrite, 
-                              stderr=PIPE)
-    stdout, stderr = p.communicate()
-    return 0
+                              clay_content=clay_content,
+                              sand_content=sand_content)
 
 
 def cosby_brooks_corey_ksat(ksat, clay_content, sand_content, overwrite):
-    p = gscript.start_command('r.mapcalc',
-                              expression=f'{ksat} = (25.4 / (60 * 60)) * (10 ^ (-0.60 - (0.0064 * {clay_content}) + (0.0126 * {sand_content})))',
+    return get_backend().calc(ksat,
+                              COSBY_EXPRESSIONS['ksat'],
                               overwrite=overwrite,
-                              stderr=PIPE)
-    stdout, stderr = p.communicate()
-    return 0
+                              clay_content=clay_content,
+                              sand_content=sand_content)
 
 
 def cosby_brooks_corey_theta_sat(theta_sat, clay_content, sand_content, overwrite):
-    p = gscript.start_command('r.mapcalc',
-                              expression=f'{theta_sat} = 0.01 * (50.5 - 0.037 * {clay_content} - 0.142 * {sand_content})', 
+    return get_backend().calc(theta_sat,
+                              COSBY_EXPRESSIONS['theta_sat'], 
                               overwrite=overwrite,
-                              stderr=PIPE)
-    stdout, stderr = p.communicate()
-    return 0
+                              fraction=True,
+                              clay_content=clay_content,
+                              sand_content=sand_content)
 
 
 def cosby_theta_res(theta_res, overwrite):
-    p = gscript.start_command('r.mapcalc',
-                              expression=f'{theta_res} = 0', 
-                              overwrite=overwrite,
-                              stderr=PIPE)
-    stdout, stderr = p.communicate()
-    return 0
+    return get_backend().calc(theta_res, COSBY_EXPRESSIONS['theta_res'], overwrite=overwrite, fraction=True)
 
 
 def brooks_corey_eqn(theta, theta_sat, psi_m, b, suction, overwrite):
-    p = gscript.start_command('r.mapcalc',
-                              expression=f'{theta} = {theta_sat} * ({psi_m} / {suction}) ^ (1 / {b})',
+    return get_backend().calc(theta,
+                              BROOKS_COREY_EXPRESSION.format(suction=suction),
                               overwrite=overwrite,
-                              stderr=PIPE)
-    stdout, stderr = p.communicate()
-    return 0
+                              fraction=True,
+                              theta_sat=theta_sat,
+                              psi_m=psi_m,
+                              b=b)
 
 
 class CosbyPTF(PTF):
@@ -140,7 +143,7 @@ class CosbyPTF(PTF):
     def compute(self, landfrac_mapname):
         
         # Apply mask based on supplied land fraction map 
-        r.mask(raster=landfrac_mapname, maskcats=1)
+        self.backend.set_mask(landfrac_mapname, maskcats=1)
 
         # Compute soil properties 
         self.brooks_corey_b()
@@ -152,7 +155,7 @@ class CosbyPTF(PTF):
         self.residual_water_content()
 
         # Remove mask
-        r.mask(flags='r')
+        self.backend.remove_mask()
 
     def brooks_corey_b(self):
         LOGGER.info(f'Computing Brooks Corey b for soil horizon {self.horizon}')
@@ -273,35 +276,33 @@ class VanGenuchtenPTF(PTF):
     def air_entry_pressure(self):
         # From JULES docs (http://jules-lsm.github.io/vn5.4/namelists/ancillaries.nml.html#list-of-soil-parameters) 
         # sathh = 1 / alpha, where alpha has units m-1
-        try:
-            r.mapcalc(f'{self.psi_mapname} = 1 / {self.alpha_mapname}', overwrite=self.overwrite)
-        except grass.exceptions.CalledModuleError:
-            pass
+        self.backend.calc(self.psi_mapname, '1 / {alpha}', overwrite=self.overwrite, alpha=self.alpha_mapname)
 
     def pore_size_distribution(self): 
-        try:
-            r.mapcalc(f'{self.b_mapname} = 1 / ({self.n_mapname} - 1)', overwrite=self.overwrite)
-        except grass.exceptions.CalledModuleError:
-            pass
+        self.backend.calc(self.b_mapname, '1 / ({n} - 1)', overwrite=self.overwrite, n=self.n_mapname)
 
     def van_genuchten_equation(self, suffix, suction, theta_mapname):
-        try:
-            r.mapcalc(
-    	        f'A_{suffix}_{self.method}_{self.horizon}_{self.region} = ({self.alpha_mapname} * {suction}) ^ {self.n_mapname}',
-                overwrite=self.overwrite
-            )
-            r.mapcalc(
-                f'Se_{suffix}_{self.method}_{self.horizon}_{self.region} = (1 + A_{suffix}_{self.method}_{self.horizon}_{self.region}) '
-                f'^ ((1 / {self.n_mapname}) - 1)',
-                overwrite=self.overwrite
-            )
-            r.mapcalc(
-    	        f'{theta_mapname} = (Se_{suffix}_{self.method}_{self.horizon}_{self.region} '
-                f'* ({self.theta_sat_mapname} - {self.theta_res_mapname})) + {self.theta_res_mapname}',
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        A_mapname = f'A_{suffix}_{self.method}_{self.horizon}_{self.region_name}'
+        Se_mapname = f'Se_{suffix}_{self.method}_{self.horizon}_{self.region_name}'
+        self.backend.calc(
+            A_mapname, f'({{alpha}} * {suction}) ** {{n}}', 
+            overwrite=self.overwrite, alpha=self.alpha_mapname, n=self.n_mapname
+        )
+        self.backend.calc(
+            Se_mapname, '(1 + {A}) ** ((1 / {n}) - 1)', 
+            overwrite=self.overwrite, A=A_mapname, n=self.n_mapname
+        )
+        self.backend.calc(
+            theta_mapname, '({Se} * ({theta_sat} - {theta_res})) + {theta_res}', 
+            overwrite=self.overwrite, Se=Se_mapname, theta_sat=self.theta_sat_mapname, 
+            theta_res=self.theta_res_mapname
+        )
+
+    def intermediate_mapnames(self):
+        return [
+            f'{prefix}_{suffix}_{self.method}_{self.horizon}_{self.region_name}' 
+            for prefix in ['A', 'Se'] for suffix in ['crit', 'wilt']
+        ]
 
     def critical_water_content(self):
         self.van_genuchten_equation('crit', CRITICAL_POINT_SUCTION, self.theta_crit_mapname)
@@ -319,69 +320,58 @@ class TomasellaHodnettPTF(VanGenuchtenPTF):
         super().__init__('tomasellahodnett', config, soilhorizon, overwrite)
 
     def van_genuchten_n(self): 
-        try:
-            r.mapcalc(
-                (
-                    f'{self.n_mapname} = exp((62.986 - (0.833 * {self.clay_content}) '
-                    f'- (0.529 * ({self.soil_organic_carbon} / 10)) + (0.593 * {self.ph_index} / 10) '
-                    f'+ (0.007 * {self.clay_content} * {self.clay_content}) '
-                    f'- (0.014 * {self.sand_content} * {self.silt_content})) / 100)'
-                ),
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        self.backend.calc(
+            self.n_mapname,
+            (
+                'exp((62.986 - (0.833 * {clay}) '
+                '- (0.529 * ({soc} / 10)) + (0.593 * {ph} / 10) '
+                '+ (0.007 * {clay} * {clay}) '
+                '- (0.014 * {sand} * {silt})) / 100)'
+            ),
+            overwrite=self.overwrite, clay=self.clay_content, sand=self.sand_content, 
+            silt=self.silt_content, soc=self.soil_organic_carbon, ph=self.ph_index
+        )
 
     def van_genuchten_alpha(self):
-        try: 
-            r.mapcalc(
-                (
-                    f'{self.alpha_mapname} = 9.80665 * exp((-2.294 - (3.526 * {self.silt_content}) '
-                    f'+ (2.440 * ({self.soil_organic_carbon} / 10)) - (0.076 * {self.cation_exchange_capacity}) '
-                    f'- (11.331 * {self.ph_index} / 10) + (0.019 * {self.silt_content} * {self.silt_content})) / 100)'
-                ),
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        self.backend.calc(
+            self.alpha_mapname,
+            (
+                '9.80665 * exp((-2.294 - (3.526 * {silt}) '
+                '+ (2.440 * ({soc} / 10)) - (0.076 * {cec}) '
+                '- (11.331 * {ph} / 10) + (0.019 * {silt} * {silt})) / 100)'
+            ),
+            overwrite=self.overwrite, silt=self.silt_content, soc=self.soil_organic_carbon, 
+            cec=self.cation_exchange_capacity, ph=self.ph_index
+        )
 
     def saturated_water_content(self):
-        try:
-            r.mapcalc(
-                (
-    	            f'{self.theta_sat_mapname} = 0.01 * (81.799 + (0.099 * {self.clay_content}) '
-                    f'- (31.42 * {self.bulk_density} * 0.001) + (0.018 * {self.cation_exchange_capacity}) '
-                    f'+ (0.451 * {self.ph_index} / 10) - (0.0005 * {self.sand_content} * {self.clay_content}))'
-                ),
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        self.backend.calc(
+            self.theta_sat_mapname,
+            (
+                '0.01 * (81.799 + (0.099 * {clay}) '
+                '- (31.42 * {bdod} * 0.001) + (0.018 * {cec}) '
+                '+ (0.451 * {ph} / 10) - (0.0005 * {sand} * {clay}))'
+            ),
+            overwrite=self.overwrite, clay=self.clay_content, sand=self.sand_content, 
+            bdod=self.bulk_density, cec=self.cation_exchange_capacity, ph=self.ph_index
+        )
 
     def residual_water_content(self):
-        try:
-            r.mapcalc(
-                (
-                    f'{self.theta_res_mapname} = 0.01 * (22.733 - (0.164 * {self.sand_content}) '
-                    f'+ (0.235 * {self.cation_exchange_capacity}) - (0.831 * {self.ph_index} / 10) '
-                    f'+ (0.0018 * {self.clay_content} * {self.clay_content}) '
-                    f'+ (0.0026 * {self.sand_content} * {self.clay_content}))'
-                ),
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        self.backend.calc(
+            self.theta_res_mapname,
+            (
+                '0.01 * (22.733 - (0.164 * {sand}) '
+                '+ (0.235 * {cec}) - (0.831 * {ph} / 10) '
+                '+ (0.0018 * {clay} * {clay}) '
+                '+ (0.0026 * {sand} * {clay}))'
+            ),
+            overwrite=self.overwrite, clay=self.clay_content, sand=self.sand_content, 
+            cec=self.cation_exchange_capacity, ph=self.ph_index
+        )
 
     def saturated_hydraulic_conductivity(self):
         # Tomasella & Hodnett do not provide a transfer function, so we use Cosby PTF instead
-        try:
-            r.mapcalc(
-                f'{self.ksat_mapname} = (25.4 / (60 * 60)) '
-                f'* (10 ^ (-0.60 - (0.0064 * {self.clay_content}) + (0.0126 * {self.sand_content})))',
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        cosby_brooks_corey_ksat(self.ksat_mapname, self.clay_content, self.sand_content, self.overwrite)
 
 
 class USDATextureClass:
@@ -400,11 +390,11 @@ class USDATextureClass:
         self._set_mapnames() 
 
     def compute(self):
-        grass_set_region_from_raster(raster=self.clay_content,
-                                     n=self.config['region']['north'],
-                                     s=self.config['region']['south'],
-                                     e=self.config['region']['east'],
-                                     w=self.config['region']['west'])
+        get_backend().set_region_from_raster(raster=self.clay_content,
+                                             n=self.config['region']['north'],
+                                             s=self.config['region']['south'],
+                                             e=self.config['region']['east'],
+                                             w=self.config['region']['west'])
         self._usda_texture_class()
 
     def _set_mapnames(self):
@@ -422,15 +412,13 @@ class USDATextureClass:
         self.usda_sand_mapname = f'usda_sand_{self.horizon}_{self.region_name}'
 
     def _texture_class(self, output, sand_min, sand_max, silt_min, silt_max, clay_min, clay_max):
-        try:
-            r.mapcalc(
-                f'{output} = if(({self.sand_content} >= {sand_min}) & ({self.sand_content} <= {sand_max}) '
-                f'& ({self.silt_content} >= {silt_min}) & ({self.silt_content} <= {silt_max}) '
-                f'& ({self.clay_content} >= {clay_min}) & ({self.clay_content} <= {clay_max}), 1, 0)',
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        get_backend().calc(
+            output,
+            f'where(({{sand}} >= {sand_min}) & ({{sand}} <= {sand_max}) '
+            f'& ({{silt}} >= {silt_min}) & ({{silt}} <= {silt_max}) '
+            f'& ({{clay}} >= {clay_min}) & ({{clay}} <= {clay_max}), 1, 0)',
+            overwrite=self.overwrite, sand=self.sand_content, silt=self.silt_content, clay=self.clay_content
+        )
 
     def _usda_texture_class(self):
         # if sand <= 45 and silt <= 40 and clay >= 40: texture = 'Clay'
@@ -467,34 +455,24 @@ class ZhangSchaapPTF(VanGenuchtenPTF):
         super().__init__('zhangschaap', config, soilhorizon, overwrite)
 
     def compute(self):
-        grass_set_region_from_raster(raster=self.clay_content,
-                                     n=self.config['region']['north'],
-                                     s=self.config['region']['south'],
-                                     e=self.config['region']['east'],
-                                     w=self.config['region']['west'])
+        self.backend.set_region_from_raster(raster=self.clay_content,
+                                            n=self.config['region']['north'],
+                                            s=self.config['region']['south'],
+                                            e=self.config['region']['east'],
+                                            w=self.config['region']['west'])
         self.usda = USDATextureClass(self.config, self.soilhorizon, self.overwrite)
         self.usda.compute() 
         super().compute()
 
     def _zhang_schaap_equation(self, output, factors):
-        try:
-            r.mapcalc(
-	            f'{output} = {self.usda.usda_clay_mapname} * {factors[0]} ' 
-                f'+ {self.usda.usda_silty_clay_mapname} * {factors[1]} '
-                f'+ {self.usda.usda_sandy_clay_mapname} * {factors[2]} '
-                f'+ {self.usda.usda_clay_loam_mapname} * {factors[3]}'
-                f'+ {self.usda.usda_silty_clay_loam_mapname} * {factors[4]}'
-                f'+ {self.usda.usda_sandy_clay_loam_mapname} * {factors[5]}'
-                f'+ {self.usda.usda_loam_mapname} * {factors[6]} '
-                f'+ {self.usda.usda_silt_loam_mapname} * {factors[7]} '
-                f'+ {self.usda.usda_sandy_loam_mapname} * {factors[8]} '
-                f'+ {self.usda.usda_silt_mapname} * {factors[9]} '
-                f'+ {self.usda.usda_loamy_sand_mapname} * {factors[10]} '
-                f'+ {self.usda.usda_sand_mapname} * {factors[11]}',
-                overwrite=self.overwrite
-            )
-        except grass.exceptions.CalledModuleError:
-            pass
+        classes = [
+            'usda_clay', 'usda_silty_clay', 'usda_sandy_clay', 'usda_clay_loam', 
+            'usda_silty_clay_loam', 'usda_sandy_clay_loam', 'usda_loam', 'usda_silt_loam', 
+            'usda_sandy_loam', 'usda_silt', 'usda_loamy_sand', 'usda_sand'
+        ]
+        expression = ' + '.join([f'{{{name}}} * {factor}' for name, factor in zip(classes, factors)])
+        maps = {name: vars(self.usda)[f'{name}_mapname'] for name in classes}
+        self.backend.calc(output, expression, overwrite=self.overwrite, **maps)
 
     def van_genuchten_alpha(self):
         # Step 1: native resolution
@@ -528,6 +506,9 @@ class PTFFactory:
 
 
 class SoilProperties:
+    # CoarseLandIndex used to skip blocks which are entirely ocean
+    coarse_land_index = None
+
     def __init__(self, method, config, inputdata, overwrite):
         self.method = method
         self.config = config 
@@ -545,28 +526,77 @@ class SoilProperties:
         for ptf in self.ptf.values():
             ptf.compute(landfrac_mapname)
 
-    def get_data_arrays(self, property):
-        arr_list = []
-        for ptf in self.ptf.values():
-            arr = garray.array(mapname=vars(ptf)[f'{property}_mapname'])
-            arr_list.append(arr)
-
-        arr = np.stack(arr_list) 
-        return arr
-       
+    def output_mapnames(self):
+        return [vars(ptf)[f'{property}_mapname'] for property in self.variables for ptf in self.ptf.values()]
+
+    def intermediate_mapnames(self):
+        return [mapname for ptf in self.ptf.values() for mapname in ptf.intermediate_mapnames()]
+
+    def iter_data_blocks(self, property, landfrac_mapname, with_land_frac=False):
+        """Yield (start, stop, arr) row blocks of a soil property for all 
+        horizons in the target region, with non-land cells masked, followed 
+        by the land fraction if `with_land_frac` is True."""
+        mapnames = [landfrac_mapname] + [vars(ptf)[f'{property}_mapname'] for ptf in self.ptf.values()]
+        backend = get_backend()
+        rgn_def = backend.region_definition()
+        with backend.block_reader(mapnames) as reader:
+            nrows, ncols = reader.shape
+            for start, stop in iter_row_blocks(nrows, block_rows(ncols, len(mapnames))):
+                if not rows_have_land(self.coarse_land_index, rgn_def, start, stop):
+                    arr = np.ma.masked_all((len(mapnames) - 1, stop - start, ncols), dtype=np.float64)
+                    arr.fill_value = F8_FILLVAL
+                    yield (start, stop, arr) + ((np.zeros((1, stop - start, ncols)),) if with_land_frac else ())
+                    continue
+                # Land cells without a soil property value are masked
+                block = reader.read(start, stop)
+                land_frac = np.nan_to_num(block[0])
+                blocks = (start, stop, land_masked(block[1:], land_frac))
+                yield blocks + ((land_frac[None, ...],) if with_land_frac else ())
+
+    def write_jobs(self, landfrac_mapname, land_index=None):
+        output_filename = output_path(self.config['main']['output_directory'], 'jamr_soil_props', output_options(self.config))
+        return [WriteJob(output_filename, self._write_soil_props, landfrac_mapname=landfrac_mapname, land_index=land_index)]
+
+    def regrid_jobs(self, regridder, landfrac_mapname):
+        output_filename = output_path(self.config['main']['output_directory'], 'jamr_soil_props', output_options(self.config))
+        return [WriteJob(output_filename, self._write_soil_props_regrid, landfrac_mapname=landfrac_mapname, regridder=regridder)]
+
+    def write_netcdf(self, landfrac_mapname, land_index=None):
+        for job in self.write_jobs(landfrac_mapname, land_index):
+            job.run()
+
+    def _write_soil_props_regrid(self, output_filename, landfrac_mapname, regridder):
+        set_target_region(self.config)
+        fields = []
+        for property in self.variables:
+            # Soil properties are weighted by the land fraction, as when they 
+            # are aggregated to coarser resolutions
+            arr, _ = regridder.regrid(
+                self.iter_data_blocks(property, landfrac_mapname, with_land_frac=True), weighted_by={0: [1]}
+            )
+            fields.append((property, arr, 'soil'))
+        write_regridded(output_filename, regridder.grid, fields, output_options(self.config))
 
-    def write_netcdf(self, landfrac_mapname):
-        coords, bnds, land_frac = raster2array(landfrac_mapname)
-        output_filename = os.path.join(self.config['main']['output_directory'], f'jamr_soil_props.nc')
+    def _write_soil_props(self, output_filename, landfrac_mapname, land_index=None):
+        set_target_region(self.config)
+        coords, bnds = region_coords()
 
         # TODO put in config?
         x_dim_name = 'x'
         y_dim_name = 'y'
         soil_dim_name = 'soil'
+        grid_dim_name = 'land'
 
-        nco = netCDF4.Dataset(output_filename, 'w', format='NETCDF4')
+        options = output_options(self.config)
+        land_points = options['grid_layout'] == 'land_points'
+        nco = open_output_dataset(output_filename, options)
         ntype = len(self.ptf)
-        nco = add_lat_lon_dims_2d(nco, x_dim_name, y_dim_name, coords[0], coords[1], bnds[0], bnds[1])
+        if land_points:
+            nco = add_land_point_dims_1d(nco, grid_dim_name, land_index, coords[0], coords[1])
+            dims = (soil_dim_name, grid_dim_name)
+        else:
+            nco = add_lat_lon_dims_2d(nco, x_dim_name, y_dim_name, coords[0], coords[1], bnds[0], bnds[1])
+            dims = (soil_dim_name, y_dim_name, x_dim_name)
 
         nco.createDimension(soil_dim_name, ntype)
         var = nco.createVariable(soil_dim_name, 'i4', (soil_dim_name,))
@@ -576,18 +606,44 @@ class SoilProperties:
         var[:] = np.arange(1, ntype+1)
         
         for property in self.variables:
-            arr = self.get_data_arrays(property)
-            mask = np.broadcast_to(np.logical_not(land_frac), arr.shape)
-            arr = np.ma.array(arr, mask=mask, dtype=np.float64, fill_value=F8_FILLVAL)
-
-            var = nco.createVariable(
-                property, 'f8', (soil_dim_name, y_dim_name, x_dim_name),
-                fill_value=F8_FILLVAL
+            var = create_output_variable(
+                nco, property, options['dtype'], dims, options,
+                fill_value=options['fill_value'], grid_ndim=len(dims) - 1
             )
             var.units = '1'
             var.standard_name = property
-            var.grid_mapping = 'latitude_longitude'
-            var[:] = arr
+            if not land_points:
+                var.grid_mapping = 'latitude_longitude'
+            for start, stop, arr in self.iter_data_blocks(property, landfrac_mapname):
+                if land_points:
+                    var[:, land_index.block_slice(start, stop)] = land_index.subset(arr, start, stop)
+                else:
+                    var[:, start:stop, :] = arr
+
+        nco.close()
+
+
+def write_jules_soil_props_1d(fields, nsoil, output_filename, land_index, x_vals, y_vals, grid_dim_name, soil_dim_name, options):
+    """Write soil properties on land points. `fields` maps each property to 
+    an iterable of (start, stop, arr) blocks."""
+    nco = open_output_dataset(output_filename, options)
+    nco = add_land_point_dims_1d(nco, grid_dim_name, land_index, x_vals, y_vals)
+
+    nco.createDimension(soil_dim_name, nsoil)
+    var = nco.createVariable(soil_dim_name, 'i4', (soil_dim_name,))
+    var.units = '1'
+    var.standard_name = soil_dim_name
+    var.long_name = soil_dim_name
+    var[:] = np.arange(1, nsoil+1)
+
+    for property, blocks in fields.items():
+        var = create_output_variable(
+            nco, property, options['dtype'], (soil_dim_name, grid_dim_name), options,
+            fill_value=options['fill_value'], grid_ndim=1
+        )
+        var.units = '1'
+        var.standard_name = property
+        for start, stop, arr in blocks:
+            var[:, land_index.block_slice(start, stop)] = land_index.subset(arr, start, stop)
 
-             
-        nco.close()
\ No newline at end of file
+    nco.close()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import copy
+import logging
+
+from collections import namedtuple
+from subprocess import PIPE
+
+import grass.script as gscript
+
+from jamr.backends.backend import get_backend
+from jamr.process.ancillarydataset import (set_target_region, target_resolution, target_resolutions)
+from jamr.process.process import ProcessData
+from jamr.utils.grass_utils import (grass_add_mapsets, grass_find_map, grass_list_mapsets)
+
+LOGGER = logging.getLogger(__name__)
+
+Tile = namedtuple('Tile', ['index', 'n', 's', 'e', 'w'])
+
+
+def tiling_enabled(config):
+    return 'tiling' in config
+
+
+def target_tiles(config):
+    """Split the target grid into tiles of `tile_rows` by `tile_cols` target 
+    cells.
+
+    Tile edges fall on target cell edges, so each target cell is computed 
+    from the native cells of exactly one tile and no halo is needed by the 
+    (cell-wise or aggregating) operations used to compute the output maps.
+    """
+    nsres, ewres = target_resolution(config)
+    rgn = config['region']
+    nrows = int(round((rgn['north'] - rgn['south']) / nsres))
+    ncols = int(round((rgn['east'] - rgn['west']) / ewres))
+    tile_rows = int(config['tiling'].get('tile_rows', 1200))
+    tile_cols = int(config['tiling'].get('tile_cols', 1200))
+    tiles = []
+    for row in range(0, nrows, tile_rows):
+        for col in range(0, ncols, tile_cols):
+            tiles.append(Tile(
+                index=len(tiles),
+                n=rgn['north'] - row * nsres,
+                s=rgn['north'] - (row + tile_rows) * nsres if row + tile_rows < nrows else rgn['south'],
+                e=rgn['west'] + (col + tile_cols) * ewres if col + tile_cols < ncols else rgn['east'],
+                w=rgn['west'] + col * ewres
+            ))
+    return tiles
+
+
+def tile_name(config, tile):
+    """Name of a tile, used for its region name and its mapset."""
+    return f"{config['region']['name']}_tile{tile.index:04d}"
+
+
+def tile_config(config, tile):
+    """Copy of the configuration with the region set to a tile."""
+    name = tile_name(config, tile)
+    resolutions = target_resolutions(config)
+    config = copy.deepcopy(config)
+    # Coarser target resolutions are aggregated after mosaicking
+    config['region']['target_resolutions'] = resolutions[:1]
+    config['region'].update({'north': tile.n, 'south': tile.s, 'east': tile.e, 'west': tile.w, 'name': name})
+    return config
+
+
+def tile_mapname(config, tile, mapname):
+    """Name of the map of a tile corresponding to the map `mapname` of the 
+    region. Output map names end with the name of their region."""
+    region_name = config['region']['name']
+    if not mapname.endswith(region_name):
+        raise ValueError(f'Map {mapname} is not named after region {region_name}')
+    return mapname[:-len(region_name)] + tile_name(config, tile)
+
+
+class TiledProcessData:
+    """Convert raw input data into JULES ancillary data tile by tile.
+
+    Each tile is processed by a ProcessData object whose region is the 
+    tile, so that native resolution intermediates only ever cover one tile.
+    The output maps of the tiles are then mosaicked to the target region 
+    and written as usual. Tiles can be processed in turn in the current 
+    mapset, or by separate processes (or nodes), each in the mapset named 
+    after its tile.
+
+    Parameters
+    ----------
+    config : dict 
+        The run configuration.
+    inputdata : InputData 
+        The raw input data.
+    overwrite : bool 
+        Whether to overwrite files in the GRASS GIS database.  
+    """
+    def __init__(self, 
+                 config, 
+                 inputdata, 
+                 overwrite):
+
+        # Tiles are processed in GRASS mapsets and mosaicked with r.patch
+        if get_backend().name != 'grass':
+            raise ValueError('Tiled processing is only available with the GRASS backend')
+        self.config = config
+        self.inputdata = inputdata
+        self.overwrite = overwrite
+        self.tiles = target_tiles(config)
+        self.process = ProcessData(config, inputdata, overwrite)
+
+    def tile_process(self, tile):
+        process = ProcessData(
+            tile_config(self.config, tile), self.inputdata, self.overwrite, 
+            coarse_land_index=self.process.coarse_land_index
+        )
+        process.initial()
+        return process
+
+    def initial(self):
+        self.process.initial()
+        self.process.build_coarse_land_index()
+
+    def land_tiles(self):
+        """Tiles which may contain land; the others are entirely ocean."""
+        return [
+            tile for tile in self.tiles 
+            if self.process.coarse_land_index.has_land(tile.n, tile.s, tile.e, tile.w)
+        ]
+
+    def compute(self, tiles=None):
+        tiles = self.tiles if tiles is None else tiles
+        land_tiles = self.land_tiles()
+        for tile in tiles:
+            if tile not in land_tiles:
+                LOGGER.info(f'Skipping tile {tile.index + 1} of {len(self.tiles)} (ocean)')
+                continue
+            LOGGER.info(f'Processing tile {tile.index + 1} of {len(self.tiles)}')
+            self.tile_process(tile).compute()
+
+    def mosaic(self):
+        # Make maps of tiles processed in their own mapset visible
+        # Ocean tiles are not processed, and are left null in the mosaic
+        land_tiles = self.land_tiles()
+        mapsets = grass_list_mapsets()
+        grass_add_mapsets([tile_name(self.config, tile) for tile in land_tiles if tile_name(self.config, tile) in mapsets])
+
+        # Tile maps are named as the maps of the region, so their names are
+        # derived without setting up a ProcessData object for each tile
+        output_mapnames = self.process.output_mapnames()
+        tile_mapnames = [
+            [tile_mapname(self.config, tile, mapname) for mapname in output_mapnames] for tile in land_tiles
+        ]
+        set_target_region(self.config)
+        for i, mapname in enumerate(output_mapnames):
+            inputs = [grass_find_map(mapnames[i]) for mapnames in tile_mapnames]
+            missing = [mapnames[i] for mapnames, input in zip(tile_mapnames, inputs) if input is None]
+            if len(missing) > 0:
+                raise RuntimeError(f'Cannot mosaic {mapname}: tile maps not found: {missing}')
+
+            LOGGER.info(f'Mosaicking {mapname}')
+            if len(inputs) == 0:
+                p = gscript.start_command('r.mapcalc', expression=f'{mapname} = null()', overwrite=True, stderr=PIPE)
+            elif len(inputs) == 1:
+                p = gscript.start_command('r.mapcalc', expression=f'{mapname} = {inputs[0]}', overwrite=True, stderr=PIPE)
+            else:
+                p = gscript.start_command(
+                    'r.patch', input=','.join(inputs), output=mapname, 
+                    overwrite=True, stderr=PIPE
+                )
+            stdout, stderr = p.communicate()
+            if p.returncode != 0:
+                raise RuntimeError(f'Failed to mosaic {mapname}: {stderr.decode()}')
+
+        self.process.aggregate()
+
+    def write(self):
+        self.process.write()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import logging
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from jamr.backends.backend import get_backend
+
+LOGGER = logging.getLogger(__name__)
+
+# Jobs are handed to forked worker processes through this module-level list
+# rather than by pickling, so that large objects such as the land point
+# index are shared with the workers instead of being copied to each one
+_WRITE_JOBS = []
+
+
+class WriteJob:
+    """A job which writes a single output file.
+
+    Parameters
+    ----------
+    output_filename : str
+        The output file written by the job.
+    function : callable
+        Function called as `function(filename, **kwargs)` to write the file.
+    region : str, optional
+        Region the job runs in, as returned by the backend's `region_env`.
+    """
+    def __init__(self, output_filename, function, region=None, **kwargs):
+        self.output_filename = output_filename
+        self.function = function
+        self.region = region
+        self.kwargs = kwargs
+
+    @property
+    def tmp_filename(self):
+        return self.output_filename + '.tmp'
+
+    def run(self):
+        # Write to a temporary file which replaces the output once it is
+        # complete, so a failed job never leaves behind a partial file
+        try:
+            with get_backend().pinned_region(self.region):
+                self.function(self.tmp_filename, **self.kwargs)
+        except BaseException:
+            _remove_output(self.tmp_filename)
+            raise
+        # Zarr stores are directories, which cannot replace an existing store
+        if os.path.isdir(self.output_filename):
+            _remove_output(self.output_filename)
+        os.replace(self.tmp_filename, self.output_filename)
+
+
+def _remove_output(filename):
+    if os.path.isdir(filename):
+        shutil.rmtree(filename)
+    elif os.path.exists(filename):
+        os.remove(filename)
+
+
+def _run_write_job(index):
+    _WRITE_JOBS[index].run()
+    return index
+
+
+def write_step(job):
+    """Name of the journal step of a write job."""
+    return f'write:{job.output_filename}'
+
+
+def run_write_jobs(jobs, nprocs=1, journal=None):
+    """Run write jobs, in parallel if `nprocs` is greater than one.
+
+    Each job runs in its own worker process, because the GRASS libraries
+    used to read raster maps are not thread-safe. A failed job does not
+    affect the others: failures are logged as they happen and reported
+    together once all jobs have finished. If a StepJournal is given, files
+    written by a previous run are skipped and each file written is recorded.
+    """
+    output_filenames = [job.output_filename for job in jobs]
+    duplicates = sorted(set([f for f in output_filenames if output_filenames.count(f) > 1]))
+    if len(duplicates) > 0:
+        raise ValueError(f'Output files would be written by more than one job: {duplicates}')
+
+    if journal is not None:
+        done = [job for job in jobs if journal.is_done(write_step(job))]
+        for job in done:
+            LOGGER.info(f'Skipping {job.output_filename}: written by a previous run')
+        jobs = [job for job in jobs if job not in done]
+
+    def record(job):
+        # The journal is only written by this (parent) process
+        LOGGER.info(f'Wrote {job.output_filename}')
+        if journal is not None:
+            journal.record(write_step(job), files=[job.output_filename])
+
+    failures = []
+    if nprocs <= 1:
+        for job in jobs:
+            try:
+                job.run()
+                record(job)
+            except Exception as exc:
+                LOGGER.exception(f'Failed to write {job.output_filename}')
+                failures.append((job.output_filename, exc))
+    else:
+        _WRITE_JOBS[:] = jobs
+        try:
+            mp_context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp_context) as executor:
+                futures = {executor.submit(_run_write_job, index): job for index, job in enumerate(jobs)}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        future.result()
+                        record(job)
+                    except Exception as exc:
+                        LOGGER.error(f'Failed to write {job.output_filename}: {exc!r}')
+                        failures.append((job.output_filename, exc))
+        finally:
+            _WRITE_JOBS[:] = []
+
+    if len(failures) > 0:
+        failed = ', '.join([filename for filename, _ in failures])
+        raise RuntimeError(f'{len(failures)} of {len(jobs)} output files could not be written: {failed}')
+
+    return 0
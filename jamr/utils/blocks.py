@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from jamr.utils.constants import F8_FILLVAL
+
+# Maximum number of cells (summed over all maps) held in memory per block
+DEFAULT_BLOCK_CELLS = 2 ** 24
+
+
+def region_shape(rgn_def):
+    """Number of rows and columns in a region definition."""
+    nrows = int(round((rgn_def['n'] - rgn_def['s']) / rgn_def['nsres']))
+    ncols = int(round((rgn_def['e'] - rgn_def['w']) / rgn_def['ewres']))
+    return nrows, ncols
+
+
+def block_rows(ncols, nmaps=1, factor=1, max_cells=DEFAULT_BLOCK_CELLS):
+    """Number of (target) rows per block so that a block holds at most
+    `max_cells` cells, where each target row covers `factor` native rows."""
+    return max(1, int(max_cells // (ncols * nmaps * factor)))
+
+
+def iter_row_blocks(nrows, nrows_per_block):
+    """Yield (start, stop) indices of consecutive row blocks."""
+    for start in range(0, nrows, nrows_per_block):
+        yield start, min(start + nrows_per_block, nrows)
+
+
+def aggregation_factor(native_rgn, target_rgn, tol=1e-3):
+    """Integer (row, column) aggregation factor between two regions.
+
+    Returns None unless the regions share the same extent and each target
+    cell is made up of a whole number of native cells.
+    """
+    for key, res in [('n', 'nsres'), ('s', 'nsres'), ('e', 'ewres'), ('w', 'ewres')]:
+        if abs(native_rgn[key] - target_rgn[key]) > tol * native_rgn[res]:
+            return None
+
+    factors = []
+    for res in ['nsres', 'ewres']:
+        factor = target_rgn[res] / native_rgn[res]
+        if abs(factor - round(factor)) > tol or round(factor) < 1:
+            return None
+        factors.append(int(round(factor)))
+
+    return tuple(factors)
+
+
+def block_sum(arr, fy, fx):
+    """Sum non-overlapping `fy` x `fx` blocks over the last two axes,
+    ignoring NaN."""
+    shape = arr.shape[:-2] + (arr.shape[-2] // fy, fy, arr.shape[-1] // fx, fx)
+    return np.nansum(arr.reshape(shape), axis=(-3, -1))
+
+
+def rows_have_land(coarse_land_index, rgn_def, start, stop):
+    """Whether rows `start` to `stop` of a region may contain land. This is 
+    always True without a coarse land index."""
+    if coarse_land_index is None:
+        return True
+    n = rgn_def['n'] - start * rgn_def['nsres']
+    s = rgn_def['n'] - stop * rgn_def['nsres']
+    return coarse_land_index.has_land(n, s, rgn_def['e'], rgn_def['w'])
+
+
+class CoarseLandIndex:
+    """Coarse grid flagging the cells which may contain land.
+
+    A coarse cell is flagged if any of the native cells within it may be 
+    land, so a region whose coarse cells are all unflagged is known to be 
+    entirely ocean and can be skipped.
+    """
+    def __init__(self, land, n, w, nsres, ewres):
+        self.land = land
+        self.n = n
+        self.w = w
+        self.nsres = nsres
+        self.ewres = ewres
+
+    def has_land(self, n, s, e, w, tol=1e-6):
+        """Whether the box bounded by `n`, `s`, `e` and `w` may contain land."""
+        nrows, ncols = self.land.shape
+        row0 = int(np.floor((self.n - n) / self.nsres + tol))
+        row1 = int(np.ceil((self.n - s) / self.nsres - tol))
+        col0 = int(np.floor((w - self.w) / self.ewres + tol))
+        col1 = int(np.ceil((e - self.w) / self.ewres - tol))
+        if row0 < 0 or col0 < 0 or row1 > nrows or col1 > ncols:
+            # Outside the index, so nothing is known
+            return True
+        return bool(self.land[row0:row1, col0:col1].any())
+
+
+class LandPointIndex:
+    """Index of the land points in a grid.
+
+    Land points are numbered in row-major order and stored row by row, so 
+    that the land points in any block of rows form a contiguous slice of 
+    the land point dimension and can be taken from a block with fancy 
+    indexing.
+    """
+    def __init__(self, row_offsets, cols, ncols):
+        self.row_offsets = row_offsets
+        self.cols = cols
+        self.ncols = ncols
+
+    @classmethod
+    def from_blocks(cls, blocks, nrows, ncols):
+        """Build the index from (start, stop, land_frac) row blocks."""
+        counts = np.zeros(nrows, dtype=np.int64)
+        cols = [np.zeros(0, dtype=np.int32)]
+        for start, stop, land_frac in blocks:
+            land = land_frac > 0
+            counts[start:stop] = land.sum(axis=1)
+            cols.append(np.nonzero(land)[1].astype(np.int32))
+        row_offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(row_offsets, np.concatenate(cols), ncols)
+
+    @property
+    def nrows(self):
+        return len(self.row_offsets) - 1
+
+    @property
+    def nland(self):
+        return int(self.row_offsets[-1])
+
+    def block_slice(self, start, stop):
+        """Slice of the land point dimension covering rows `start` to `stop`."""
+        return slice(int(self.row_offsets[start]), int(self.row_offsets[stop]))
+
+    def block_indices(self, start, stop):
+        """Row (relative to `start`) and column indices of the land points 
+        in rows `start` to `stop`."""
+        counts = np.diff(self.row_offsets[start:(stop + 1)])
+        rows = np.repeat(np.arange(stop - start), counts)
+        return rows, self.cols[self.block_slice(start, stop)]
+
+    def subset(self, block, start, stop):
+        """Take the land points from a block with shape (..., nrows, ncols)."""
+        rows, cols = self.block_indices(start, stop)
+        return block[..., rows, cols]
+
+
+class SitePointIndex:
+    """Index of point sites, with the same interface as LandPointIndex.
+
+    Each site is treated as a row holding a single land point, so the 
+    writers for land point output can be used for sites. Blocks hold one 
+    value per site rather than a row of the grid, so `subset` returns them 
+    unchanged, and `x_vals` and `y_vals` are the site longitudes and 
+    latitudes.
+    """
+    ncols = 1
+
+    def __init__(self, nsites):
+        self.nsites = nsites
+
+    @property
+    def nrows(self):
+        return self.nsites
+
+    @property
+    def nland(self):
+        return self.nsites
+
+    def block_slice(self, start, stop):
+        return slice(start, stop)
+
+    def block_indices(self, start, stop):
+        return np.arange(stop - start), np.arange(start, stop)
+
+    def subset(self, block, start, stop):
+        return block
+
+
+def land_masked(arr, land_frac, fill_value=None):
+    """Masked float64 copy of `arr`, with non-land cells and cells without a
+    (finite) value masked."""
+    mask = np.logical_not(land_frac > 0)[None, ...] | np.logical_not(np.isfinite(arr))
+    return np.ma.array(
+        arr, mask=np.broadcast_to(mask, arr.shape), dtype=np.float64, 
+        fill_value=F8_FILLVAL if fill_value is None else fill_value
+    )
@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 
-import netCDF4
-
 # #################################### #
 # I/O constants
 # #################################### #
 
-F8_FILLVAL = netCDF4.default_fillvals['f8']
-F4_FILLVAL = netCDF4.default_fillvals['f4']
-I4_FILLVAL = netCDF4.default_fillvals['i4']
+# Default netCDF fill values (netCDF4.default_fillvals), given here so that
+# the constants can be used without importing netCDF4
+F8_FILLVAL = 9.969209968386869e+36
+F4_FILLVAL = 9.969209968386869e+36
+I4_FILLVAL = -2147483647
 
 # #################################### #
 # Region constants
@@ -31,6 +31,12 @@ for ext_name, ext in EXTENTS.items():
         rgn_nm = f'{ext_name}_{res_fmt}Deg'
         REGIONS[rgn_nm] = {'extent': ext, 'res': res}
 
+# Default resolution (degrees) of the target grid
+DEFAULT_TARGET_RES = 0.008333333333
+
+# Resolution (degrees) of the coarse land index used to skip ocean
+COARSE_LAND_INDEX_RES = 0.25
+
 # #################################### #
 # Land cover constants
 # #################################### #
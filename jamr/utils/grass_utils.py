@@ -15,10 +15,15 @@ from subprocess import PIPE
 
 import grass.script as gscript
 
+from grass.lib import gis as libgis
+from grass.pygrass.gis.region import Region
+
 # import grass python libraries
 from grass.pygrass.modules.shortcuts import general as g
 from grass.pygrass.modules.shortcuts import raster as r
 
+from jamr.utils.regions import ensure_region
+
 
 def grass_remove_mask():
     # try:
@@ -41,6 +46,8 @@ def grass_set_named_region(rgn):
     #     g.region(region=rgn)
     # except grass.exceptions.CalledModuleError:
     #     pass
+    # Named regions are saved when first used
+    ensure_region(rgn)
     p = gscript.start_command('g.region', region=rgn, stderr=PIPE)
     stdout, stderr = p.communicate()
     return 0
@@ -53,10 +60,10 @@ def grass_set_region_from_raster(raster, n=None, s=None, e=None, w=None):
     rgn_def = grass_region_definition()
     # Define a new region
     new_rgn_def = {
-        'n': n if n else rgn_def['n'],
-        's': s if s else rgn_def['s'],
-        'e': e if e else rgn_def['e'],
-        'w': w if w else rgn_def['w'],
+        'n': n if n is not None else rgn_def['n'],
+        's': s if s is not None else rgn_def['s'],
+        'e': e if e is not None else rgn_def['e'],
+        'w': w if w is not None else rgn_def['w'],
         'align': raster,
         'ewres': rgn_def['ewres'], 
         'nsres': rgn_def['nsres'], 
@@ -64,6 +71,14 @@ def grass_set_region_from_raster(raster, n=None, s=None, e=None, w=None):
     grass_set_region(**new_rgn_def)
     return 0 
 
+def grass_sync_raster_window():
+    # g.region runs as a subprocess, so the raster window cached by this 
+    # process must be re-read before maps are opened with pygrass
+    libgis.G_unset_window()
+    rgn = Region()
+    rgn.set_raster_region()
+    return 0
+
 def grass_set_region(**kwargs):
     p = gscript.start_command('g.region', **kwargs, stderr=PIPE)
     stdout, stderr = p.communicate()
@@ -80,6 +95,23 @@ def grass_map_exists(type, mapname, mapset='PERMANENT'):
     else:
         return False
 
+def grass_find_map(mapname, type='raster'):
+    # Full name (map@mapset) of a map in the mapset search path, or None
+    element = {'raster': 'cell', 'vector': 'vector'}[type]
+    fullname = gscript.find_file(mapname, element=element)['fullname']
+    return fullname if fullname else None
+
+def grass_list_mapsets():
+    mapsets = gscript.read_command('g.mapsets', flags='l', separator='comma').strip()
+    return mapsets.split(',') if mapsets else []
+
+def grass_add_mapsets(mapsets):
+    # Add mapsets to the search path of the current mapset
+    if len(mapsets) > 0:
+        p = gscript.start_command('g.mapsets', operation='add', mapset=','.join(mapsets), stderr=PIPE)
+        stdout, stderr = p.communicate()
+    return 0
+
 def grass_print_region():
     p = gscript.start_command('g.region', flags='p', stderr=PIPE)
     stdout, stderr = p.communicate()
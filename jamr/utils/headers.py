@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import os
+
+from collections import namedtuple
+
+RasterHeader = namedtuple(
+    'RasterHeader',
+    ['filename', 'width', 'height', 'count', 'dtypes', 'res', 'bounds', 'crs']
+)
+
+
+def read_header(filename):
+    """Read the header of a raster file, without reading any data.
+
+    Returns None if the file does not exist.
+    """
+    # rasterio is imported on demand, so that modules using headers can be
+    # imported quickly
+    import rasterio
+
+    if not os.path.exists(filename):
+        return None
+
+    with rasterio.open(filename) as src:
+        return RasterHeader(
+            filename=filename,
+            width=src.width,
+            height=src.height,
+            count=src.count,
+            dtypes=src.dtypes,
+            res=src.res,
+            bounds=tuple(src.bounds),
+            crs=src.crs.to_string() if src.crs is not None else None
+        )
@@ -4,7 +4,7 @@ import os
 import math
 import numpy as np
 
-# import grass.script as gscript
+import grass.script as gscript
 
 # import grass python libraries
 from grass.pygrass.modules.shortcuts import general as g
@@ -82,3 +82,15 @@ def _set_region(region_name, res_decimal_degrees, extent = [-180, -90, 180, 90])
 def set_regions():
     for region_name, region_def in REGIONS.items():
         res = _set_region(region_name, region_def['res'], region_def['extent'])
+
+
+def region_exists(region_name):
+    return gscript.find_file(region_name, element='windows')['file'] != ''
+
+
+def ensure_region(region_name):
+    """Save a region of REGIONS in the location the first time it is used,
+    rather than saving all of them up front with `set_regions`."""
+    if region_name in REGIONS and not region_exists(region_name):
+        region_def = REGIONS[region_name]
+        _set_region(region_name, region_def['res'], region_def['extent'])
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import hashlib
+import logging
+import numpy as np
+import netCDF4
+
+
+from jamr.utils.utils import (create_output_variable, open_output_dataset, get_lat_lon_bnds)
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of subcells along each side of a target cell aimed for when the 
+# number of subcells along each side of a source cell is not configured, and
+# the largest number of subcells along each side of a source cell
+SUBCELLS_PER_TARGET_CELL = 4
+MAX_SUPERSAMPLE = 16
+
+# Largest number of subcells transformed to the target grid at once
+MAX_POINTS = 2 ** 20
+
+# Coordinate reference systems which are longitude and latitude, so are not
+# transformed
+LONLAT_CRS = ['EPSG:4326']
+
+
+def regrid_enabled(config):
+    return 'regrid' in config
+
+
+def _spatial_reference(crs):
+    # GDAL is imported on demand, as it is only needed to regrid output
+    from osgeo import osr
+    srs = osr.SpatialReference()
+    srs.SetFromUserInput(crs)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def _grid_mapping_crs(grid_mapping):
+    # CRS of a CF grid mapping variable
+    attrs = {k: grid_mapping.getncattr(k) for k in grid_mapping.ncattrs()}
+    for key in ['crs_wkt', 'spatial_ref']:
+        if key in attrs:
+            return attrs[key]
+    name = attrs.get('grid_mapping_name')
+    if name == 'latitude_longitude':
+        return 'EPSG:4326'
+    elif name == 'rotated_latitude_longitude':
+        return (
+            f"+proj=ob_tran +o_proj=longlat +o_lon_p={attrs.get('north_pole_grid_longitude', 0.)} "
+            f"+o_lat_p={attrs['grid_north_pole_latitude']} "
+            f"+lon_0={180. + attrs['grid_north_pole_longitude']} +to_meter=0.0174532925199 +no_defs"
+        )
+    raise ValueError(f'Unsupported grid mapping: {name}')
+
+
+class TargetGrid:
+    """A regular grid in any coordinate reference system.
+
+    Parameters
+    ----------
+    crs : str
+        Coordinate reference system, in any form accepted by GDAL (e.g.
+        'EPSG:27700', WKT or a PROJ string).
+    geotransform : sequence
+        GDAL geotransform (x0, dx, 0, y0, 0, dy) of the grid.
+    shape : sequence
+        Number of rows and columns in the grid.
+    grid_mapping : dict, optional
+        Attributes of the CF grid mapping variable written to output files.
+    """
+    def __init__(self, crs, geotransform, shape, grid_mapping=None):
+        if geotransform[2] != 0 or geotransform[4] != 0:
+            raise ValueError('Rotated geotransforms are not supported')
+        self.crs = crs
+        self.geotransform = tuple(float(v) for v in geotransform)
+        self.shape = tuple(int(n) for n in shape)
+        self.grid_mapping = grid_mapping if grid_mapping is not None else {}
+
+    @classmethod
+    def from_config(cls, config):
+        regrid_config = config['regrid']
+        if 'template' in regrid_config:
+            return cls.from_template(
+                regrid_config['template'],
+                regrid_config.get('x_dim_name', 'x'),
+                regrid_config.get('y_dim_name', 'y')
+            )
+        return cls(regrid_config['crs'], regrid_config['geotransform'], regrid_config['shape'])
+
+    @classmethod
+    def from_template(cls, filename, x_dim_name='x', y_dim_name='y'):
+        """Grid of an existing netCDF file (e.g. a JULES ancillary file),
+        described by 1D coordinate variables and a CF grid mapping."""
+        nc = netCDF4.Dataset(filename, 'r')
+        x_vals = np.asarray(nc[x_dim_name][:], dtype=np.float64)
+        y_vals = np.asarray(nc[y_dim_name][:], dtype=np.float64)
+        grid_mapping = None
+        for var in nc.variables.values():
+            if 'grid_mapping' in var.ncattrs():
+                grid_mapping = nc[var.grid_mapping]
+                break
+        if grid_mapping is None:
+            raise ValueError(f'No grid mapping found in template file {filename}')
+
+        crs = _grid_mapping_crs(grid_mapping)
+        attrs = {k: grid_mapping.getncattr(k) for k in grid_mapping.ncattrs()}
+        nc.close()
+        dx = x_vals[1] - x_vals[0]
+        dy = y_vals[1] - y_vals[0]
+        geotransform = (x_vals[0] - dx / 2., dx, 0., y_vals[0] - dy / 2., 0., dy)
+        return cls(crs, geotransform, (len(y_vals), len(x_vals)), attrs)
+
+    @property
+    def x_vals(self):
+        x0, dx = self.geotransform[0], self.geotransform[1]
+        return x0 + (np.arange(self.shape[1]) + 0.5) * dx
+
+    @property
+    def y_vals(self):
+        y0, dy = self.geotransform[3], self.geotransform[5]
+        return y0 + (np.arange(self.shape[0]) + 0.5) * dy
+
+    @property
+    def x_bnds(self):
+        x0, dx = self.geotransform[0], self.geotransform[1]
+        return get_lat_lon_bnds(self.x_vals, (x0, x0 + self.shape[1] * dx))
+
+    @property
+    def y_bnds(self):
+        y0, dy = self.geotransform[3], self.geotransform[5]
+        return get_lat_lon_bnds(self.y_vals, (y0, y0 + self.shape[0] * dy))
+
+    def to_lonlat(self, x, y):
+        """Transform grid coordinates to longitude and latitude."""
+        return self._transform(x, y, self.crs, 'EPSG:4326')
+
+    def from_lonlat(self, lon, lat):
+        """Transform longitude and latitude to grid coordinates."""
+        return self._transform(lon, lat, 'EPSG:4326', self.crs)
+
+    def _transform(self, x, y, src_crs, dst_crs):
+        if src_crs in LONLAT_CRS and dst_crs in LONLAT_CRS:
+            return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        from osgeo import osr
+        transform = osr.CoordinateTransformation(_spatial_reference(src_crs), _spatial_reference(dst_crs))
+        points = np.array(transform.TransformPoints(np.column_stack([np.ravel(x), np.ravel(y)]).tolist()))
+        return points[:, 0].reshape(np.shape(x)), points[:, 1].reshape(np.shape(y))
+
+
+def default_supersample(src_rgn, grid):
+    """Number of subcells along each side of a source cell, such that each 
+    target cell contains several subcells."""
+    nrows, ncols = grid.shape
+    x0, dx, _, y0, _, dy = grid.geotransform
+    # Corners of the cell at the centre of the grid
+    x = x0 + (ncols // 2 + np.array([0., 1., 0.])) * dx
+    y = y0 + (nrows // 2 + np.array([0., 0., 1.])) * dy
+    lon, lat = grid.to_lonlat(x, y)
+    # Length of the shortest side of the cell, in source cells
+    side = min(
+        math.hypot((lon[i] - lon[0]) / src_rgn['ewres'], (lat[i] - lat[0]) / src_rgn['nsres']) 
+        for i in [1, 2]
+    )
+    return int(min(MAX_SUPERSAMPLE, max(1, math.ceil(round(SUBCELLS_PER_TARGET_CELL / side, 6)))))
+
+
+def compute_weights(src_rgn, grid, supersample=1):
+    """Conservative weights from a regular lat/lon grid to a target grid.
+
+    Each source cell is divided into `supersample` x `supersample` subcells,
+    and its area on the sphere is shared out between the target cells 
+    containing the centres of its subcells. Every source cell within the 
+    target grid therefore contributes its whole area, and the weight of a 
+    source cell is the area it shares with a target cell as a fraction of 
+    the area of the target cell covered by source cells. Weights are exact
+    where the boundaries of the target cells follow those of the source 
+    cells (e.g. a coarser, aligned lat/lon grid), and otherwise source cells
+    on the boundaries of target cells are split to within a subcell.
+
+    Returns (target, source, weight) arrays of the non-zero weights, with
+    cells numbered in row-major order, sorted by source cell.
+    """
+    src_nrows = int(round((src_rgn['n'] - src_rgn['s']) / src_rgn['nsres']))
+    src_ncols = int(round((src_rgn['e'] - src_rgn['w']) / src_rgn['ewres']))
+    nrows, ncols = grid.shape
+    ntarget = nrows * ncols
+    x0, dx, _, y0, _, dy = grid.geotransform
+    offsets = (np.arange(supersample) + 0.5) / supersample
+    edges = np.arange(supersample + 1) / supersample
+    sub_lon = src_rgn['w'] + (np.arange(src_ncols)[:, None] + offsets[None, :]).ravel() * src_rgn['ewres']
+    src_col = np.repeat(np.arange(src_ncols), supersample)
+
+    keys, areas = [], []
+    rows_per_band = max(1, MAX_POINTS // (src_ncols * supersample ** 2))
+    for start in range(0, src_nrows, rows_per_band):
+        src_rows = np.arange(start, min(start + rows_per_band, src_nrows))
+        sub_lat = src_rgn['n'] - (src_rows[:, None] + offsets[None, :]).ravel() * src_rgn['nsres']
+        # Subcells in a row have the same area, proportional to the 
+        # difference of the sines of the latitudes of their edges
+        north = np.radians(src_rgn['n'] - (src_rows[:, None] + edges[None, :-1]).ravel() * src_rgn['nsres'])
+        south = np.radians(src_rgn['n'] - (src_rows[:, None] + edges[None, 1:]).ravel() * src_rgn['nsres'])
+        lon, lat = np.meshgrid(sub_lon, sub_lat)
+        x, y = grid.from_lonlat(lon, lat)
+        with np.errstate(invalid='ignore'):
+            col = np.floor((x - x0) / dx)
+            row = np.floor((y - y0) / dy)
+            valid = (col >= 0) & (col < ncols) & (row >= 0) & (row < nrows)
+        target = (row[valid] * ncols + col[valid]).astype(np.int64)
+        source = (np.repeat(src_rows, supersample)[:, None] * src_ncols + src_col[None, :])[valid]
+        area = np.broadcast_to((np.sin(north) - np.sin(south))[:, None], x.shape)[valid]
+        # Keys are ordered by source cell, then by target cell
+        key, inverse = np.unique(source * ntarget + target, return_inverse=True)
+        keys.append(key)
+        areas.append(np.bincount(inverse.ravel(), weights=area))
+
+    keys = np.concatenate(keys)
+    areas = np.concatenate(areas)
+    targets, sources = keys % ntarget, keys // ntarget
+    covered = np.bincount(targets, weights=areas, minlength=ntarget)
+    return targets, sources, areas / covered[targets]
+
+
+class Regridder:
+    """Regrid maps on a regular lat/lon grid to a target grid with a sparse
+    matrix of conservative weights.
+
+    The weights are computed once and cached in `cache_directory`. If 
+    `supersample` is None it is chosen from the ratio of the target and 
+    source resolutions.
+    """
+    def __init__(self, src_rgn, grid, supersample=None, cache_directory=None):
+        self.src_rgn = src_rgn
+        self.grid = grid
+        self.src_ncols = int(round((src_rgn['e'] - src_rgn['w']) / src_rgn['ewres']))
+        self.ntarget = grid.shape[0] * grid.shape[1]
+        if supersample is None:
+            supersample = default_supersample(src_rgn, grid)
+        cache_file = None
+        if cache_directory is not None:
+            key = repr((
+                sorted((k, round(v, 9)) for k, v in src_rgn.items()),
+                grid.crs, grid.geotransform, grid.shape, supersample
+            ))
+            digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+            cache_file = os.path.join(cache_directory, f'jamr_regrid_weights_{digest}.npz')
+
+        if cache_file is not None and os.path.exists(cache_file):
+            LOGGER.info(f'Reading regridding weights from {cache_file}')
+            with np.load(cache_file) as weights:
+                self.targets, self.sources, self.weights = weights['targets'], weights['sources'], weights['weights']
+        else:
+            LOGGER.info(f'Computing regridding weights with {supersample} x {supersample} subcells per source cell')
+            self.targets, self.sources, self.weights = compute_weights(src_rgn, grid, supersample)
+            if cache_file is not None:
+                np.savez(cache_file, targets=self.targets, sources=self.sources, weights=self.weights)
+
+    @classmethod
+    def from_config(cls, config, src_rgn):
+        supersample = config['regrid'].get('supersample')
+        return cls(
+            src_rgn, TargetGrid.from_config(config),
+            supersample=int(supersample) if supersample is not None else None,
+            cache_directory=config['main'].get('scratch_directory')
+        )
+
+    def block_matrix(self, start, stop):
+        """Sparse matrix of the weights of the source cells in rows `start` 
+        to `stop`, and the first target cell of its rows.
+
+        The rows of the matrix span only the target cells that the block 
+        overlaps, so that blocks are regridded in time and memory 
+        proportional to their size rather than to that of the target grid.
+        """
+        # scipy is imported on demand, as it is only needed to regrid output
+        from scipy.sparse import csr_matrix
+
+        lo, hi = np.searchsorted(self.sources, [start * self.src_ncols, stop * self.src_ncols])
+        if lo == hi:
+            return None, 0
+        targets = self.targets[lo:hi]
+        first = int(targets.min())
+        matrix = csr_matrix(
+            (self.weights[lo:hi], (targets - first, self.sources[lo:hi] - start * self.src_ncols)),
+            shape=(int(targets.max()) - first + 1, (stop - start) * self.src_ncols)
+        )
+        return matrix, first
+
+    def regrid(self, blocks, weighted_by=None):
+        """Regrid row blocks of one or more arrays.
+
+        `blocks` yields (start, stop, *arrays) on the source grid, where each
+        array has shape (..., nrows, ncols) and may be masked. Each target
+        cell is the weighted mean of the valid source cells overlapping it;
+        `weighted_by` maps the position of an array to the positions of other 
+        arrays whose values further weight it (e.g. fractions by land 
+        fraction, and surface height by land fraction and type fraction).
+
+        Returns masked arrays with shape (..., nrows, ncols) on the target grid.
+        """
+        weighted_by = weighted_by if weighted_by is not None else {}
+        sums, weights_sums, shapes = None, None, None
+        for start, stop, *arrays in blocks:
+            flat = [arr.reshape((-1, arr.shape[-2] * arr.shape[-1])) for arr in arrays]
+            if sums is None:
+                shapes = [arr.shape[:-2] for arr in arrays]
+                sums = [np.zeros((f.shape[0], self.ntarget)) for f in flat]
+                weights_sums = [np.zeros((f.shape[0], self.ntarget)) for f in flat]
+
+            # All layers of all arrays are regridded by the same matrix
+            matrix, first = self.block_matrix(start, stop)
+            if matrix is None:
+                continue
+            rows = slice(first, first + matrix.shape[0])
+            for i, arr in enumerate(flat):
+                values = np.ma.getdata(arr).astype(np.float64)
+                valid = ~np.ma.getmaskarray(arr) & np.isfinite(values)
+                cell_weights = np.where(valid, 1., 0.)
+                for j in weighted_by.get(i, []):
+                    cell_weights = cell_weights * np.nan_to_num(np.ma.getdata(flat[j]))
+                values = np.where(valid, values, 0.)
+                sums[i][:, rows] += (matrix @ (cell_weights * values).T).T
+                weights_sums[i][:, rows] += (matrix @ cell_weights.T).T
+
+        output = []
+        for shape, total, weights_sum in zip(shapes, sums, weights_sums):
+            mean = np.divide(total, weights_sum, out=np.zeros_like(total), where=weights_sum > 0)
+            mean = np.ma.array(mean, mask=(weights_sum <= 0))
+            output.append(mean.reshape(shape + self.grid.shape))
+        return output
+
+
+def add_target_grid_dims_2d(nco, grid, x_dim_name='x', y_dim_name='y'):
+    """Add projection coordinates, 2d latitude/longitude and a grid mapping
+    to a netCDF object."""
+    nco.createDimension(y_dim_name, grid.shape[0])
+    nco.createDimension(x_dim_name, grid.shape[1])
+    nco.createDimension('bnds', 2)
+
+    for dim_name, vals, bnds, axis in [
+            (x_dim_name, grid.x_vals, grid.x_bnds, 'X'),
+            (y_dim_name, grid.y_vals, grid.y_bnds, 'Y')]:
+        var = nco.createVariable(dim_name, 'f8', (dim_name,))
+        var.axis = axis
+        var.bounds = dim_name + '_bnds'
+        var.standard_name = 'projection_' + axis.lower() + '_coordinate'
+        var[:] = vals
+        var = nco.createVariable(dim_name + '_bnds', 'f8', (dim_name, 'bnds'))
+        var[:] = bnds
+
+    x, y = np.meshgrid(grid.x_vals, grid.y_vals)
+    lon, lat = grid.to_lonlat(x, y)
+    var = nco.createVariable('longitude', 'f8', (y_dim_name, x_dim_name))
+    var.units = 'degrees_east'
+    var.standard_name = 'longitude'
+    var[:] = lon
+    var = nco.createVariable('latitude', 'f8', (y_dim_name, x_dim_name))
+    var.units = 'degrees_north'
+    var.standard_name = 'latitude'
+    var[:] = lat
+
+    var = nco.createVariable('crs', 'i4')
+    for key, value in grid.grid_mapping.items():
+        var.setncattr(key, value)
+    var.crs_wkt = _spatial_reference(grid.crs).ExportToWkt()
+    return nco
+
+
+def write_regridded(output_filename, grid, fields, options):
+    """Write regridded fields.
+
+    Parameters
+    ----------
+    fields : list
+        Tuples of (name, values, extra_dim), where `extra_dim` is the name of
+        the leading (type or soil layer) dimension of `values`, or None.
+    """
+    nco = open_output_dataset(output_filename, options)
+    nco = add_target_grid_dims_2d(nco, grid)
+    for name, values, extra_dim in fields:
+        dims = ('y', 'x')
+        if extra_dim is not None:
+            if extra_dim not in nco.dimensions:
+                nco.createDimension(extra_dim, values.shape[0])
+                var = nco.createVariable(extra_dim, 'i4', (extra_dim,))
+                var.units = '1'
+                var.standard_name = extra_dim
+                var.long_name = extra_dim
+                var[:] = np.arange(1, values.shape[0] + 1)
+            dims = (extra_dim,) + dims
+        var = create_output_variable(nco, name, options['dtype'], dims, options, fill_value=options['fill_value'])
+        var.units = '1'
+        var.standard_name = name
+        var.grid_mapping = 'crs'
+        var.coordinates = 'latitude longitude'
+        var[:] = values
+    nco.close()
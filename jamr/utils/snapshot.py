@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Name of the GRASS location used by jamr
+LOCATION = 'jamr'
+
+# Files describing a snapshot, and marking a location cloned from one
+SNAPSHOT_MANIFEST = 'jamr_snapshot.json'
+
+# Sections of the configuration describing the input data, which must match
+# those of a snapshot for a run to use it (and be the same for all regions
+# in a batch, so that the inputs can be shared)
+INPUT_SECTIONS = ['landfraction', 'landcover', 'soil', 'topography']
+
+# ioctl request cloning a file on file systems with copy-on-write extents
+# (e.g. XFS, Btrfs), from linux/fs.h
+FICLONE = 0x40049409
+
+
+def inputs_fingerprint(config):
+    """Hash of the input data sections of a run configuration."""
+    inputs = {section: config.get(section) for section in INPUT_SECTIONS}
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def run_mapset(config):
+    """Mapset of a run using a snapshot."""
+    return f"run_{config['region']['name']}"
+
+
+def _reflink(src, dst):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def clone_file(src, dst, method='hardlink'):
+    """Clone a file by hard link or reflink, falling back to a copy where
+    the file system does not support it."""
+    try:
+        if method == 'hardlink':
+            os.link(src, dst)
+            return
+        if method == 'reflink':
+            _reflink(src, dst)
+            return
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+
+
+def clone_mapset(src, dst, method='hardlink'):
+    """Clone a GRASS mapset.
+
+    Files holding map data, in the subdirectories of the mapset, are cloned
+    with `method`. GRASS replaces these files rather than rewriting them, so
+    hard links are safe. The files at the top of the mapset (e.g. WIND) and
+    saved regions are rewritten in place, so they are copied.
+    """
+    for root, dirs, files in os.walk(src):
+        relpath = os.path.relpath(root, src)
+        dirs[:] = [d for d in dirs if d != '.tmp']
+        os.makedirs(os.path.join(dst, relpath), exist_ok=True)
+        for filename in files:
+            if filename == '.gislock':
+                continue
+            copy = relpath == '.' or relpath.split(os.sep)[0] == 'windows'
+            clone_file(
+                os.path.join(root, filename), os.path.join(dst, relpath, filename),
+                method='copy' if copy else method
+            )
+
+
+def create_snapshot(gisdb, snapshot_directory, config):
+    """Freeze the PERMANENT mapset of the jamr location, with the input maps
+    of a run imported, as a snapshot from which new runs are cloned.
+
+    The snapshot is a separate copy of the mapset, made with reflinks where
+    the file system supports them, so that it is not changed by later use
+    of the GRASS database.
+    """
+    if os.path.exists(snapshot_directory):
+        raise FileExistsError(f'Snapshot directory {snapshot_directory} already exists')
+
+    LOGGER.info(f'Creating snapshot of {os.path.join(gisdb, LOCATION)} in {snapshot_directory}')
+    tmp_directory = snapshot_directory.rstrip(os.sep) + '.tmp'
+    if os.path.exists(tmp_directory):
+        shutil.rmtree(tmp_directory)
+    clone_mapset(
+        os.path.join(gisdb, LOCATION, 'PERMANENT'),
+        os.path.join(tmp_directory, LOCATION, 'PERMANENT'),
+        method='reflink'
+    )
+    manifest = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'source': os.path.abspath(gisdb),
+        'inputs_fingerprint': inputs_fingerprint(config)
+    }
+    with open(os.path.join(tmp_directory, SNAPSHOT_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_directory, snapshot_directory)
+    return snapshot_directory
+
+
+def clone_snapshot(snapshot_directory, gisdb, config):
+    """Clone a snapshot as the jamr location of a GRASS database.
+
+    Map data are hard linked to the snapshot, so runs must write to a
+    mapset of their own rather than to PERMANENT. A location cloned from
+    the same snapshot before is reused. Returns False if the location was
+    reused.
+    """
+    with open(os.path.join(snapshot_directory, SNAPSHOT_MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest['inputs_fingerprint'] != inputs_fingerprint(config):
+        raise ValueError(f'The input data of the configuration differ from those of snapshot {snapshot_directory}')
+
+    location = os.path.join(gisdb, LOCATION)
+    marker = os.path.join(location, SNAPSHOT_MANIFEST)
+    if os.path.exists(location):
+        if os.path.exists(marker):
+            with open(marker) as f:
+                if json.load(f) == manifest:
+                    LOGGER.info(f'Using location {location}, cloned from snapshot {snapshot_directory}')
+                    return False
+        raise FileExistsError(f'Location {location} exists and was not cloned from snapshot {snapshot_directory}')
+
+    LOGGER.info(f'Cloning snapshot {snapshot_directory} to {location}')
+    tmp_location = location + '.tmp'
+    if os.path.exists(tmp_location):
+        shutil.rmtree(tmp_location)
+    clone_mapset(
+        os.path.join(snapshot_directory, LOCATION, 'PERMANENT'),
+        os.path.join(tmp_location, 'PERMANENT')
+    )
+    shutil.copy2(os.path.join(snapshot_directory, SNAPSHOT_MANIFEST), os.path.join(tmp_location, SNAPSHOT_MANIFEST))
+    os.replace(tmp_location, location)
+    return True
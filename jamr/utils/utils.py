@@ -4,13 +4,19 @@ import netCDF4
 import rasterio
 import numpy as np
 
-from grass.script import array as garray 
-from grass.script import core as grass 
+from jamr.backends.backend import get_backend
+from jamr.utils.blocks import (block_rows, iter_row_blocks, region_shape)
 
 F8_FILLVAL = netCDF4.default_fillvals['f8']
 F4_FILLVAL = netCDF4.default_fillvals['f4']
 I4_FILLVAL = netCDF4.default_fillvals['i4']
 
+# Number of chunk rows held in the chunk cache of each output variable, so 
+# that chunks are not compressed more than once when blocks are written
+CHUNK_CACHE_ROWS = 2
+
+OUTPUT_FORMAT_EXTENSIONS = {'netcdf': '.nc', 'zarr': '.zarr'}
+
 
 def raster2array(map):
     # with rasterio.open(fn) as src:
@@ -18,24 +24,116 @@ def raster2array(map):
     #     extent = src.bounds
     #     data = src.read(1, masked=False)
     
-    data = garray.array(map)
+    with get_backend().block_reader([map]) as reader:
+        data = reader.read(0, reader.shape[0])[0]
     # data = data.squeeze()
-    region = grass.region()
+    coords, bnds = region_coords()
+    return coords, bnds, data
+
+
+def region_coords():
+    """Cell centre coordinates and bounds of the current region."""
+    region = get_backend().region_definition()
+    region['rows'], region['cols'] = region_shape(region)
     x_vals = np.arange(region['cols']) * region['ewres'] + region['w'] + region['ewres'] / 2.
     y_vals = np.arange(region['rows']) * region['nsres'] + region['s'] + region['nsres'] / 2. 
     y_vals = y_vals[::-1] # north-south
     x_bnds = get_lat_lon_bnds(x_vals, (region['w'], region['e']))
     y_bnds = get_lat_lon_bnds(y_vals, (region['n'], region['s']))
-
-    # ny = data.shape[0]
-    # nx = data.shape[1]
-    # x_vals = np.arange(nx) * transform[0] + transform[2] + transform[0]/2
-    # y_vals = np.arange(ny) * transform[4] + transform[5] + transform[4]/2
-    # x_bnds = get_lat_lon_bnds(x_vals, (extent.left, extent.right))
-    # y_bnds = get_lat_lon_bnds(y_vals, (extent.top, extent.bottom))
     coords = (x_vals, y_vals)
     bnds = (x_bnds, y_bnds)
-    return coords, bnds, data
+    return coords, bnds
+
+
+def output_options(config):
+    """Output options from the `output` section of the configuration."""
+    options = config.get('output', {})
+    dtype = options.get('dtype', 'f8')
+    if dtype not in ['f4', 'f8']:
+        raise ValueError(f'Unknown output data type: {dtype}')
+
+    compression = options.get('compression', None)
+    if compression not in [None, 'zlib', 'zstd']:
+        raise ValueError(f'Unknown output compression: {compression}')
+
+    grid_layout = options.get('grid_layout', 'grid')
+    if grid_layout not in ['grid', 'land_points']:
+        raise ValueError(f'Unknown output grid layout: {grid_layout}')
+
+    format = options.get('format', 'netcdf')
+    if format not in OUTPUT_FORMAT_EXTENSIONS.keys():
+        raise ValueError(f'Unknown output format: {format}')
+
+    return {
+        'format': format,
+        'nthreads': int(options.get('nthreads', 4)),
+        'suffix': options.get('suffix', ''),
+        'grid_layout': grid_layout,
+        'ants_frac': bool(options.get('ants_frac', False)),
+        'dtype': dtype,
+        'fill_value': F4_FILLVAL if dtype == 'f4' else F8_FILLVAL,
+        'compression': compression,
+        'complevel': int(options.get('complevel', 4)),
+        'shuffle': bool(options.get('shuffle', True)),
+        'chunk_rows': int(options.get('chunk_rows', 64)),
+        'chunk_cols': int(options.get('chunk_cols', 1024))
+    }
+
+
+def output_path(directory, basename, options):
+    """Path of an output file, with the extension of the output format."""
+    return os.path.join(directory, basename + options['suffix'] + OUTPUT_FORMAT_EXTENSIONS[options['format']])
+
+
+def open_output_dataset(filename, options):
+    """Open a new output dataset for writing.
+
+    Zarr stores are returned as a `ZarrDataset`, which supports the parts of 
+    the netCDF4.Dataset interface used by the writers.
+    """
+    if options['format'] == 'zarr':
+        from jamr.utils.zarr_utils import ZarrDataset
+        return ZarrDataset(filename, nthreads=options['nthreads'])
+    return netCDF4.Dataset(filename, 'w', format='NETCDF4')
+
+
+def create_output_variable(nco, varname, datatype, dimensions, options, fill_value=None, grid_ndim=2):
+    """Create a netCDF variable with the compression and chunking given by 
+    `options`.
+
+    The trailing `grid_ndim` dimensions are the grid: (y, x) for gridded 
+    output, which is tiled in blocks of `chunk_rows` by `chunk_cols`, or the 
+    land point dimension, which is split into chunks of the same number of 
+    points. Leading (type) dimensions are kept whole in each chunk, which 
+    matches the way JULES reads ancillary fields.
+    """
+    kwargs = {}
+    if options['compression'] is not None:
+        kwargs['compression'] = options['compression']
+        kwargs['complevel'] = options['complevel']
+        kwargs['shuffle'] = options['shuffle']
+
+    shape = [len(nco.dimensions[dim]) for dim in dimensions]
+    if grid_ndim == 2:
+        grid_chunksizes = [
+            max(1, min(options['chunk_rows'], shape[-2])), 
+            max(1, min(options['chunk_cols'], shape[-1]))
+        ]
+        # Enough to hold whole rows of chunks
+        cache_cells = grid_chunksizes[0] * shape[-1] * CHUNK_CACHE_ROWS
+    else:
+        grid_chunksizes = [max(1, min(options['chunk_rows'] * options['chunk_cols'], shape[-1]))]
+        cache_cells = grid_chunksizes[0] * CHUNK_CACHE_ROWS
+
+    chunksizes = shape[:-grid_ndim] + grid_chunksizes
+    var = nco.createVariable(
+        varname, datatype, dimensions, 
+        fill_value=fill_value, chunksizes=chunksizes, **kwargs
+    )
+    itemsize = np.dtype(datatype).itemsize
+    cache_size = int(np.prod(shape[:-grid_ndim], dtype=np.int64)) * cache_cells * itemsize
+    var.set_var_chunk_cache(size=max(cache_size, 1048576))
+    return var
 
 
 def get_lat_lon_grids(lat_vals, lon_vals):
@@ -103,6 +201,26 @@ def add_lat_lon_dims_2d(nco, x_dim_name, y_dim_name, x_vals, y_vals, x_bnds, y_b
     
     return nco
 
+def add_land_point_dims_1d(nco, grid_dim_name, land_index, x_vals, y_vals):
+    """Add a land point dimension with 1d latitude/longitude data to a 
+    netCDF object."""
+    nco.createDimension(grid_dim_name, land_index.nland)
+
+    lon_var = nco.createVariable('longitude', 'f8', (grid_dim_name,))
+    lon_var.units = 'degrees_east'
+    lon_var.standard_name = 'longitude'
+
+    lat_var = nco.createVariable('latitude', 'f8', (grid_dim_name,))
+    lat_var.units = 'degrees_north'
+    lat_var.standard_name = 'latitude'
+
+    for start, stop in iter_row_blocks(land_index.nrows, block_rows(land_index.ncols)):
+        rows, cols = land_index.block_indices(start, stop)
+        lon_var[land_index.block_slice(start, stop)] = x_vals[cols]
+        lat_var[land_index.block_slice(start, stop)] = y_vals[start + rows]
+
+    return nco
+
 # def get_region_data():
 #     """Function to obtain geospatial parameters."""
 #     ds = rasterio.open(os.environ['JULES_LAND_FRAC_FN'])
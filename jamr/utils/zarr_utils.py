@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import threading
+import numpy as np
+import numcodecs
+import zarr
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class ZarrDimension:
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+
+class ZarrVariable:
+    """A Zarr array with the parts of the netCDF4.Variable interface used by
+    the JULES ancillary writers.
+
+    Assignments are written by the thread pool of the parent dataset. Writes
+    which cover whole chunks are written concurrently; parts of a write which
+    cover only part of a chunk are serialised, because a neighbouring write
+    may update the same chunk.
+    """
+    def __init__(self, dataset, array, fill_value):
+        self.__dict__['_dataset'] = dataset
+        self.__dict__['_array'] = array
+        self.__dict__['_fill_value'] = fill_value
+
+    def __setattr__(self, name, value):
+        self._array.attrs[name] = value
+
+    def __getattr__(self, name):
+        try:
+            return self._array.attrs[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def shape(self):
+        return self._array.shape
+
+    def set_var_chunk_cache(self, **kwargs):
+        pass
+
+    def _normalise_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (len(self.shape) - len(key))
+        if any(not isinstance(k, slice) or k.step not in (None, 1) for k in key):
+            return None
+        return tuple(slice(*k.indices(n)[:2]) for k, n in zip(key, self.shape))
+
+    def _is_aligned(self, k, n, chunk):
+        return k.start % chunk == 0 and (k.stop % chunk == 0 or k.stop == n)
+
+    def __setitem__(self, key, value):
+        fill_value = self._fill_value if self._fill_value is not None else 0
+        value = np.array(np.ma.filled(value, fill_value), dtype=self._array.dtype)
+        key = self._normalise_key(key)
+        if key is None or len(self.shape) == 0:
+            self._dataset._submit(self._array, key if key is not None else Ellipsis, value, locked=True)
+            return
+
+        value = np.broadcast_to(value, tuple(k.stop - k.start for k in key))
+        chunks = self._array.chunks
+        partial = [i for i, (k, n) in enumerate(zip(key, self.shape)) if (k.start, k.stop) != (0, n)]
+        if all(self._is_aligned(key[i], self.shape[i], chunks[i]) for i in partial):
+            self._dataset._submit(self._array, key, value, locked=False)
+        elif len(partial) == 1:
+            # Split into the chunk-aligned body and partially covered ends
+            axis = partial[0]
+            start, stop = key[axis].start, key[axis].stop
+            chunk = chunks[axis]
+            head = min(stop, -(-start // chunk) * chunk)
+            tail = max(head, (stop // chunk) * chunk)
+            for lo, hi in [(start, head), (head, tail), (tail, stop)]:
+                if hi <= lo:
+                    continue
+                sub_key = key[:axis] + (slice(lo, hi),) + key[(axis + 1):]
+                sub_value = value[(slice(None),) * axis + (slice(lo - start, hi - start),)]
+                locked = not self._is_aligned(slice(lo, hi), self.shape[axis], chunk)
+                self._dataset._submit(self._array, sub_key, sub_value, locked=locked)
+        else:
+            self._dataset._submit(self._array, key, value, locked=True)
+
+
+class ZarrDataset:
+    """A Zarr group with the parts of the netCDF4.Dataset interface used by
+    the JULES ancillary writers.
+
+    Dimension names are stored in the `_ARRAY_DIMENSIONS` attribute of each
+    array, following the convention used by xarray, and the metadata is
+    consolidated when the dataset is closed.
+    """
+    def __init__(self, filename, nthreads=4):
+        self.filename = filename
+        self.group = zarr.open_group(filename, mode='w', zarr_format=2)
+        self.dimensions = {}
+        self.variables = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, nthreads))
+        self._max_pending = 2 * max(1, nthreads)
+        self._pending = set()
+
+    def createDimension(self, name, size):
+        self.dimensions[name] = ZarrDimension(name, size)
+        return self.dimensions[name]
+
+    def createVariable(self, varname, datatype, dimensions=(), fill_value=None, chunksizes=None,
+                       compression=None, complevel=4, shuffle=True):
+        dtype = np.dtype(datatype)
+        shape = tuple(len(self.dimensions[dim]) for dim in dimensions)
+        compressor = None
+        if compression == 'zlib':
+            compressor = numcodecs.Zlib(level=complevel)
+        elif compression == 'zstd':
+            compressor = numcodecs.Zstd(level=complevel)
+
+        filters = None
+        if compression is not None and shuffle and dtype.itemsize > 1:
+            filters = [numcodecs.Shuffle(elementsize=dtype.itemsize)]
+
+        array = self.group.create_array(
+            varname, shape=shape, dtype=dtype,
+            chunks=tuple(chunksizes) if chunksizes is not None else 'auto',
+            fill_value=fill_value, compressors=compressor, filters=filters
+        )
+        array.attrs['_ARRAY_DIMENSIONS'] = list(dimensions)
+        self.variables[varname] = ZarrVariable(self, array, fill_value)
+        return self.variables[varname]
+
+    def _write(self, array, key, value, locked):
+        if locked:
+            with self._lock:
+                array[key] = value
+        else:
+            array[key] = value
+
+    def _submit(self, array, key, value, locked):
+        # Bound the number of blocks held in memory by pending writes
+        if len(self._pending) >= self._max_pending:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        self._pending.add(self._executor.submit(self._write, array, key, value, locked))
+
+    def close(self):
+        try:
+            for future in self._pending:
+                future.result()
+        finally:
+            self._pending = set()
+            self._executor.shutdown(wait=True)
+        zarr.consolidate_metadata(self.filename)
@@ -10,7 +10,16 @@ with open('README.rst') as readme_file:
 with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
-requirements = ['Click>=7.0', 'grass-session==0.5', 'numpy']
+# rasterio and scipy are used by the native backend, the input file checks 
+# and point sites, and requests by `jamr download`
+requirements = ['Click>=7.0', 'grass-session==0.5', 'numpy', 'rasterio', 'scipy', 'requests']
+
+# Optional dependencies of the Dask backend and of Zarr output
+extras_requirements = {
+    'dask': ['dask[array]'],
+    'zarr': ['zarr>=3'],
+}
+extras_requirements['all'] = sorted(set(sum(extras_requirements.values(), [])))
 
 test_requirements = [ ]
 
@@ -35,6 +44,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
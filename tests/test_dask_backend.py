@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.backends.dask_backend`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+
+import dask
+import numpy as np
+import rasterio
+
+from rasterio.transform import from_origin
+
+from jamr.backends import (dask_backend, native_backend)
+from jamr.backends.backend import BackendFactory
+from jamr.backends.dask_backend import (DaskBackend, configure_scheduler)
+from jamr.backends.native_backend import NativeBackend
+
+
+def write_raster(filename, arr, res, west=0., north=10.):
+    with rasterio.open(
+        filename, 'w', driver='GTiff', height=arr.shape[0], width=arr.shape[1], count=1, dtype='float64',
+        crs='EPSG:4326', transform=from_origin(west, north, res, res), nodata=np.nan
+    ) as dst:
+        dst.write(arr, 1)
+
+
+def read_map(backend, mapname):
+    with backend.block_reader([mapname]) as reader:
+        return reader.read(0, reader.shape[0])[0]
+
+
+def _scheduler():
+    return dask.config.get('scheduler', None)
+
+
+class FakeClient:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestDaskBackend(unittest.TestCase):
+    """Tests that the Dask backend computes the same maps as the native
+    backend, and of its scheduler."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.lc = rng.choice([10., 50., 210.], size=(100, 100))
+        self.val = rng.random((100, 100))
+        self.val[self.val < 0.3] = np.nan
+        write_raster(os.path.join(self.directory, 'lc.tif'), self.lc, 0.1)
+        write_raster(os.path.join(self.directory, 'val.tif'), self.val, 0.1)
+        # Data only in the first row, so that most nulls are further than
+        # the (shortened) halo from data
+        self.sparse = np.full((100, 100), np.nan)
+        self.sparse[0] = np.arange(100.)
+        write_raster(os.path.join(self.directory, 'sparse.tif'), self.sparse, 0.1)
+        configure_scheduler('threads', num_workers=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compute(self, backend):
+        backend.import_raster(os.path.join(self.directory, 'lc.tif'), 'lc')
+        backend.import_raster(os.path.join(self.directory, 'val.tif'), 'val')
+        backend.import_raster(os.path.join(self.directory, 'sparse.tif'), 'sparse')
+        backend.set_region(raster='lc')
+        backend.calc('mix', 'where({lc} == 210, 0, {v} * 2)', lc='lc', v='val')
+        backend.reclass('lc', 'frac', {10: 0.3, 50: 0.9})
+        backend.grow('val', 'val_grown')
+        backend.grow('sparse', 'sparse_grown')
+        backend.set_mask('frac', '0.3')
+        backend.calc('masked', '{v} + 1', v='val')
+        backend.remove_mask()
+        maps = {name: read_map(backend, name) for name in ['mix', 'frac', 'masked', 'val_grown', 'sparse_grown']}
+        backend.set_region(n=10, s=0, e=10, w=0, res=0.5)
+        backend.resample('mix', 'mix_avg', 'average')
+        backend.resample('val', 'val_sum', 'sum')
+        maps.update({name: read_map(backend, name) for name in ['mix_avg', 'val_sum']})
+        return maps
+
+    def test_same_as_native(self):
+        with mock.patch.object(native_backend, 'GROW_HALO_ROWS', 8), \
+             mock.patch.object(dask_backend, 'GROW_HALO_ROWS', 8):
+            native = self.compute(NativeBackend(os.path.join(self.directory, 'native')))
+            lazy = self.compute(DaskBackend(os.path.join(self.directory, 'dask'), chunk_size=32))
+        self.assertFalse(np.isnan(lazy['sparse_grown']).any())
+        for name in native:
+            np.testing.assert_allclose(lazy[name], native[name], rtol=1e-6, equal_nan=True, err_msg=name)
+
+    def test_forked_workers_compute_synchronously(self):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as executor:
+            self.assertEqual(executor.submit(_scheduler).result(), 'synchronous')
+        self.assertEqual(_scheduler(), 'threads')
+
+    def test_close_client(self):
+        client = FakeClient()
+        backend = DaskBackend(os.path.join(self.directory, 'dask'), client=client)
+        backend.close()
+        self.assertTrue(client.closed)
+        self.assertIsNone(backend.client)
+
+    def test_distributed_needs_one_process(self):
+        config = {
+            'main': {'backend': 'dask', 'scratch_directory': self.directory, 'nprocs': 4},
+            'dask': {'scheduler': 'distributed'}
+        }
+        with self.assertRaises(ValueError):
+            BackendFactory.create_backend(config)
+
+
+if __name__ == '__main__':
+    unittest.main()
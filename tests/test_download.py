@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.download.downloader`, against local HTTP and FTP servers."""
+
+import os
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+import socketserver
+
+from http.server import (BaseHTTPRequestHandler, ThreadingHTTPServer)
+
+from jamr.download.downloader import (Downloader, DownloadError, DownloadJob, PARTIAL_SUFFIX)
+
+
+class HTTPHandler(BaseHTTPRequestHandler):
+    """Serves `server.files`, with Range requests. Each path in
+    `server.faults` gives the response to the first request of the path:
+    'unavailable' (503), 'truncated' (half the body, then the connection
+    is closed) or 'unauthorized' (401, for every request)."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def _respond(self, head):
+        server = self.server
+        path = self.path
+        server.requests.append((self.command, path, self.headers.get('Range')))
+        count = sum(1 for request in server.requests if request[1] == path)
+        fault = server.faults.get(path)
+        if path not in server.files:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if fault == 'unauthorized' or (fault == 'unavailable' and count == 1):
+            self.send_response(401 if fault == 'unauthorized' else 503)
+            self.end_headers()
+            return
+
+        body = server.files[path]
+        start = 0
+        if self.headers.get('Range') is not None:
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        if head:
+            return
+        if fault == 'truncated' and count == 1:
+            self.wfile.write(body[start:(start + len(body) // 2)])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(body[start:])
+
+
+class FTPHandler(socketserver.StreamRequestHandler):
+    """A minimal passive mode FTP server of `server.files`. The first
+    transfer of each path in `server.faults` is broken off halfway."""
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self):
+        server = self.server
+        self.reply('220 ready')
+        rest = 0
+        data_socket = None
+        for line in self.rfile:
+            command, _, arg = line.decode().strip().partition(' ')
+            command = command.upper()
+            if command == 'USER':
+                self.reply('331 password required')
+            elif command in ['PASS', 'TYPE']:
+                self.reply('230 ok' if command == 'PASS' else '200 ok')
+            elif command == 'SIZE':
+                self.reply(f'213 {len(server.files[arg])}' if arg in server.files else '550 no such file')
+            elif command == 'PASV':
+                data_socket = socket.socket()
+                data_socket.bind(('127.0.0.1', 0))
+                data_socket.listen(1)
+                port = data_socket.getsockname()[1]
+                self.reply(f'227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 255})')
+            elif command == 'REST':
+                rest = int(arg)
+                self.reply('350 restarting')
+            elif command == 'RETR':
+                server.transfers.append((arg, rest))
+                count = sum(1 for transfer in server.transfers if transfer[0] == arg)
+                self.reply('150 sending')
+                connection, _ = data_socket.accept()
+                body = server.files[arg][rest:]
+                broken = arg in server.faults and count == 1
+                connection.sendall(body[:len(body) // 2] if broken else body)
+                connection.close()
+                data_socket.close()
+                self.reply('426 connection closed' if broken else '226 done')
+                rest = 0
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+class FTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def start_server(server, files, faults):
+    server.files = files
+    server.faults = faults
+    server.requests = []
+    server.transfers = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestDownloader(unittest.TestCase):
+    """Tests for `jamr.download.downloader.Downloader`."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.files = {f'/file{i}.bin': os.urandom(300000 + i) for i in range(4)}
+        self.downloader = Downloader(nworkers=2, retries=2, backoff=0.01, timeout=5, chunk_size=4096)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def serve_http(self, faults=None):
+        server = start_server(ThreadingHTTPServer(('127.0.0.1', 0), HTTPHandler), self.files, faults or {})
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+    def serve_ftp(self, faults=None):
+        server = start_server(FTPServer(('127.0.0.1', 0), FTPHandler), self.files, faults or {})
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f'ftp://127.0.0.1:{server.server_address[1]}'
+
+    def job(self, url, path):
+        return DownloadJob(url + path, os.path.join(self.directory, os.path.basename(path)))
+
+    def assert_downloaded(self, path):
+        local_filename = os.path.join(self.directory, os.path.basename(path))
+        with open(local_filename, 'rb') as f:
+            self.assertEqual(f.read(), self.files[path])
+        self.assertFalse(os.path.exists(local_filename + PARTIAL_SUFFIX))
+
+    def write_partial(self, path, data):
+        with open(os.path.join(self.directory, os.path.basename(path)) + PARTIAL_SUFFIX, 'wb') as f:
+            f.write(data)
+
+    def test_http_download(self):
+        server, url = self.serve_http()
+        not_available = self.downloader.download([self.job(url, path) for path in self.files])
+        self.assertEqual(not_available, [])
+        for path in self.files:
+            self.assert_downloaded(path)
+
+        # Files which exist are not downloaded again
+        server.requests.clear()
+        self.downloader.download([self.job(url, path) for path in self.files])
+        self.assertEqual(server.requests, [])
+
+    def test_http_resume(self):
+        server, url = self.serve_http()
+        self.write_partial('/file0.bin', self.files['/file0.bin'][:1000])
+        self.downloader.download([self.job(url, '/file0.bin')])
+        self.assert_downloaded('/file0.bin')
+        self.assertEqual(server.requests, [('GET', '/file0.bin', 'bytes=1000-')])
+
+    def test_http_retry_unavailable(self):
+        server, url = self.serve_http({'/file0.bin': 'unavailable'})
+        self.downloader.download([self.job(url, '/file0.bin')])
+        self.assert_downloaded('/file0.bin')
+        self.assertEqual(len(server.requests), 2)
+
+    def test_http_resume_truncated(self):
+        server, url = self.serve_http({'/file0.bin': 'truncated'})
+        self.downloader.download([self.job(url, '/file0.bin')])
+        self.assert_downloaded('/file0.bin')
+        # The second attempt continues from the data already received
+        self.assertEqual(server.requests[0][2], None)
+        self.assertIsNotNone(server.requests[1][2])
+
+    def test_http_complete_partial_file(self):
+        server, url = self.serve_http()
+        self.write_partial('/file0.bin', self.files['/file0.bin'])
+        self.downloader.download([self.job(url, '/file0.bin')])
+        self.assert_downloaded('/file0.bin')
+        self.assertEqual(len(server.requests), 1)
+
+    def test_http_stale_partial_file(self):
+        # A partial file longer than the file is discarded and downloaded again
+        server, url = self.serve_http()
+        self.write_partial('/file0.bin', os.urandom(len(self.files['/file0.bin']) + 10))
+        self.downloader.download([self.job(url, '/file0.bin')])
+        self.assert_downloaded('/file0.bin')
+        self.assertEqual(server.requests[-1], ('GET', '/file0.bin', None))
+
+    def test_http_not_available(self):
+        server, url = self.serve_http()
+        missing = self.job(url, '/missing.bin')
+        not_available = self.downloader.download([missing, self.job(url, '/file0.bin')])
+        self.assertEqual(not_available, [missing])
+        self.assertFalse(os.path.exists(missing.local_filename))
+        self.assert_downloaded('/file0.bin')
+
+    def test_http_error(self):
+        server, url = self.serve_http({'/file1.bin': 'unauthorized'})
+        failed = self.job(url, '/file1.bin')
+        with self.assertRaises(DownloadError) as context:
+            self.downloader.download([self.job(url, '/file0.bin'), failed, self.job(url, '/missing.bin')])
+        self.assertEqual(context.exception.jobs, [failed])
+        # Errors are not retried, and do not stop the other downloads
+        self.assertEqual(len([request for request in server.requests if request[1] == '/file1.bin']), 1)
+        self.assert_downloaded('/file0.bin')
+
+    def test_ftp_resume_broken_transfer(self):
+        server, url = self.serve_ftp({'/file0.bin'})
+        self.downloader.download([self.job(url, path) for path in self.files])
+        for path in self.files:
+            self.assert_downloaded(path)
+        transfers = [transfer for transfer in server.transfers if transfer[0] == '/file0.bin']
+        self.assertEqual(transfers[0][1], 0)
+        self.assertGreater(transfers[1][1], 0)
+
+    def test_ftp_not_available(self):
+        server, url = self.serve_ftp()
+        missing = self.job(url, '/missing.bin')
+        self.assertEqual(self.downloader.download([missing]), [missing])
+        self.assertFalse(os.path.exists(missing.local_filename))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.process.intermediates`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from jamr.backends import backend
+from jamr.backends.backend import set_backend
+from jamr.backends.native_backend import NativeBackend
+from jamr.process.intermediates import IntermediateMaps
+
+
+class TestIntermediateMaps(unittest.TestCase):
+    """Tests for `jamr.process.intermediates.IntermediateMaps`."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(set_backend, backend._BACKEND)
+        self.backend = set_backend(NativeBackend(os.path.join(self.directory, 'maps')))
+        self.backend.set_region(n=1, s=0, e=1, w=0, res=0.5)
+        for mapname in ['a', 'b', 'c']:
+            self.backend.calc(mapname, '1')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def existing(self):
+        return [mapname for mapname in ['a', 'b', 'c'] if self.backend.map_exists(mapname)]
+
+    def test_release(self):
+        intermediates = IntermediateMaps()
+        intermediates.add(['a'], ['frac', 'soil'])
+        intermediates.add(['b'], ['soil'])
+        intermediates.add(['a'], ['write'])
+
+        # Maps are removed once the last step reading them is released
+        intermediates.release('frac')
+        self.assertEqual(self.existing(), ['a', 'b', 'c'])
+        intermediates.release('soil')
+        self.assertEqual(self.existing(), ['a', 'c'])
+        intermediates.release('other')
+        self.assertEqual(self.existing(), ['a', 'c'])
+        intermediates.release('write')
+        self.assertEqual(self.existing(), ['c'])
+        self.assertEqual(intermediates.consumers, {})
+
+        # Releasing a step again does nothing
+        intermediates.release('write')
+        self.assertEqual(self.existing(), ['c'])
+
+    def test_keep(self):
+        intermediates = IntermediateMaps(keep=True)
+        intermediates.add(['a', 'b'], ['frac'])
+        intermediates.release('frac')
+        self.assertEqual(self.existing(), ['a', 'b', 'c'])
+        self.assertEqual(intermediates.consumers, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.process.journal`."""
+
+import os
+import copy
+import shutil
+import tempfile
+import unittest
+
+from jamr.backends import backend
+from jamr.backends.backend import set_backend
+from jamr.backends.native_backend import NativeBackend
+from jamr.process.journal import (JOURNAL_FILENAME, StepJournal, config_fingerprint)
+
+
+class TestStepJournal(unittest.TestCase):
+    """Tests for `jamr.process.journal.StepJournal`."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(set_backend, backend._BACKEND)
+        set_backend(NativeBackend(os.path.join(self.directory, 'maps')))
+        self.config = {
+            'main': {'output_directory': self.directory, 'nprocs': 1},
+            'region': {'name': 'uk', 'nsres': 0.1}
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def output_file(self, name):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w') as f:
+            f.write('data')
+        return filename
+
+    def run_steps(self, journal, names):
+        run = []
+        for name in names:
+            journal.run(name, lambda: run.append(name), files=[os.path.join(self.directory, name)])
+        return run
+
+    def test_resume(self):
+        journal = StepJournal(self.directory, self.config)
+        for name in ['a', 'b']:
+            journal.record(name, files=[self.output_file(name)])
+
+        # Steps whose output still exists are skipped
+        os.remove(os.path.join(self.directory, 'b'))
+        journal = StepJournal(self.directory, self.config, resume=True)
+        self.assertEqual(self.run_steps(journal, ['a', 'b', 'c']), ['b', 'c'])
+
+        # A new run starts afresh
+        journal = StepJournal(self.directory, self.config)
+        self.assertEqual(self.run_steps(journal, ['a']), ['a'])
+
+    def test_resume_missing_map(self):
+        journal = StepJournal(self.directory, self.config)
+        journal.record('map', maps=['missing'])
+        journal = StepJournal(self.directory, self.config, resume=True)
+        self.assertFalse(journal.is_done('map'))
+
+    def test_resume_truncated(self):
+        journal = StepJournal(self.directory, self.config)
+        journal.record('a', files=[self.output_file('a')])
+        with open(os.path.join(self.directory, JOURNAL_FILENAME), 'a') as f:
+            f.write('{"event": "done", "st')
+        journal = StepJournal(self.directory, self.config, resume=True)
+        self.assertTrue(journal.is_done('a'))
+
+    def test_fingerprint_mismatch(self):
+        StepJournal(self.directory, self.config)
+        config = copy.deepcopy(self.config)
+        config['region']['nsres'] = 0.5
+        with self.assertRaises(ValueError):
+            StepJournal(self.directory, config, resume=True)
+
+    def test_run_control_options(self):
+        # Options which do not change the output can differ when resuming
+        StepJournal(self.directory, self.config)
+        config = copy.deepcopy(self.config)
+        config['main'].update({'keep_intermediates': True, 'nprocs': 8})
+        self.assertEqual(config_fingerprint(config), config_fingerprint(self.config))
+        StepJournal(self.directory, config, resume=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.backends.native_backend`, against small hand-computed maps."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+
+from unittest import mock
+from rasterio.transform import from_origin
+
+from jamr.backends import native_backend
+from jamr.backends.native_backend import NativeBackend
+
+NAN = np.nan
+
+
+def write_raster(filename, arr, res=1., west=0., north=4.):
+    with rasterio.open(
+        filename, 'w', driver='GTiff', height=arr.shape[0], width=arr.shape[1], count=1, dtype='float64',
+        crs='EPSG:4326', transform=from_origin(west, north, res, res), nodata=np.nan
+    ) as dst:
+        dst.write(arr, 1)
+
+
+class TestNativeBackend(unittest.TestCase):
+    """Tests for `jamr.backends.native_backend.NativeBackend`."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = NativeBackend(os.path.join(self.directory, 'maps'))
+        self.lc = np.array([
+            [10., 10., 50., 50.],
+            [10., 210., 50., 50.],
+            [210., 210., 10., NAN],
+            [50., 10., 10., 10.]
+        ])
+        self.val = np.array([
+            [1., 2., 3., 4.],
+            [5., NAN, 7., 8.],
+            [9., 10., NAN, 12.],
+            [13., 14., 15., 16.]
+        ])
+        self.import_map('lc', self.lc)
+        self.import_map('val', self.val)
+        self.backend.set_region(raster='lc')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def import_map(self, mapname, arr, **kwargs):
+        filename = os.path.join(self.directory, f'{mapname}.tif')
+        write_raster(filename, arr, **kwargs)
+        self.backend.import_raster(filename, mapname)
+
+    def read(self, mapname):
+        with self.backend.block_reader([mapname]) as reader:
+            return reader.read(0, reader.shape[0])[0]
+
+    def assert_map_equal(self, mapname, expected):
+        np.testing.assert_allclose(self.read(mapname), np.array(expected, dtype=np.float64), equal_nan=True)
+
+    def test_calc(self):
+        self.backend.calc('water', 'where({lc} == 210, 1, 0)', lc='lc')
+        self.assert_map_equal('water', [
+            [0, 0, 0, 0],
+            [0, 1, 0, 0],
+            [1, 1, 0, NAN],
+            [0, 0, 0, 0]
+        ])
+        self.backend.calc('sum', '{v} * 2 + {w}', v='val', w='water')
+        self.assert_map_equal('sum', [
+            [2, 4, 6, 8],
+            [10, NAN, 14, 16],
+            [19, 21, NAN, NAN],
+            [26, 28, 30, 32]
+        ])
+        self.backend.calc('filled', 'where(isnull({v}), -1, {v})', v='val')
+        self.assert_map_equal('filled', [
+            [1, 2, 3, 4],
+            [5, -1, 7, 8],
+            [9, 10, -1, 12],
+            [13, 14, 15, 16]
+        ])
+
+    def test_reclass(self):
+        self.backend.reclass('lc', 'frac', {10: 0.25, 50: 0.75})
+        self.assert_map_equal('frac', [
+            [0.25, 0.25, 0.75, 0.75],
+            [0.25, 0, 0.75, 0.75],
+            [0, 0, 0.25, NAN],
+            [0.75, 0.25, 0.25, 0.25]
+        ])
+
+    def test_resample(self):
+        self.backend.set_region(n=4, s=0, e=4, w=0, res=2.)
+        self.backend.resample('val', 'val_avg', 'average')
+        self.assert_map_equal('val_avg', [[8 / 3, 5.5], [11.5, 43 / 3]])
+        self.backend.resample('val', 'val_sum', 'sum')
+        self.assert_map_equal('val_sum', [[8, 22], [46, 43]])
+        self.backend.resample('val', 'val_max', 'maximum')
+        self.assert_map_equal('val_max', [[5, 8], [14, 16]])
+
+    def test_mask(self):
+        self.backend.set_mask('lc', '10 50')
+        self.backend.calc('masked', '{v}', v='val')
+        self.backend.remove_mask()
+        self.assert_map_equal('masked', [
+            [1, 2, 3, 4],
+            [5, NAN, 7, 8],
+            [NAN, NAN, NAN, NAN],
+            [13, 14, 15, 16]
+        ])
+
+    def test_grow(self):
+        self.import_map('sparse', np.array([
+            [NAN, NAN, NAN, 4.],
+            [NAN, NAN, NAN, NAN],
+            [1., NAN, NAN, NAN],
+            [NAN, NAN, NAN, NAN]
+        ]))
+        self.backend.grow('sparse', 'grown')
+        self.assert_map_equal('grown', [
+            [1, 4, 4, 4],
+            [1, 1, 4, 4],
+            [1, 1, 1, 4],
+            [1, 1, 1, 4]
+        ])
+
+    def test_grow_beyond_halo(self):
+        # Cells further than the halo from data are filled from the seed
+        # grid, exactly when it is not coarsened
+        arr = np.full((40, 4), np.nan)
+        arr[0, :] = [1., 2., 3., 4.]
+        self.import_map('sparse', arr, north=40.)
+        self.backend.set_region(raster='sparse')
+        with mock.patch.object(native_backend, 'GROW_HALO_ROWS', 2), \
+             mock.patch.object(native_backend, 'block_rows', return_value=5):
+            self.backend.grow('sparse', 'grown')
+        self.assert_map_equal('grown', np.tile([1., 2., 3., 4.], (40, 1)))
+
+        # ...and otherwise from the first data in each 2 x 2 block of the
+        # seed grid. Blocks are rounded to 4 rows, so the first block is
+        # filled exactly
+        with mock.patch.object(native_backend, 'GROW_HALO_ROWS', 2), \
+             mock.patch.object(native_backend, 'GROW_SEED_CELLS', 40), \
+             mock.patch.object(native_backend, 'block_rows', return_value=5):
+            self.backend.grow('sparse', 'grown_coarse')
+        expected = np.vstack([np.tile([1., 2., 3., 4.], (4, 1)), np.tile([1., 1., 3., 3.], (36, 1))])
+        self.assert_map_equal('grown_coarse', expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.process.plan`."""
+
+import os
+import tomllib
+import tempfile
+import unittest
+
+from jamr.process.plan import (BLOCK_COPIES, Plan, cell_bytes, global_cells, region_cells)
+from jamr.utils.blocks import DEFAULT_BLOCK_CELLS
+from jamr.utils.constants import JULES_SOIL_VARIABLES
+from jamr.utils.utils import CHUNK_CACHE_ROWS
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(__file__), '..', 'jamr', 'config', 'example_config.toml')
+
+# Cells of the 1 degree test region at the nominal ESA CCI and SoilGrids
+# resolutions, and at the target resolutions
+NATIVE_LC_CELLS = 360 * 360
+NATIVE_SOIL_CELLS = 120 * 120
+TARGET_CELLS = 100 * 100
+COARSE_CELLS = 10 * 10
+
+
+class TestPlan(unittest.TestCase):
+    """Tests for the cell, byte and memory estimates of `Plan`."""
+
+    def setUp(self):
+        with open(EXAMPLE_CONFIG, 'rb') as f:
+            self.config = tomllib.load(f)
+        # The input files do not exist, so inputs are sized from their
+        # nominal resolutions
+        directory = tempfile.gettempdir()
+        self.config['landcover']['esa']['data_directory'] = os.path.join(directory, 'jamr_missing')
+        self.config['landfraction']['esa']['data_file'] = os.path.join(directory, 'jamr_missing.tif')
+        self.config['main']['output_directory'] = os.path.join(directory, 'jamr_output')
+        self.config['region'].update({'north': 52, 'south': 51, 'east': 1, 'west': 0, 'target_resolutions': [0.01, 0.1]})
+        self.nhorizons = len(self.config['soil']['soilgrids']['horizons'])
+
+    def steps(self, plan, name, kind):
+        return [step for step in plan.steps if step.name.startswith(name) and step.kind == kind]
+
+    def test_cells(self):
+        self.assertEqual(region_cells(self.config, 0.01), TARGET_CELLS)
+        # Partial cells at the edges are counted
+        self.assertEqual(region_cells(self.config, 0.3), 16)
+        self.assertEqual(global_cells(0.5), 360 * 720)
+        self.assertEqual(cell_bytes('double', fraction=True), 8)
+        self.assertEqual(cell_bytes('float'), 4)
+        self.assertEqual(cell_bytes('compact'), 4)
+        self.assertEqual(cell_bytes('compact', fraction=True), 2)
+
+    def test_compute_steps(self):
+        self.config['storage'] = {'profile': 'compact'}
+        self.config['plan'] = {'calibration': {'native': 1.0}}
+        plan = Plan(self.config)
+
+        land_fraction, = self.steps(plan, 'land_fraction', 'native')
+        self.assertEqual((land_fraction.native_cells, land_fraction.target_cells), (NATIVE_LC_CELLS, TARGET_CELLS))
+        self.assertEqual(land_fraction.disk, 5 * NATIVE_LC_CELLS * 4)
+        self.assertAlmostEqual(land_fraction.seconds, 5 * NATIVE_LC_CELLS / 1e6)
+        self.assertEqual(land_fraction.memory, BLOCK_COPIES * 5 * NATIVE_LC_CELLS * 8)
+
+        # Fractions are stored as 16-bit integers by the compact profile
+        fractions = self.steps(plan, 'frac_Poulter2015FivePFT', 'native')[0]
+        self.assertEqual(fractions.disk, fractions.nmaps * NATIVE_LC_CELLS * 2)
+
+        soil, = self.steps(plan, 'soil_props_Cosby', 'resample')
+        self.assertEqual(soil.nmaps, self.nhorizons * len(JULES_SOIL_VARIABLES))
+        self.assertEqual(soil.native_cells, NATIVE_SOIL_CELLS)
+        self.assertEqual(soil.disk, soil.nmaps * TARGET_CELLS * 4)
+
+        # Every output map is aggregated, holding the coarse grid in memory
+        aggregate, = self.steps(plan, 'aggregate', 'aggregate')
+        self.assertEqual(aggregate.nmaps, 1 + 2 * 9 + self.nhorizons * len(JULES_SOIL_VARIABLES))
+        self.assertEqual((aggregate.native_cells, aggregate.target_cells), (TARGET_CELLS, COARSE_CELLS))
+        self.assertEqual(aggregate.memory, BLOCK_COPIES * 3 * TARGET_CELLS * 8 + COARSE_CELLS * 8)
+
+    def test_write_steps(self):
+        plan = Plan(self.config)
+        fine, coarse = self.steps(plan, 'write jamr_soil_props', 'write')
+        nlayers = self.nhorizons * len(JULES_SOIL_VARIABLES)
+        self.assertEqual((fine.target_cells, coarse.target_cells), (TARGET_CELLS, COARSE_CELLS))
+        # Output is single precision, with a chunk cache of rows of chunks
+        self.assertEqual(fine.disk, nlayers * TARGET_CELLS * 4)
+        cache = nlayers * 64 * 100 * CHUNK_CACHE_ROWS * 4
+        self.assertEqual(fine.memory, BLOCK_COPIES * (nlayers + 1) * TARGET_CELLS * 8 + cache)
+
+    def test_regridded_write_steps(self):
+        self.config['regrid'] = {'crs': 'EPSG:4326', 'geotransform': [0, 0.05, 0, 52, 0, -0.05], 'shape': [20, 30]}
+        plan = Plan(self.config)
+        landfrac = self.steps(plan, 'write jamr_landfrac', 'write')[0]
+        # Regridded output is read from the target grid and accumulated for
+        # every cell of the output grid
+        self.assertEqual((landfrac.native_cells, landfrac.target_cells), (TARGET_CELLS, 600))
+        self.assertEqual(landfrac.disk, 600 * 4)
+        grid_memory = 600 * (2 * 8 + 8 + 1) + 20 * 30 * CHUNK_CACHE_ROWS * 4
+        self.assertEqual(landfrac.memory, BLOCK_COPIES * 2 * TARGET_CELLS * 8 + grid_memory)
+
+    def test_block_memory(self):
+        plan = Plan(self.config)
+        self.assertEqual(plan.block_memory(2, 1000), BLOCK_COPIES * 2000 * 8)
+        self.assertEqual(plan.block_memory(4, 2 ** 30), BLOCK_COPIES * DEFAULT_BLOCK_CELLS * 8)
+
+        self.config['main']['backend'] = 'dask'
+        self.config['dask'] = {'chunk_size': 100, 'num_workers': 4}
+        plan = Plan(self.config)
+        self.assertEqual(plan.block_memory(2, 10 ** 6), BLOCK_COPIES * 2 * 100 ** 2 * 8 * 4)
+
+    def test_peak_memory(self):
+        # Output files are written by nprocs processes at once
+        for nprocs in [1, 3]:
+            self.config['main']['nprocs'] = nprocs
+            plan = Plan(self.config)
+            writes = sorted([step.memory for step in plan.steps if step.kind == 'write'], reverse=True)
+            others = [step.memory for step in plan.steps if step.kind != 'write']
+            self.assertEqual(plan.memory, max(others + [sum(writes[:nprocs])]))
+
+
+if __name__ == '__main__':
+    unittest.main()
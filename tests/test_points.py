@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.process.points`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+
+from rasterio.transform import from_origin
+
+from jamr.process.landcover import (JULES_5PFT_NAMES, JULES_9PFT_NAMES)
+from jamr.process.points import (Site, cosby_soil_props, group_sites, jules_pft_fractions, process_site_group)
+from jamr.utils.constants import (CRITICAL_POINT_SUCTION, WILTING_POINT_SUCTION)
+
+
+def write_raster(filename, arr, res=0.01, dtype='float32', nodata=None):
+    with rasterio.open(
+        filename, 'w', driver='GTiff', height=arr.shape[0], width=arr.shape[1], count=1, dtype=dtype,
+        crs='EPSG:4326', transform=from_origin(0., 1., res, res), nodata=nodata
+    ) as dst:
+        dst.write(arr.astype(dtype), 1)
+    return filename
+
+
+class TestPoints(unittest.TestCase):
+    """Tests for the ancillary data of point sites."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # A 1 degree square at 0.01 degrees: rainfed cropland (class 10) in
+        # the west, grassland (class 130) in the east, and one water cell
+        cols = np.arange(100)[None, :] * np.ones((100, 1))
+        lc = np.where(cols < 50, 10, 130)
+        lc[49, 24] = 210
+        water = (lc == 210)
+        filenames = {
+            'landcover': write_raster(self.path('lc.tif'), lc, dtype='uint8', nodata=0),
+            'waterbodies': write_raster(self.path('wb.tif'), np.where(water, 0, 1), dtype='uint8', nodata=255),
+            'elevation': write_raster(self.path('elev.tif'), np.where(cols < 50, 100., 300.)),
+            'ecoregions': write_raster(self.path('eco.tif'), np.ones((100, 100)), dtype='uint8', nodata=0),
+            'c4_grass_area': write_raster(self.path('c4g.tif'), np.full((100, 100), 20.)),
+            'c4_crop_area': write_raster(self.path('c4c.tif'), np.full((100, 100), 50.)),
+            'clay_content_0_5cm': write_raster(self.path('clay.tif'), np.full((100, 100), 20.)),
+            'sand_content_0_5cm': write_raster(self.path('sand.tif'), np.full((100, 100), 40.))
+        }
+        self.filenames = filenames
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def test_group_sites(self):
+        sites = [Site('a', 0.5, 0.5), Site('b', 1.5, 0.5), Site('c', 0.9, 0.1), Site('d', -0.5, 0.5)]
+        self.assertEqual(sorted(group_sites(sites, 1.0)), [[0, 2], [1], [3]])
+
+    def test_cosby_soil_props(self):
+        props = cosby_soil_props(np.array([20., np.nan]), np.array([40., 40.]))
+        b = 3.10 + 0.157 * 20 - 0.003 * 40
+        psi_m = 0.01 * 10 ** (2.17 - 0.0063 * 20 - 0.0158 * 40)
+        theta_sat = 0.01 * (50.5 - 0.037 * 20 - 0.142 * 40)
+        expected = {
+            'b': b, 'psi_m': psi_m, 'theta_sat': theta_sat,
+            'ksat': 25.4 / 3600 * 10 ** (-0.60 - 0.0064 * 20 + 0.0126 * 40),
+            'theta_crit': theta_sat * (psi_m / CRITICAL_POINT_SUCTION) ** (1 / b),
+            'theta_wilt': theta_sat * (psi_m / WILTING_POINT_SUCTION) ** (1 / b),
+            'theta_res': 0.
+        }
+        for property, value in expected.items():
+            self.assertAlmostEqual(props[property][0], value, places=12, msg=property)
+        self.assertTrue(np.isnan(props['b'][1]))
+
+    def test_jules_pft_fractions(self):
+        names = ['trees_broadleaf_evergreen', 'natural_grass', 'crops', 'bare_soil']
+        pfts = {pft: np.zeros(2) for pft in names}
+        pfts['trees_broadleaf_evergreen'][:] = [0.4, 0.4]
+        pfts['natural_grass'][:] = [0.5, 0.5]
+        pfts['crops'][:] = [0.1, 0.1]
+        for pft in ['trees_broadleaf_deciduous', 'trees_needleleaf_deciduous', 'trees_needleleaf_evergreen',
+                    'shrubs_broadleaf_deciduous', 'shrubs_broadleaf_evergreen', 'shrubs_needleleaf_deciduous',
+                    'shrubs_needleleaf_evergreen', 'urban', 'water', 'bare_soil', 'snow_ice']:
+            pfts.setdefault(pft, np.zeros(2))
+        tropical = np.array([1., 0.])
+        frac = jules_pft_fractions(pfts, np.full(2, 20.), np.full(2, 50.), tropical, 9)
+        frac = dict(zip(JULES_9PFT_NAMES, frac))
+        np.testing.assert_allclose(frac['tree_broadleaf_evergreen_tropical'], [0.4, 0.])
+        np.testing.assert_allclose(frac['tree_broadleaf_evergreen_temperate'], [0., 0.4])
+        np.testing.assert_allclose(frac['c3_grass'], [0.45, 0.45])
+        np.testing.assert_allclose(frac['c4_grass'], [0.15, 0.15])
+        frac = dict(zip(JULES_5PFT_NAMES, jules_pft_fractions(pfts, np.full(2, 20.), np.full(2, 50.), tropical, 5)))
+        np.testing.assert_allclose(frac['tree_broadleaf'], [0.4, 0.4])
+        with self.assertRaises(ValueError):
+            jules_pft_fractions(pfts, np.full(2, 20.), np.full(2, 50.), tropical, 7)
+
+    def test_process_site_group(self):
+        # Site a is cropland with one water cell; site b is half cropland,
+        # half grassland (60% natural grass, 40% bare soil)
+        sites = [Site('a', 0.5, 0.25), Site('b', 0.5, 0.5)]
+        (land_frac_a, frac_a, surf_hgt_a, soil_a), (land_frac_b, frac_b, surf_hgt_b, soil_b) = process_site_group(
+            self.filenames, ['0_5cm'], sites, 0.04, [5]
+        )
+        self.assertAlmostEqual(land_frac_a, 15 / 16)
+        self.assertAlmostEqual(land_frac_b, 1.)
+
+        frac_a, frac_b = dict(zip(JULES_5PFT_NAMES, frac_a[5])), dict(zip(JULES_5PFT_NAMES, frac_b[5]))
+        surf_hgt_a, surf_hgt_b = dict(zip(JULES_5PFT_NAMES, surf_hgt_a[5])), dict(zip(JULES_5PFT_NAMES, surf_hgt_b[5]))
+        self.assertAlmostEqual(frac_a['c3_grass'], 0.5)
+        self.assertAlmostEqual(frac_a['c4_grass'], 0.5)
+        self.assertAlmostEqual(surf_hgt_a['c3_grass'], 100.)
+        self.assertTrue(np.isnan(surf_hgt_a['bare_soil']))
+        self.assertAlmostEqual(frac_b['c3_grass'], 0.5 * 0.5 + 0.5 * 0.6 * 0.8)
+        self.assertAlmostEqual(frac_b['c4_grass'], 0.5 * 0.5 + 0.5 * 0.6 * 0.2)
+        self.assertAlmostEqual(frac_b['bare_soil'], 0.5 * 0.4)
+        self.assertAlmostEqual(surf_hgt_b['c3_grass'], (0.5 * 100 + 0.48 * 300) / 0.98)
+        self.assertAlmostEqual(surf_hgt_b['bare_soil'], 300.)
+        self.assertAlmostEqual(sum(frac_b.values()), 1.)
+
+        props = cosby_soil_props(np.array(20.), np.array(40.))
+        for property, values in soil_a.items():
+            np.testing.assert_allclose(values, [props[property]], err_msg=property)
+            np.testing.assert_allclose(soil_b[property], values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.input.preflight`."""
+
+import os
+import shutil
+import tomllib
+import zipfile
+import tempfile
+import unittest
+
+import numpy as np
+import netCDF4
+import rasterio
+
+from rasterio.transform import from_origin
+
+from jamr.input.preflight import (
+    C4_FRACTION_DIMENSIONS, C4_FRACTION_VARIABLES, ESA_CCI_LC_RES, ESA_CCI_WB_RES, MERIT_DEM_RES,
+    TEOW_SHAPEFILE, check_c4_fraction, check_ecoregions, check_raster, preflight
+)
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(__file__), '..', 'jamr', 'config', 'example_config.toml')
+
+# The region checked by the tests, as (west, south, east, north)
+REGION_BOUNDS = (0, 51, 1, 52)
+
+
+def write_raster(filename, res, bounds=REGION_BOUNDS, dtype='uint8', count=1, crs='EPSG:4326'):
+    west, south, east, north = bounds
+    height, width = int(round((north - south) / res)), int(round((east - west) / res))
+    with rasterio.open(
+        filename, 'w', driver='GTiff', height=height, width=width, count=count, dtype=dtype,
+        crs=crs, transform=from_origin(west, north, res, res)
+    ) as dst:
+        dst.write(np.ones((count, height, width), dtype=dtype))
+    return filename
+
+
+def write_c4_fraction(filename, variables=C4_FRACTION_VARIABLES, dimensions=C4_FRACTION_DIMENSIONS):
+    with netCDF4.Dataset(filename, 'w') as nc:
+        for dimension in ['years', 'lat', 'lon']:
+            nc.createDimension(dimension, 2)
+        for variable in variables:
+            nc.createVariable(variable, 'f4', dimensions)
+    return filename
+
+
+def write_ecoregions(filename, member=TEOW_SHAPEFILE):
+    with zipfile.ZipFile(filename, 'w') as f:
+        f.writestr(member, b'')
+    return filename
+
+
+class TestPreflight(unittest.TestCase):
+    """Tests for the checks of the input files made before a run."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def test_check_raster(self):
+        filename = write_raster(self.path('lc.tif'), ESA_CCI_LC_RES)
+        self.assertEqual(check_raster('LC', filename, REGION_BOUNDS, ['uint8'], res=ESA_CCI_LC_RES), [])
+        # Resolution is checked to within 0.1%
+        self.assertEqual(check_raster('LC', filename, REGION_BOUNDS, ['uint8'], res=ESA_CCI_LC_RES * 1.0005), [])
+
+        problems = check_raster('LC', filename, REGION_BOUNDS, ['int16'], res=ESA_CCI_WB_RES)
+        self.assertEqual(len(problems), 2)
+        self.assertIn('band type uint8', problems[0])
+        self.assertIn('resolution', problems[1])
+
+        filename = write_raster(self.path('multiband.tif'), 0.1, count=2)
+        problems = check_raster('LC', filename, REGION_BOUNDS, ['uint8'])
+        self.assertEqual(len(problems), 1)
+        self.assertIn('2 bands', problems[0])
+
+    def test_check_raster_coverage(self):
+        # Half a cell of tolerance is allowed at each edge
+        filename = write_raster(self.path('lc.tif'), 0.1, bounds=(0.05, 51, 1, 52))
+        self.assertEqual(check_raster('LC', filename, REGION_BOUNDS, ['uint8']), [])
+
+        filename = write_raster(self.path('lc_west.tif'), 0.1, bounds=(0, 51, 0.5, 52))
+        problems = check_raster('LC', filename, REGION_BOUNDS, ['uint8'])
+        self.assertEqual(len(problems), 1)
+        self.assertIn('does not cover', problems[0])
+        self.assertEqual(check_raster('LC', filename, REGION_BOUNDS, ['uint8'], coverage=False), [])
+
+    def test_check_raster_projected(self):
+        # Files in projected coordinates are checked against the projected
+        # resolution, and cover the region once it is transformed
+        bounds = (-1000, 6.6e6, 119000, 6.9e6)
+        filename = write_raster(self.path('soil.tif'), 1000, bounds=bounds, dtype='int16', crs='EPSG:3857')
+        self.assertEqual(
+            check_raster('Soil', filename, REGION_BOUNDS, ['int16'], res=1 / 120., projected_res=1000.), []
+        )
+        problems = check_raster('Soil', filename, REGION_BOUNDS, ['int16'], res=1000., projected_res=250.)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('not 250', problems[0])
+
+        filename = write_raster(self.path('soil_south.tif'), 1000, bounds=(-1000, 6.5e6, 119000, 6.7e6),
+                                dtype='int16', crs='EPSG:3857')
+        problems = check_raster('Soil', filename, REGION_BOUNDS, ['int16'], projected_res=1000.)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('does not cover', problems[0])
+
+    def test_check_raster_unreadable(self):
+        problems = check_raster('LC', self.path('missing.tif'), REGION_BOUNDS, ['uint8'])
+        self.assertEqual(len(problems), 1)
+        self.assertIn('does not exist', problems[0])
+
+        with open(self.path('truncated.tif'), 'wb') as f:
+            f.write(b'II*\x00garbage')
+        problems = check_raster('LC', self.path('truncated.tif'), REGION_BOUNDS, ['uint8'])
+        self.assertEqual(len(problems), 1)
+        self.assertIn('could not be read', problems[0])
+
+    def test_check_c4_fraction(self):
+        self.assertEqual(check_c4_fraction(write_c4_fraction(self.path('c4.nc'))), [])
+
+        filename = write_c4_fraction(self.path('c4_grass.nc'), variables=['C4_area', 'C4_grass_area'])
+        self.assertEqual(check_c4_fraction(filename), [f'C4 fraction: {filename} has no variable C4_crop_area'])
+
+        filename = write_c4_fraction(self.path('c4_dims.nc'), dimensions=('lat', 'lon'))
+        problems = check_c4_fraction(filename)
+        self.assertEqual(len(problems), len(C4_FRACTION_VARIABLES))
+        self.assertIn('has dimensions', problems[0])
+
+        with open(self.path('c4.txt'), 'w') as f:
+            f.write('not netCDF')
+        problems = check_c4_fraction(self.path('c4.txt'))
+        self.assertEqual(len(problems), 1)
+        self.assertIn('could not be read', problems[0])
+        self.assertIn('does not exist', check_c4_fraction(self.path('missing.nc'))[0])
+
+    def test_check_ecoregions(self):
+        self.assertEqual(check_ecoregions(write_ecoregions(self.path('teow.zip'))), [])
+        filename = write_ecoregions(self.path('other.zip'), member='other.shp')
+        self.assertIn(f'does not contain {TEOW_SHAPEFILE}', check_ecoregions(filename)[0])
+        with open(self.path('teow.txt'), 'w') as f:
+            f.write('not a zip archive')
+        self.assertIn('is not a zip archive', check_ecoregions(self.path('teow.txt'))[0])
+        self.assertIn('does not exist', check_ecoregions(self.path('missing.zip'))[0])
+
+    def test_preflight(self):
+        with open(EXAMPLE_CONFIG, 'rb') as f:
+            config = tomllib.load(f)
+        west, south, east, north = REGION_BOUNDS
+        config['region'].update({'north': north, 'south': south, 'east': east, 'west': west})
+        config['main'].update({'data_directory': self.directory, 'scratch_directory': self.directory})
+        config['landcover']['esa'].update({'data_directory': self.directory, 'start_year': 2015, 'end_year': 2015})
+        config['landfraction']['esa']['data_file'] = self.path('wb.tif')
+        config['topography']['merit']['data_directory'] = self.path('merit')
+        config['landcover']['c4']['data_file'] = self.path('c4.nc')
+        config['landcover']['teow']['data_file'] = self.path('teow.zip')
+        config['soil']['soilgrids'].update({
+            'data_directory': self.directory, 'variables': ['clay_content'], 'horizons': ['0-5cm']
+        })
+
+        # All inputs are missing
+        problems = preflight(config)
+        self.assertEqual(len(problems), 6)
+        self.assertIn('MERIT DEM: no tiles found', problems[3])
+
+        write_raster(self.path('ESACCI-LC-L4-LCCS-Map-300m-P1Y-2015-v2.0.7.tif'), ESA_CCI_LC_RES)
+        write_raster(self.path('wb.tif'), ESA_CCI_WB_RES)
+        write_raster(self.path('clay_0-5cm_mean_1000.tif'), 1 / 120., dtype='int16')
+        # MERIT tiles need not cover the region
+        os.mkdir(self.path('merit'))
+        write_raster(self.path('merit/n50e000_dem.tif'), MERIT_DEM_RES, bounds=(0, 51, 0.01, 51.01), dtype='float32')
+        write_c4_fraction(self.path('c4.nc'))
+        write_ecoregions(self.path('teow.zip'))
+        self.assertEqual(preflight(config), [])
+
+        # Tiles outside the region are not checked
+        write_raster(self.path('merit/n40e000_dem.tif'), 0.1, bounds=(0, 40, 1, 41))
+        self.assertEqual(preflight(config), [])
+        write_raster(self.path('merit/n50e000_dem.tif'), 0.1, bounds=(0, 51, 1, 52))
+        problems = preflight(config)
+        self.assertEqual(len(problems), 2)
+        self.assertTrue(all(problem.startswith('MERIT DEM') for problem in problems))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Tests for `jamr.utils.regrid`."""
+
+import unittest
+
+import numpy as np
+
+from jamr.utils.regrid import (Regridder, TargetGrid, compute_weights, default_supersample)
+
+# A 0.05 degree source grid
+SRC_RGN = {'n': 52., 's': 50., 'e': 1., 'w': -1., 'nsres': 0.05, 'ewres': 0.05}
+SRC_SHAPE = (40, 40)
+
+
+def cell_areas(rgn, shape):
+    # Areas of the cells of a lat/lon grid on the unit sphere, per radian of
+    # longitude
+    lat = np.radians(rgn['n'] - np.arange(shape[0] + 1) * rgn['nsres'])
+    return np.broadcast_to((np.sin(lat[:-1]) - np.sin(lat[1:]))[:, None], shape)
+
+
+def block_mean(values, weights, factor):
+    nrows, ncols = values.shape
+    shape = (nrows // factor, factor, ncols // factor, factor)
+    return (values * weights).reshape(shape).sum(axis=(1, 3)) / weights.reshape(shape).sum(axis=(1, 3))
+
+
+class TestRegrid(unittest.TestCase):
+    """Tests for the regridding weights and `Regridder`."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.random(SRC_SHAPE)
+        # An aligned 0.5 degree grid, and one which is offset from the source
+        # grid and extends beyond it
+        self.aligned = TargetGrid('EPSG:4326', (-1., 0.5, 0., 52., 0., -0.5), (4, 4))
+        self.offset = TargetGrid('EPSG:4326', (-1.23, 0.3, 0., 52.11, 0., -0.3), (8, 8))
+
+    def test_weights_sum_to_one(self):
+        for grid in [self.aligned, self.offset]:
+            for supersample in [1, 3]:
+                targets, sources, weights = compute_weights(SRC_RGN, grid, supersample)
+                total = np.bincount(targets, weights=weights, minlength=grid.shape[0] * grid.shape[1])
+                covered = np.bincount(targets, minlength=total.size) > 0
+                np.testing.assert_allclose(total[covered], 1.)
+                self.assertTrue(np.all(np.diff(sources) >= 0))
+
+    def test_every_source_cell_contributes(self):
+        # The offset grid covers the whole source grid, so every source cell
+        # is shared out, however coarse the target cells are
+        targets, sources, weights = compute_weights(SRC_RGN, self.offset, 1)
+        np.testing.assert_array_equal(np.unique(sources), np.arange(SRC_SHAPE[0] * SRC_SHAPE[1]))
+
+    def test_default_supersample(self):
+        self.assertEqual(default_supersample(SRC_RGN, self.aligned), 1)
+        fine = TargetGrid('EPSG:4326', (-1., 0.025, 0., 52., 0., -0.025), (80, 80))
+        self.assertEqual(default_supersample(SRC_RGN, fine), 8)
+
+    def test_aligned_block_mean(self):
+        regridder = Regridder(SRC_RGN, self.aligned)
+        mean, = regridder.regrid([(0, 40, self.values)])
+        expected = block_mean(self.values, cell_areas(SRC_RGN, SRC_SHAPE), 10)
+        np.testing.assert_allclose(mean, expected, rtol=1e-12)
+        self.assertFalse(np.ma.getmaskarray(mean).any())
+
+    def test_blocks_and_weights(self):
+        # Regridding in blocks, with masked cells and weights given by the
+        # product of other arrays, matches regridding the whole grid at once
+        rng = np.random.default_rng(1)
+        values = np.ma.array(rng.random((2,) + SRC_SHAPE), mask=rng.random((2,) + SRC_SHAPE) < 0.2)
+        frac = rng.random((2,) + SRC_SHAPE)
+        land_frac = rng.random((1,) + SRC_SHAPE)
+        regridder = Regridder(SRC_RGN, self.aligned)
+        blocks = [
+            (start, min(start + 7, 40), values[:, start:(start + 7)], frac[:, start:(start + 7)], land_frac[:, start:(start + 7)])
+            for start in range(0, 40, 7)
+        ]
+        mean, _, _ = regridder.regrid(blocks, weighted_by={0: [1, 2]})
+
+        weights = np.where(np.ma.getmaskarray(values), 0., frac * land_frac) * cell_areas(SRC_RGN, SRC_SHAPE)
+        for k in range(2):
+            expected = block_mean(values.filled(0.)[k], weights[k], 10)
+            np.testing.assert_allclose(mean[k], expected, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()